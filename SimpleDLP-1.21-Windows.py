@@ -5,11 +5,14 @@ import threading
 import shutil
 import urllib.request
 import json
+import time
+import queue
 from datetime import datetime
 
 THEME = "blue"
 APPEARANCE_MODE = "System"
 LANG = "RU"
+UI_PUMP_INTERVAL = 50
 
 def check_and_install_packages():
     try:
@@ -35,6 +38,69 @@ def ensure_tools(bin_dir, ytdlp_path, ffmpeg_path):
         )
     )
 
+PROGRESS_MARKER = "[simpledlp-progress]"
+PROGRESS_TEMPLATE = (
+    "download:" + PROGRESS_MARKER +
+    " %(progress.downloaded_bytes)s %(progress.total_bytes)s %(progress.total_bytes_estimate)s"
+    " %(progress.speed)s %(progress.eta)s %(progress.fragment_index)s %(progress.fragment_count)s"
+)
+
+def _progress_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def parse_progress_line(line):
+    if not line.startswith(PROGRESS_MARKER):
+        return None
+    fields = line[len(PROGRESS_MARKER):].split()
+    if len(fields) != 7:
+        return None
+    downloaded, total, estimate, speed, eta, fragment, fragment_count = (_progress_number(v) for v in fields)
+    total = total or estimate
+    if downloaded is not None and total:
+        fraction = min(downloaded / total, 1.0)
+    elif fragment is not None and fragment_count:
+        fraction = min(fragment / fragment_count, 1.0)
+    else:
+        fraction = None
+    return {"downloaded": downloaded, "total": total, "speed": speed, "eta": eta,
+            "fragment": fragment, "fragment_count": fragment_count, "fraction": fraction}
+
+def format_progress(progress):
+    parts = []
+    if progress["fraction"] is not None:
+        parts.append(f"{progress['fraction'] * 100:.1f}%")
+    if progress["speed"]:
+        parts.append(f"{progress['speed'] / 1048576:.2f} MiB/s")
+    if progress["eta"] is not None:
+        minutes, seconds = divmod(int(progress["eta"]), 60)
+        parts.append(f"ETA {minutes}:{seconds:02d}")
+    if progress["fragment"] is not None and progress["fragment_count"]:
+        parts.append(f"frag {int(progress['fragment'])}/{int(progress['fragment_count'])}")
+    return " ".join(parts)
+
+INFO_CACHE_TTL = 60 * 60
+
+def format_table(info):
+    rows = [("ID", "EXT", "RESOLUTION", "FPS", "VCODEC", "ACODEC", "SIZE", "NOTE")]
+    for f in info.get("formats") or []:
+        size = f.get("filesize") or f.get("filesize_approx")
+        fps = f.get("fps")
+        rows.append((
+            str(f.get("format_id", "")),
+            str(f.get("ext", "")),
+            str(f.get("resolution") or ("audio only" if f.get("vcodec") == "none" else "")),
+            str(int(fps)) if fps else "",
+            str(f.get("vcodec") or ""),
+            str(f.get("acodec") or ""),
+            f"{size / 1048576:.1f} MiB" if size else "",
+            str(f.get("format_note") or ""),
+        ))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows)
+
 CONFIG_PATH = None
 
 def load_settings():
@@ -88,6 +154,21 @@ def main():
 
     current_process = None
     download_log = []
+    info_cache = {}
+    # Tkinter не потокобезопасен: рабочие потоки только ставят вызовы в очередь, окно выполняет их по таймеру
+    ui_calls = queue.SimpleQueue()
+
+    def run_on_ui(func, *args):
+        ui_calls.put((func, args))
+
+    def pump_ui():
+        while True:
+            try:
+                func, args = ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            func(*args)
+        app.after(UI_PUMP_INTERVAL, pump_ui)
 
     def ensure_dependencies():
         missing_files = []
@@ -99,11 +180,18 @@ def main():
         return True
 
     def append_text(text):
+        # Можно вызывать из любого потока
+        download_log.append(f"{datetime.now().strftime('%H:%M:%S')}: {text}")
+        run_on_ui(insert_text, text)
+
+    def insert_text(text):
         app.output_text.configure(state="normal")
         app.output_text.insert("end", text + "\n")
         app.output_text.see("end")
         app.output_text.configure(state="disabled")
-        download_log.append(f"{datetime.now().strftime('%H:%M:%S')}: {text}")
+
+    def set_stop_enabled(enabled):
+        app.stop_button.configure(state="normal" if enabled else "disabled")
 
     def save_log():
         fname = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")])
@@ -113,10 +201,7 @@ def main():
             append_text("Log saved.")
 
     def start_stream():
-        threading.Thread(target=_start_stream_task, daemon=True).start()
-
-    def _start_stream_task():
-        nonlocal current_process
+        # Проверки и значения полей - здесь, в потоке окна; рабочий поток виджеты не трогает
         if not ensure_dependencies():
             append_text("Missing dependencies for streams")
             return
@@ -124,68 +209,61 @@ def main():
         if not stream_url:
             append_text("Enter stream URL")
             return
-        append_text(f"Starting stream recording: {stream_url}")
         app.stop_button.configure(state="normal")
+        threading.Thread(target=_start_stream_task, args=(stream_url,), daemon=True).start()
+
+    def _start_stream_task(stream_url):
+        nonlocal current_process
+        append_text(f"Starting stream recording: {stream_url}")
         vods_dir = os.path.join(SCRIPTDIR, "vods")
         os.makedirs(vods_dir, exist_ok=True)
         cmd = f'"{STREAMLINKPATH}" --hls-live-restart "{stream_url}" best -O | "{FFMPEGPATH}" -i - -c copy "{os.path.join(vods_dir, "stream.mp4")}"'
-        current_process = subprocess.Popen(cmd, shell=True)
+        process = current_process = subprocess.Popen(cmd, shell=True)
         append_text("Stream capture started.")
-        current_process.wait()
+        process.wait()
         append_text("Stream capture finished.")
-        app.stop_button.configure(state="disabled")
-        messagebox.showinfo("Stream finished", "Stream recording finished.")
+        finish_task(process, "Stream recording finished.")
 
     def start_video_download_thread():
-        chosen_quality = app.quality_var.get()
-        chosen_audio = app.audio_var.get()
-        threading.Thread(target=_start_video_download_task, args=(chosen_quality, chosen_audio), daemon=True).start()
-
-    def _start_video_download_task(chosen_quality, chosen_audio):
-        nonlocal current_process
         if not ensure_dependencies():
             append_text("Missing dependencies for video")
             return
-        videos_dir = os.path.join(SCRIPTDIR, "videos")
-        os.makedirs(videos_dir, exist_ok=True)
         video_url = app.video_url_entry.get().strip()
         if not video_url:
             append_text("Enter video URL")
             return
         cookies_path = app.cookies_path_entry.get().strip()
-        append_text(f"Starting video download: {video_url}")
+        chosen_quality = app.quality_var.get()
+        chosen_audio = app.audio_var.get()
         app.stop_button.configure(state="normal")
+        threading.Thread(target=_start_video_download_task,
+                         args=(video_url, cookies_path, chosen_quality, chosen_audio), daemon=True).start()
 
-        if chosen_quality == "best":
-            cmd_parts = [
-                f'"{YTDLPPATH}"',
-                '--ffmpeg-location',
-                f'"{os.path.dirname(FFMPEGPATH)}"',
-                '--merge-output-format',
-                'mp4',
-                '-o',
-                f'"{os.path.join(videos_dir, "%(title)s.%(ext)s")}"',
-                f'"{video_url}"'
-            ]
-        else:
-            cmd_parts = [
-                f'"{YTDLPPATH}"',
-                '--ffmpeg-location',
-                f'"{os.path.dirname(FFMPEGPATH)}"',
-                '-f',
-                chosen_quality,
-                '--merge-output-format',
-                'mp4',
-                '-o',
-                f'"{os.path.join(videos_dir, "%(title)s.%(ext)s")}"',
-                f'"{video_url}"'
-            ]
+    def _start_video_download_task(video_url, cookies_path, chosen_quality, chosen_audio):
+        nonlocal current_process
+        videos_dir = os.path.join(SCRIPTDIR, "videos")
+        os.makedirs(videos_dir, exist_ok=True)
+        append_text(f"Starting video download: {video_url}")
 
         if chosen_audio:
-            cmd_parts.insert(3, '-f')
-            cmd_parts.insert(4, 'bestaudio')
-            cmd_parts.insert(5, '--merge-output-format')
-            cmd_parts.insert(6, 'mp3')
+            # Один -f и настоящее извлечение аудио: --merge-output-format действует только при слиянии видео и аудио
+            format_args = ['-f', 'bestaudio', '-x', '--audio-format', 'mp3', '--audio-quality', '0']
+        elif chosen_quality == "best":
+            format_args = ['--merge-output-format', 'mp4']
+        else:
+            format_args = ['-f', chosen_quality, '--merge-output-format', 'mp4']
+        cmd_parts = [
+            f'"{YTDLPPATH}"',
+            '--ffmpeg-location',
+            f'"{os.path.dirname(FFMPEGPATH)}"',
+        ] + format_args + [
+            '-o',
+            f'"{os.path.join(videos_dir, "%(title)s.%(ext)s")}"',
+            '--newline',
+            '--progress-template',
+            f'"{PROGRESS_TEMPLATE}"',
+            f'"{video_url}"'
+        ]
 
         if cookies_path:
             cmd_parts.insert(1, f'--cookies "{cookies_path}"')
@@ -193,36 +271,82 @@ def main():
         cmd = " ".join(cmd_parts)
         append_text(f"Command: {cmd}")
 
-        current_process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = current_process.communicate()
-        append_text(stdout.decode(errors='ignore'))
-        if stderr:
-            append_text(stderr.decode(errors='ignore'))
-
-        app.stop_button.configure(state="disabled")
-
-        if current_process.returncode == 0:
+        run_on_ui(app.progress_bar.set, 0)
+        # Своя ссылка на процесс: "Остановить" обнуляет current_process, пока этот поток еще читает вывод
+        process = current_process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
+                                                     stderr=subprocess.STDOUT, text=True, encoding="utf-8",
+                                                     errors="replace", bufsize=1)
+        # Читаем вывод построчно, чтобы не держать весь лог загрузки в памяти
+        for line in process.stdout:
+            line = line.rstrip()
+            if not line:
+                continue
+            progress = parse_progress_line(line)
+            if progress is None:
+                append_text(line)
+                continue
+            if progress["fraction"] is not None:
+                run_on_ui(app.progress_bar.set, progress["fraction"])
+            run_on_ui(set_progress_text, format_progress(progress))
+        process.stdout.close()
+        process.wait()
+
+        if process.returncode == 0:
             append_text("Video download finished successfully.")
-            messagebox.showinfo("Download complete", "Video has been downloaded successfully.")
+            finish_task(process, "Download complete.")
         else:
             append_text("Video download failed. Check logs for details.")
-            messagebox.showerror("Download failed", "See logs for error details.")
+            finish_task(process, "Download failed, see log.")
 
-        current_process = None
+    def finish_task(process, status):
+        # Итог - в строке состояния и в логе, без модального окна, которое держит очередь окна до нажатия OK
+        nonlocal current_process
+        if current_process is process:
+            current_process = None
+        run_on_ui(set_stop_enabled, False)
+        run_on_ui(set_progress_text, status)
+
+    def set_progress_text(text):
+        app.progress_label.configure(text=text)
 
     def stop_download():
         nonlocal current_process
-        if current_process and current_process.poll() is None:
-            try:
-                subprocess.call(['taskkill', '/F', '/T', '/PID', str(current_process.pid)])
-                append_text("Download stopped.")
-            except Exception as e:
-                append_text(f"Error stopping process: {e}")
+        process = current_process
+        if process and process.poll() is None:
+            append_text("Stopping...")
+            # taskkill ждет завершения всего дерева процессов - не в потоке окна
+            threading.Thread(target=kill_process, args=(process,), daemon=True).start()
         else:
             append_text("No active download process.")
         app.stop_button.configure(state="disabled")
         current_process = None
 
+    def kill_process(process):
+        try:
+            subprocess.call(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+            append_text("Download stopped.")
+        except Exception as e:
+            append_text(f"Error stopping process: {e}")
+
+    def fetch_formats(url, cookies_path):
+        # yt-dlp -J один раз на ссылку, повторный просмотр берется из кэша.
+        # Вызывается из потока: путь к cookies читается из поля заранее, в потоке окна
+        cached = info_cache.get(url)
+        if cached and time.time() - cached[0] < INFO_CACHE_TTL:
+            return cached[1]
+        # '--': ссылка, начинающаяся с '-', не должна стать опцией yt-dlp
+        cmd = [YTDLPPATH, "-J", "--no-playlist", "--", url]
+        if cookies_path:
+            cmd[1:1] = ["--cookies", cookies_path]
+        result = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8", errors="replace",
+                                creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"yt-dlp exit code {result.returncode}")
+        info = json.loads(result.stdout)
+        info_cache[url] = (time.time(), info)
+        return info
+
     def browse_cookies():
         path = filedialog.askopenfilename(title="Select cookies.txt", filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
         if path:
@@ -374,6 +498,12 @@ def main():
             self.save_log_button = customtkinter.CTkButton(button_frame, command=save_log)
             self.save_log_button.grid(row=2, column=0, columnspan=4, padx=10, pady=6, sticky="ew")
 
+            self.progress_bar = customtkinter.CTkProgressBar(button_frame)
+            self.progress_bar.set(0)
+            self.progress_bar.grid(row=3, column=0, columnspan=3, padx=10, pady=6, sticky="ew")
+            self.progress_label = customtkinter.CTkLabel(button_frame, text="")
+            self.progress_label.grid(row=3, column=3, padx=10, pady=6, sticky="w")
+
             self.output_text = customtkinter.CTkTextbox(self, state="disabled")
             self.output_text.grid(row=4, column=0, padx=20, pady=(0,10), sticky="nsew")
 
@@ -383,8 +513,33 @@ def main():
             self.change_language(LANG)
 
         def show_formats(self, url):
-            # Добавьте реализацию если нужно
-            pass
+            if not url:
+                append_text("Enter video URL")
+                return
+            if not ensure_dependencies():
+                return
+            append_text(f"Fetching formats: {url}")
+            cookies_path = self.cookies_path_entry.get().strip()
+
+            def worker():
+                try:
+                    info = fetch_formats(url, cookies_path)
+                except Exception as e:
+                    append_text(f"Failed to fetch formats: {e}")
+                    return
+                run_on_ui(self.show_format_table, info)
+            threading.Thread(target=worker, daemon=True).start()
+
+        def show_format_table(self, info):
+            dialog = customtkinter.CTkToplevel(self)
+            dialog.title(f'Formats: {info.get("title", "")}')
+            dialog.geometry("900x480")
+            dialog.grid_columnconfigure(0, weight=1)
+            dialog.grid_rowconfigure(0, weight=1)
+            table = customtkinter.CTkTextbox(dialog, font=customtkinter.CTkFont(family="Courier New", size=12), wrap="none")
+            table.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
+            table.insert("end", format_table(info))
+            table.configure(state="disabled")
 
         def change_language(self, choice):
             global LANG
@@ -421,6 +576,7 @@ def main():
         app.destroy()
 
     app.protocol("WM_DELETE_WINDOW", on_closing)
+    app.after(UI_PUMP_INTERVAL, pump_ui)
     app.mainloop()
 
 if __name__ == "__main__":
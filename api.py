@@ -0,0 +1,226 @@
+import asyncio
+import json
+import queue
+import threading
+
+from engine import progress_fraction, format_progress, is_http_url, DEFAULT_QUALITY
+
+API_HOST = "127.0.0.1"
+API_MAX_BODY = 1024 * 1024
+API_EVENT_BACKLOG = 1000
+API_KEEPALIVE = 15
+
+HTTP_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+                405: "Method Not Allowed", 415: "Unsupported Media Type"}
+
+def job_to_dict(job):
+    data = {
+        "id": job.id,
+        "kind": job.kind,
+        "url": job.url,
+        "state": job.state,
+        "returncode": job.returncode,
+        "error": job.error,
+        "progress": None,
+        "metrics": job.metrics.as_dict(),
+    }
+    if job.progress is not None:
+        data["progress"] = dict(job.progress._asdict(), fraction=progress_fraction(job.progress),
+                                text=format_progress(job.progress))
+    return data
+
+class ApiServer:
+    # Локальный HTTP API: задачи принимаются сразу, а в Engine их передает отдельный поток
+    def __init__(self, engine, port, host=API_HOST):
+        self.engine = engine
+        self.port = port
+        self.host = host
+        self.loop = None
+        self.server = None
+        self._subscribers = set()
+        self._commands = queue.SimpleQueue()
+        engine.add_listener(self._job_updated)
+
+    def start(self):
+        threading.Thread(target=self._run_commands, daemon=True).start()
+        started = threading.Event()
+        threading.Thread(target=self._serve, args=(started,), daemon=True).start()
+        started.wait()
+        return self.server is not None
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def _serve(self, started):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port))
+        except OSError as e:
+            self.engine.log(f"Не удалось запустить API на {self.host}:{self.port}: {e}")
+            self.loop = None
+            started.set()
+            return
+        self.engine.log(f"API запущен: http://{self.host}:{self.port}/jobs")
+        started.set()
+        self.loop.run_forever()
+
+    def _run_commands(self):
+        # Проверка архива, кэш и taskkill на Windows блокируют - держим их вне цикла событий
+        while True:
+            command, args = self._commands.get()
+            try:
+                command(*args)
+            except Exception as e:
+                self.engine.log(f"Ошибка API: {e}")
+
+    def _job_updated(self, job):
+        loop = self.loop
+        if loop is not None and self._subscribers:
+            loop.call_soon_threadsafe(self._publish, job_to_dict(job))
+
+    def _publish(self, data):
+        for events in list(self._subscribers):
+            try:
+                events.put_nowait(data)
+            except asyncio.QueueFull:
+                # Медленный клиент теряет промежуточный прогресс, но не тормозит остальных
+                pass
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            method, path, headers, body = request
+            if headers.get("host", "").lower() not in (f"127.0.0.1:{self.port}", f"localhost:{self.port}"):
+                # DNS rebinding: чужой домен, указывающий на 127.0.0.1, приходит со своим Host
+                await self._respond(writer, 403, {"error": "неверный Host"})
+                return
+            if method == "GET" and path == "/events":
+                await self._stream_events(writer)
+                return
+            if method == "GET" and path == "/metrics":
+                await self._respond_text(writer, self.engine.prometheus_metrics())
+                return
+            content_type = headers.get("content-type", "")
+            if method == "POST" and content_type.split(";", 1)[0].strip().lower() != "application/json":
+                # Страница в браузере может отправить без preflight только text/plain и формы:
+                # application/json отсекает такие запросы с чужих сайтов к локальному API
+                await self._respond(writer, 415, {"error": "нужен Content-Type: application/json"})
+                return
+            status, data = self._route(method, path, body)
+            await self._respond(writer, status, data)
+        except ValueError as e:
+            await self._respond(writer, 400, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        parts = line.decode("latin-1").split()
+        if len(parts) < 2:
+            return None
+        method, path = parts[0].upper(), parts[1].split("?", 1)[0]
+        headers = {}
+        while True:
+            header = (await reader.readline()).decode("latin-1").strip()
+            if not header:
+                break
+            name, _, value = header.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > API_MAX_BODY:
+            raise ValueError("слишком большой запрос")
+        body = await reader.readexactly(length) if length else b""
+        return method, path, headers, body
+
+    async def _respond(self, writer, status, data):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        writer.write((f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                      "Content-Type: application/json; charset=utf-8\r\n"
+                      f"Content-Length: {len(payload)}\r\n"
+                      "Connection: close\r\n\r\n").encode("latin-1") + payload)
+        await writer.drain()
+
+    async def _respond_text(self, writer, text):
+        payload = text.encode("utf-8")
+        writer.write(("HTTP/1.1 200 OK\r\n"
+                      "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                      f"Content-Length: {len(payload)}\r\n"
+                      "Connection: close\r\n\r\n").encode("latin-1") + payload)
+        await writer.drain()
+
+    def _route(self, method, path, body):
+        parts = [part for part in path.split("/") if part]
+        if not parts or parts[0] != "jobs" or len(parts) > 2:
+            return 404, {"error": "not found"}
+        if len(parts) == 1:
+            if method == "GET":
+                return 200, [job_to_dict(job) for job in self.engine.jobs()]
+            if method == "POST":
+                return self._submit(body)
+            return 405, {"error": "method not allowed"}
+        try:
+            job = self.engine.find_job(int(parts[1]))
+        except ValueError:
+            job = None
+        if job is None:
+            return 404, {"error": "job not found"}
+        if method == "GET":
+            return 200, job_to_dict(job)
+        if method == "DELETE":
+            self._commands.put((self.engine.stop, (job,)))
+            return 202, {"id": job.id, "state": "stopping"}
+        return 405, {"error": "method not allowed"}
+
+    def _submit(self, body):
+        try:
+            request = json.loads(body or b"{}")
+            urls = request.get("urls") or [request["url"]]
+            if isinstance(urls, str):
+                urls = [urls]
+            kind = request.get("kind", "video")
+            quality = request.get("format", DEFAULT_QUALITY)
+            if not (isinstance(urls, list) and all(isinstance(url, str) for url in urls)):
+                raise TypeError("urls")
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return 400, {"error": 'ожидается JSON {"urls": [...]} или {"url": "..."}'}
+        if not (isinstance(quality, str) and quality):
+            return 400, {"error": "format - непустая строка"}
+        if request.get("cookies"):
+            return 400, {"error": "cookies из запроса не принимаются, файл задается настройкой API_COOKIES"}
+        bad = [url for url in urls if not is_http_url(url)]
+        if bad:
+            return 400, {"error": f"нужны ссылки http(s): {', '.join(bad)}"}
+        if kind == "stream":
+            for url in urls:
+                self._commands.put((self.engine.record, (url,)))
+        elif kind == "video":
+            self._commands.put((self.engine.download, (
+                urls, quality, bool(request.get("audio")), self.engine.settings["API_COOKIES"])))
+        else:
+            return 400, {"error": f"неизвестный тип задачи: {kind}"}
+        return 202, {"kind": kind, "urls": len(urls)}
+
+    async def _stream_events(self, writer):
+        # Server-Sent Events: сначала текущее состояние всех задач, затем каждое обновление
+        events = asyncio.Queue(API_EVENT_BACKLOG)
+        self._subscribers.add(events)
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                         b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+            for job in self.engine.jobs()[-API_EVENT_BACKLOG:]:
+                events.put_nowait(job_to_dict(job))
+            while True:
+                try:
+                    data = await asyncio.wait_for(events.get(), API_KEEPALIVE)
+                    writer.write(f"event: job\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+                except asyncio.TimeoutError:
+                    writer.write(b": keepalive\n\n")
+                await writer.drain()
+        finally:
+            self._subscribers.discard(events)
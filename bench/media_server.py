@@ -0,0 +1,248 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Локальная замена видеосайта для бенчмарков: прогрессивный MP4, HLS, DASH и "живой" HLS.
+# Содержимое синтетическое; если есть рабочий ffmpeg, сегменты HLS - настоящий MPEG-TS,
+# чтобы streamlink и ffmpeg в записи стрима могли его разобрать
+CHUNK_SIZE = 64 * 1024
+TS_PACKET = b"\x47\x1f\xff\x10" + b"\xff" * 184
+SEGMENT_SECONDS = 2
+LIVE_WINDOW = 5
+MP4_HEADER = b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2"
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+def synthetic_pattern(header=b""):
+    return (header + bytes(range(256)) * 256)[:CHUNK_SIZE]
+
+def make_ts_sample(ffmpeg_path, seconds=SEGMENT_SECONDS):
+    # Настоящий сегмент MPEG-TS из тестовой таблицы ffmpeg; без ffmpeg - пустые TS-пакеты
+    if ffmpeg_path and os.path.exists(ffmpeg_path):
+        fd, path = tempfile.mkstemp(suffix=".ts")
+        os.close(fd)
+        try:
+            subprocess.run([ffmpeg_path, "-hide_banner", "-loglevel", "error", "-y",
+                            "-f", "lavfi", "-i", f"testsrc=size=640x360:rate=25:duration={seconds}",
+                            "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+                            "-c:v", "libx264", "-preset", "ultrafast", "-g", "25", "-c:a", "aac",
+                            "-f", "mpegts", path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                           timeout=60, check=True)
+            with open(path, "rb") as f:
+                data = f.read()
+            if data:
+                return data, True
+        except (OSError, subprocess.SubprocessError):
+            pass
+        finally:
+            os.remove(path)
+    return TS_PACKET * 2000, False
+
+def make_dash_kit(ffmpeg_path, directory, seconds):
+    # Настоящий DASH (init + сегменты) через ffmpeg -f dash; None - ffmpeg недоступен
+    if not ffmpeg_path or not os.path.exists(ffmpeg_path):
+        return None
+    os.makedirs(directory, exist_ok=True)
+    try:
+        subprocess.run([ffmpeg_path, "-hide_banner", "-loglevel", "error", "-y",
+                        "-f", "lavfi", "-i", f"testsrc=size=640x360:rate=25:duration={seconds}",
+                        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+                        "-c:v", "libx264", "-preset", "ultrafast", "-g", "25", "-c:a", "aac",
+                        "-f", "dash", "-seg_duration", str(SEGMENT_SECONDS), os.path.join(directory, "manifest.mpd")],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=300, check=True)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if not os.path.exists(os.path.join(directory, "manifest.mpd")):
+        return None
+    return directory
+
+def synthetic_mpd(segments, segment_size):
+    duration = segments * SEGMENT_SECONDS
+    return f"""<?xml version="1.0" encoding="utf-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" mediaPresentationDuration="PT{duration}S"
+     minBufferTime="PT{SEGMENT_SECONDS}S" profiles="urn:mpeg:dash:profile:isoff-live:2011">
+  <Period id="0" start="PT0S">
+    <AdaptationSet id="0" mimeType="video/mp4" segmentAlignment="true">
+      <Representation id="av" bandwidth="{segment_size * 8 // SEGMENT_SECONDS}" codecs="avc1.42c01e,mp4a.40.2"
+                      width="640" height="360">
+        <SegmentTemplate timescale="1" duration="{SEGMENT_SECONDS}" startNumber="1"
+                         initialization="init.mp4?size={segment_size}" media="$Number$.m4s?size={segment_size}"/>
+      </Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+class MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        parsed = urllib.parse.urlsplit(self.path)
+        query = {key: values[-1] for key, values in urllib.parse.parse_qs(parsed.query).items()}
+        parts = [part for part in parsed.path.split("/") if part]
+        server = self.server
+        try:
+            if len(parts) == 2 and parts[0] == "progressive":
+                self.send_synthetic(int(query.get("size", 1024 * 1024)), "video/mp4", int(query.get("rate", 0)),
+                                    head, header=MP4_HEADER)
+            elif len(parts) == 2 and parts[0] == "hls" and parts[1].endswith(".m3u8"):
+                self.send_text(self.hls_playlist(parts[1][:-5], int(query.get("segments", 10))),
+                               "application/vnd.apple.mpegurl", head)
+            elif len(parts) == 3 and parts[0] in ("hls", "live") and parts[2].endswith(".ts"):
+                self.send_bytes(server.ts_sample, "video/mp2t", int(query.get("rate", 0)), head)
+            elif len(parts) == 2 and parts[0] == "live" and parts[1].endswith(".m3u8"):
+                self.send_text(self.live_playlist(parts[1][:-5]), "application/vnd.apple.mpegurl", head)
+            elif parts[:1] == ["dash"]:
+                self.send_dash(parts[1:], query, head)
+            else:
+                self.send_error(404)
+        except (ConnectionError, BrokenPipeError):
+            pass
+
+    def hls_playlist(self, name, segments):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}",
+                 "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD"]
+        for index in range(segments):
+            lines += [f"#EXTINF:{SEGMENT_SECONDS}.0,", f"{name}/{index}.ts"]
+        return "\n".join(lines + ["#EXT-X-ENDLIST", ""])
+
+    def live_playlist(self, name):
+        # Скользящее окно: новый сегмент каждые SEGMENT_SECONDS от запуска сервера, без EXT-X-ENDLIST
+        newest = int((time.monotonic() - self.server.started) // SEGMENT_SECONDS)
+        first = max(0, newest - LIVE_WINDOW + 1)
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}",
+                 f"#EXT-X-MEDIA-SEQUENCE:{first}"]
+        for index in range(first, newest + 1):
+            lines += [f"#EXTINF:{SEGMENT_SECONDS}.0,", f"{name}/{index}.ts"]
+        return "\n".join(lines + [""])
+
+    def send_dash(self, parts, query, head):
+        kit = self.server.dash_dir
+        if kit is not None:
+            path = os.path.join(kit, *parts[1:]) if len(parts) > 1 else None
+            if path is None or not os.path.isfile(path):
+                self.send_error(404)
+                return
+            with open(path, "rb") as f:
+                data = f.read()
+            content_type = "application/dash+xml" if path.endswith(".mpd") else "video/mp4"
+            self.send_bytes(data, content_type, 0, head)
+            return
+        size = int(query.get("size", 512 * 1024))
+        if len(parts) == 2 and parts[1] == "manifest.mpd":
+            self.send_text(synthetic_mpd(int(query.get("segments", 10)), size), "application/dash+xml", head)
+        elif len(parts) == 2:
+            self.send_synthetic(size, "video/mp4", 0, head, header=MP4_HEADER)
+        else:
+            self.send_error(404)
+
+    def send_text(self, text, content_type, head):
+        self.send_bytes(text.encode("utf-8"), content_type, 0, head)
+
+    def send_bytes(self, data, content_type, rate, head):
+        start, end = self.byte_range(len(data))
+        self.send_headers(content_type, len(data), start, end)
+        if not head:
+            self.write_throttled((data[i:min(i + CHUNK_SIZE, end + 1)] for i in range(start, end + 1, CHUNK_SIZE)), rate)
+
+    def send_synthetic(self, size, content_type, rate, head, header=b""):
+        # Большие файлы генерируются на лету, в памяти только один блок
+        start, end = self.byte_range(size)
+        self.send_headers(content_type, size, start, end)
+        if head:
+            return
+        pattern = synthetic_pattern(header)
+
+        def chunks():
+            position = start
+            while position <= end:
+                offset = position % len(pattern)
+                chunk = pattern[offset:offset + min(len(pattern) - offset, end + 1 - position)]
+                position += len(chunk)
+                yield chunk
+        self.write_throttled(chunks(), rate)
+
+    def byte_range(self, size):
+        # Поддержка Range нужна для --http-chunk-size и продолжения загрузки
+        match = RANGE_RE.fullmatch(self.headers.get("Range", ""))
+        if match is None or not (match.group(1) or match.group(2)):
+            self.partial = False
+            return 0, size - 1
+        if match.group(1):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        else:
+            start, end = max(0, size - int(match.group(2))), size - 1
+        self.partial = True
+        return start, end
+
+    def send_headers(self, content_type, size, start, end):
+        if self.partial:
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def write_throttled(self, chunks, rate):
+        started = time.monotonic()
+        sent = 0
+        for chunk in chunks:
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            if rate:
+                delay = sent / rate - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+class MediaServer:
+    def __init__(self, ffmpeg_path=None, dash_seconds=0, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), MediaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.started = time.monotonic()
+        self.httpd.ts_sample, self.real_media = make_ts_sample(ffmpeg_path)
+        self.kit_dir = tempfile.mkdtemp(prefix="simpledlp-bench-media-")
+        self.httpd.dash_dir = make_dash_kit(ffmpeg_path, self.kit_dir, dash_seconds) if dash_seconds else None
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        shutil.rmtree(self.kit_dir, ignore_errors=True)
+
+    def progressive_url(self, name, size, rate=0):
+        query = f"?size={size}" + (f"&rate={rate}" if rate else "")
+        return f"{self.base_url}/progressive/{name}.mp4{query}"
+
+    def hls_url(self, name, segments):
+        return f"{self.base_url}/hls/{name}.m3u8?segments={segments}"
+
+    def dash_url(self, segments, segment_size):
+        if self.httpd.dash_dir is not None:
+            return f"{self.base_url}/dash/kit/manifest.mpd"
+        return f"{self.base_url}/dash/kit/manifest.mpd?segments={segments}&size={segment_size}"
+
+    def live_url(self, name):
+        return f"{self.base_url}/live/{name}.m3u8"
+
+    @property
+    def ts_sample_size(self):
+        return len(self.httpd.ts_sample)
@@ -0,0 +1,403 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import collections
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from engine import Engine, JOB_DONE, probe_version, tool_paths
+from gui import LogSink, LOG_FLUSH_INTERVAL, LOG_VIEW_LINES
+from media_server import MediaServer, SEGMENT_SECONDS
+
+# Бенчмарк движка на локальном фейковом медиасервере: те же вызовы Engine.download и Engine.record,
+# что делают кнопки "Скачать видео" и "Записать стрим", результат - JSON для сравнения между версиями
+MIB = 1024 * 1024
+SIZES = {
+    "full": {"small_files": 40, "small_size": 512 * 1024, "large_size": 256 * MIB, "hls_segments": 60,
+             "dash_segments": 60, "live_seconds": 10, "concurrent_jobs": 8, "concurrent_seconds": 6,
+             "log_lines": 200000, "startup_runs": 10},
+    "quick": {"small_files": 10, "small_size": 256 * 1024, "large_size": 32 * MIB, "hls_segments": 10,
+              "dash_segments": 10, "live_seconds": 4, "concurrent_jobs": 4, "concurrent_seconds": 3,
+              "log_lines": 20000, "startup_runs": 3},
+}
+# Прогрессивный файл и HLS-плейлист - один формат со звуком и видео, DASH из ffmpeg - отдельные дорожки
+BENCH_QUALITY = "bv*+ba/b"
+CONCURRENT_RATE = 2 * MIB
+# Направление метрик при сравнении с прошлым результатом
+HIGHER_IS_BETTER = ("_per_sec",)
+LOWER_IS_BETTER = ("_s", "_mb", "_ms")
+# Запуск нового интерпретатора до готового Engine - то, что идет перед построением окна.
+# Сам Tk не меряется: у машины с бенчмарком обычно нет дисплея
+STARTUP_TARGET_MS = 300
+STARTUP_SNIPPET = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import gui
+from engine import Engine
+imported = time.perf_counter()
+engine = Engine(sys.argv[2], {"MIN_FREE_GB": 0}, lambda line: None)
+ready = time.perf_counter()
+print("ready", flush=True)
+engine.tool_versions()
+tools = time.perf_counter()
+engine.shutdown()
+print(json.dumps({"import_ms": (imported - started) * 1000, "engine_ms": (ready - imported) * 1000,
+                  "tools_ms": (tools - ready) * 1000}))
+"""
+
+def log(message):
+    sys.stderr.write(message + "\n")
+    sys.stderr.flush()
+
+def dir_size(path):
+    total = 0
+    for directory, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+def process_rss(pid):
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def child_pids(root_pid):
+    # Все потомки процесса по /proc/<pid>/stat (yt-dlp, ffmpeg, streamlink)
+    parents = collections.defaultdict(list)
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents[ppid].append(int(name))
+    pids = []
+    pending = list(parents[root_pid])
+    while pending:
+        pid = pending.pop()
+        pids.append(pid)
+        pending += parents[pid]
+    return pids
+
+def children_rss():
+    total = 0
+    for pid in child_pids(os.getpid()):
+        try:
+            total += process_rss(pid)
+        except (OSError, ValueError):
+            pass
+    return total
+
+class Bench:
+    def __init__(self, args, server, sizes):
+        self.args = args
+        self.server = server
+        self.sizes = sizes
+
+    def base_dir(self):
+        base_dir = tempfile.mkdtemp(prefix="simpledlp-bench-")
+        try:
+            os.symlink(self.args.tools, os.path.join(base_dir, "bin"), target_is_directory=True)
+        except OSError:
+            shutil.copytree(self.args.tools, os.path.join(base_dir, "bin"))
+        return base_dir
+
+    def engine(self, **settings):
+        base_dir = self.base_dir()
+        # Порог свободного места выключен: бенчмарк не должен зависеть от заполненности диска
+        settings = dict({"MIN_FREE_GB": 0, "MAX_WORKERS": self.args.workers,
+                         "DOWNLOAD_PROFILE": self.args.profile}, **settings)
+        lines = []
+        engine = Engine(base_dir, settings, lines.append)
+        engine.bench_lines = lines
+        return engine
+
+    def close(self, engine):
+        engine.shutdown()
+        engine.wait_idle(30)
+        shutil.rmtree(engine.base_dir, ignore_errors=True)
+
+    def download(self, engine, urls):
+        started = time.perf_counter()
+        engine.download(urls, BENCH_QUALITY)
+        if not engine.wait_idle(self.args.timeout):
+            raise TimeoutError(f"загрузки не завершились за {self.args.timeout} с")
+        elapsed = time.perf_counter() - started
+        failed = [job for job in engine.jobs() if job.state != JOB_DONE]
+        return elapsed, failed, dir_size(engine.videos_dir)
+
+    def result(self, engine, elapsed, failed, size, **metrics):
+        data = {"elapsed_s": round(elapsed, 3), "failed": len(failed), "bytes": size}
+        if failed:
+            data["errors"] = [line for line in engine.bench_lines if "ERROR" in line][-5:]
+        data.update(metrics)
+        return data
+
+def bench_progressive_small(bench):
+    count = bench.sizes["small_files"]
+    urls = [bench.server.progressive_url(f"small{i}", bench.sizes["small_size"]) for i in range(count)]
+    engine = bench.engine()
+    try:
+        elapsed, failed, size = bench.download(engine, urls)
+        return bench.result(engine, elapsed, failed, size, jobs=count,
+                            jobs_per_sec=round((count - len(failed)) / elapsed, 3))
+    finally:
+        bench.close(engine)
+
+def bench_progressive_large(bench):
+    engine = bench.engine()
+    try:
+        elapsed, failed, size = bench.download(engine, [bench.server.progressive_url("large", bench.sizes["large_size"])])
+        return bench.result(engine, elapsed, failed, size, mb_per_sec=round(size / MIB / elapsed, 3))
+    finally:
+        bench.close(engine)
+
+def bench_hls_vod(bench):
+    engine = bench.engine()
+    try:
+        elapsed, failed, size = bench.download(engine, [bench.server.hls_url("vod", bench.sizes["hls_segments"])])
+        return bench.result(engine, elapsed, failed, size, mb_per_sec=round(size / MIB / elapsed, 3))
+    finally:
+        bench.close(engine)
+
+def bench_dash_vod(bench):
+    engine = bench.engine()
+    try:
+        url = bench.server.dash_url(bench.sizes["dash_segments"], bench.server.ts_sample_size)
+        elapsed, failed, size = bench.download(engine, [url])
+        return bench.result(engine, elapsed, failed, size, mb_per_sec=round(size / MIB / elapsed, 3))
+    finally:
+        bench.close(engine)
+
+def bench_live_capture(bench):
+    # Время от нажатия "Записать стрим" до первых байт на диске и время штатной остановки
+    engine = bench.engine(STREAM_SEGMENT_MINUTES=1)
+    if shutil.which(engine.streamlink_path) is None:
+        bench.close(engine)
+        return {"skipped": "streamlink не найден"}
+    try:
+        started = time.perf_counter()
+        job = engine.record(bench.server.live_url("live"))
+        ttfb = None
+        deadline = started + bench.args.timeout
+        while ttfb is None and time.perf_counter() < deadline and job.is_active():
+            if dir_size(job.output_dir) > 0:
+                ttfb = time.perf_counter() - started
+            else:
+                time.sleep(0.05)
+        if ttfb is None:
+            return {"failed": 1, "state": job.state, "errors": engine.bench_lines[-5:]}
+        time.sleep(bench.sizes["live_seconds"])
+        written = dir_size(job.output_dir)
+        stopping = time.perf_counter()
+        engine.stop(job)
+        engine.wait_idle(bench.args.timeout)
+        return {"ttfb_s": round(ttfb, 3), "stop_s": round(time.perf_counter() - stopping, 3),
+                "bytes": written, "bytes_per_sec": round(written / bench.sizes["live_seconds"]),
+                "segment_seconds": SEGMENT_SECONDS}
+    finally:
+        bench.close(engine)
+
+def bench_gui_log(bench):
+    # Строки из потоков задач через LogSink в окно: сколько пишется и сколько доходит при таймере окна
+    log_dir = tempfile.mkdtemp(prefix="simpledlp-bench-log-")
+    sink = LogSink(os.path.join(log_dir, "logs", "simpledlp.log"))
+    writers = 4
+    lines = bench.sizes["log_lines"]
+    try:
+        finished = []
+
+        def write(index):
+            for i in range(lines // writers):
+                sink.write(f"[#{index}] [download]  42.0% of ~ 1.00GiB at 10.00MiB/s ETA 00:42 ({i})")
+            finished.append(time.perf_counter())
+        started = time.perf_counter()
+        threads = [threading.Thread(target=write, args=(index,)) for index in range(writers)]
+        for thread in threads:
+            thread.start()
+        delivered = 0
+        skipped = 0
+        total = lines // writers * writers
+        while delivered < total:
+            shown, dropped = sink.drain()
+            delivered += len(shown) + dropped
+            skipped += dropped
+            if delivered < total:
+                time.sleep(LOG_FLUSH_INTERVAL / 1000)
+        delivered_at = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        written = max(finished) - started
+        delivered = delivered_at - started
+        return {"lines": total, "write_lines_per_sec": round(total / written),
+                "delivered_s": round(delivered, 3), "delivered_lines_per_sec": round(total / delivered),
+                "skipped_lines": skipped, "view_lines": LOG_VIEW_LINES}
+    finally:
+        for handler in list(sink._logger.handlers):
+            sink._logger.removeHandler(handler)
+            handler.close()
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+def bench_concurrent_memory(bench):
+    # Память на одну одновременную задачу: медленные загрузки держат процессы живыми, пока идут замеры
+    if not os.path.exists("/proc/self/statm"):
+        return {"skipped": "нужен /proc (Linux)"}
+    count = bench.sizes["concurrent_jobs"]
+    size = CONCURRENT_RATE * bench.sizes["concurrent_seconds"]
+    urls = [bench.server.progressive_url(f"slow{i}", size, CONCURRENT_RATE) for i in range(count)]
+    engine = bench.engine(MAX_WORKERS=count, RATE_LIMIT="0")
+    try:
+        python_before = process_rss(os.getpid())
+        peak = 0
+        python_peak = python_before
+        started = time.perf_counter()
+        engine.download(urls, BENCH_QUALITY)
+        while engine.has_active():
+            if time.perf_counter() - started > bench.args.timeout:
+                raise TimeoutError(f"загрузки не завершились за {bench.args.timeout} с")
+            peak = max(peak, children_rss())
+            python_peak = max(python_peak, process_rss(os.getpid()))
+            time.sleep(0.1)
+        failed = [job for job in engine.jobs() if job.state != JOB_DONE]
+        return {"jobs": count, "failed": len(failed), "peak_children_rss_mb": round(peak / MIB, 1),
+                "rss_per_job_mb": round(peak / MIB / count, 2),
+                "python_rss_delta_mb": round((python_peak - python_before) / MIB, 2)}
+    finally:
+        bench.close(engine)
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+def bench_startup(bench):
+    # Каждый запуск - новый процесс в той же папке: первый опрашивает утилиты, следующие берут cache/tools.json
+    base_dir = bench.base_dir()
+    runs = []
+    try:
+        for _ in range(bench.sizes["startup_runs"]):
+            started = time.perf_counter()
+            process = subprocess.Popen([sys.executable, "-c", STARTUP_SNIPPET, ROOT_DIR, base_dir],
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            process.stdout.readline()
+            ready_ms = (time.perf_counter() - started) * 1000
+            out, err = process.communicate(timeout=bench.args.timeout)
+            if process.returncode != 0:
+                raise RuntimeError(err.strip().splitlines()[-1] if err.strip() else f"exit code {process.returncode}")
+            runs.append(dict(json.loads(out), ready_ms=ready_ms))
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+    start_ms = median([run["ready_ms"] for run in runs])
+    cached = [run["tools_ms"] for run in runs[1:]]
+    return {"runs": len(runs), "start_ms": round(start_ms, 1),
+            "import_ms": round(median([run["import_ms"] for run in runs]), 1),
+            "engine_init_ms": round(median([run["engine_ms"] for run in runs]), 1),
+            "tool_probe_ms": round(runs[0]["tools_ms"], 1),
+            "tool_probe_cached_ms": round(median(cached), 1) if cached else None,
+            "target_ms": STARTUP_TARGET_MS, "target_met": start_ms <= STARTUP_TARGET_MS}
+
+SCENARIOS = collections.OrderedDict([
+    ("startup", bench_startup),
+    ("progressive_small", bench_progressive_small),
+    ("progressive_large", bench_progressive_large),
+    ("hls_vod", bench_hls_vod),
+    ("dash_vod", bench_dash_vod),
+    ("live_capture", bench_live_capture),
+    ("gui_log", bench_gui_log),
+    ("concurrent_memory", bench_concurrent_memory),
+])
+
+def compare(baseline, results, tolerance):
+    # Регрессия - метрика хуже прошлой больше чем на tolerance
+    regressions = []
+    for scenario, metrics in results.items():
+        old_metrics = baseline.get("results", {}).get(scenario, {})
+        for key, value in metrics.items():
+            old = old_metrics.get(key)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            if key.endswith(HIGHER_IS_BETTER):
+                worse = change < -tolerance
+            elif key.endswith(LOWER_IS_BETTER):
+                worse = change > tolerance
+            else:
+                continue
+            log(f"{scenario}.{key}: {old} -> {value} ({change:+.1%}){' РЕГРЕССИЯ' if worse else ''}")
+            if worse:
+                regressions.append({"metric": f"{scenario}.{key}", "baseline": old, "value": value,
+                                    "change": round(change, 4)})
+    return regressions
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Бенчмарк SimpleDLP на локальном фейковом медиасервере")
+    parser.add_argument("--tools", default=tool_paths(ROOT_DIR)[0], help="папка с yt-dlp и ffmpeg (по умолчанию bin/)")
+    parser.add_argument("--only", nargs="+", choices=list(SCENARIOS), help="запустить только эти сценарии")
+    parser.add_argument("--quick", action="store_true", help="маленькие объемы для быстрой проверки")
+    parser.add_argument("--workers", type=int, default=3, help="MAX_WORKERS")
+    parser.add_argument("--profile", default="balanced", help="профиль скорости")
+    parser.add_argument("--timeout", type=int, default=600, help="предел на один сценарий, секунд")
+    parser.add_argument("-o", "--output", help="файл для JSON (по умолчанию stdout)")
+    parser.add_argument("--baseline", help="прошлый JSON для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="допустимое ухудшение, доля (0.1 = 10%%)")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.tools = os.path.abspath(args.tools)
+    sizes = SIZES["quick" if args.quick else "full"]
+    ytdlp_path, ffmpeg_path = (os.path.join(args.tools, os.path.basename(path)) for path in tool_paths(ROOT_DIR)[1:])
+    dash_seconds = sizes["dash_segments"] * SEGMENT_SECONDS
+    report = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "quick": args.quick,
+        "tools": {"yt-dlp": probe_version([ytdlp_path, "--version"]),
+                  "ffmpeg": probe_version([ffmpeg_path, "-version"]),
+                  "streamlink": probe_version(["streamlink", "--version"])},
+        "real_media": None,
+        "results": {},
+    }
+    log("Подготовка тестовых медиа...")
+    with MediaServer(ffmpeg_path, dash_seconds) as server:
+        report["real_media"] = server.real_media
+        bench = Bench(args, server, sizes)
+        for name in args.only or SCENARIOS:
+            log(f"Сценарий {name}...")
+            try:
+                report["results"][name] = SCENARIOS[name](bench)
+            except Exception as e:
+                report["results"][name] = {"error": f"{type(e).__name__}: {e}"}
+            log(f"  {json.dumps(report['results'][name], ensure_ascii=False)}")
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report["results"], args.tolerance)
+        report["regressions"] = regressions
+    text = json.dumps(report, indent=4, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
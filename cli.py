@@ -0,0 +1,317 @@
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+
+from engine import (Engine, load_config, parse_url_list, format_progress, is_http_url, DEFAULT_QUALITY,
+                    DOWNLOAD_PROFILES, STREAM_STOP_TIMEOUT, JOB_DONE, JOB_FAILED)
+from postprocess import AUDIO_FORMATS, REMUX_CONTAINERS, OPTIONAL_POSTPROCESSORS, VOD_MODES
+from storage import OUTPUT_TEMPLATES
+
+SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
+PROGRESS_PRINT_INTERVAL = 5
+INBOX_POLL_INTERVAL = 5
+
+def log(message):
+    # Одна запись на строку, чтобы строки из разных потоков не склеивались
+    sys.stdout.write(message + "\n")
+    sys.stdout.flush()
+
+class JobPrinter:
+    # Печатает смену состояния задач и прогресс не чаще раза в PROGRESS_PRINT_INTERVAL секунд
+    def __init__(self):
+        self.states = {}
+        self.printed_at = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, job):
+        with self.lock:
+            now = time.monotonic()
+            if self.states.get(job.id) != job.state:
+                self.states[job.id] = job.state
+                self.printed_at[job.id] = now
+                suffix = f" ({job.error or job.returncode})" if job.state == JOB_FAILED else ""
+                log(f"[#{job.id}] {job.state}{suffix}: {job.url}")
+            elif job.progress is not None and now - self.printed_at.get(job.id, 0) >= PROGRESS_PRINT_INTERVAL:
+                self.printed_at[job.id] = now
+                log(f"[#{job.id}] {format_progress(job.progress)}")
+
+def postprocess_list(text):
+    steps = [step.strip() for step in text.split(",") if step.strip()]
+    for step in steps:
+        if step not in OPTIONAL_POSTPROCESSORS:
+            raise argparse.ArgumentTypeError(f"неизвестный шаг: {step}")
+    return steps
+
+def int_range(minimum, maximum=None):
+    # Тип argparse: целое в границах; 0 там, где он допустим, не теряется и не подменяется настройкой
+    def parse(text):
+        try:
+            value = int(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"ожидается целое число: {text}")
+        if value < minimum or (maximum is not None and value > maximum):
+            bounds = f"от {minimum} до {maximum}" if maximum is not None else f"не меньше {minimum}"
+            raise argparse.ArgumentTypeError(f"{value}: допустимо {bounds}")
+        return value
+    return parse
+
+def make_engine(args):
+    settings = load_config(os.path.join(args.dir, "config.json"))
+    if getattr(args, "workers", None) is not None:
+        settings["MAX_WORKERS"] = args.workers
+    if getattr(args, "audio_format", None) is not None:
+        settings["AUDIO_FORMAT"] = args.audio_format
+    if getattr(args, "audio_bitrate", None) is not None:
+        settings["AUDIO_BITRATE"] = args.audio_bitrate
+    if getattr(args, "full_playlist", False):
+        settings["PLAYLIST_SYNC_STOP"] = 0
+    if getattr(args, "remux", None) is not None:
+        settings["REMUX_CONTAINER"] = args.remux
+    if getattr(args, "postprocess", None) is not None:
+        settings["POSTPROCESSORS"] = args.postprocess
+    if getattr(args, "vod", None) is not None:
+        settings["VOD_TRANSCODE"] = args.vod
+    if getattr(args, "profile", None) is not None:
+        settings["DOWNLOAD_PROFILE"] = args.profile
+    if getattr(args, "limit_rate", None) is not None:
+        settings["RATE_LIMIT"] = args.limit_rate
+    if getattr(args, "segment_minutes", None) is not None:
+        settings["STREAM_SEGMENT_MINUTES"] = args.segment_minutes
+    if getattr(args, "segment_format", None) is not None:
+        settings["STREAM_SEGMENT_FORMAT"] = args.segment_format
+    if getattr(args, "from_start", False):
+        settings["STREAM_CAPTURE_MODE"] = "from-start"
+    if getattr(args, "segment_threads", None) is not None:
+        settings["STREAM_SEGMENT_THREADS"] = args.segment_threads
+    if getattr(args, "prefetch", None) is not None:
+        settings["STREAM_PREFETCH_SEGMENTS"] = args.prefetch
+    if getattr(args, "stall_timeout", None) is not None:
+        settings["STREAM_STALL_SECONDS"] = args.stall_timeout
+    if getattr(args, "reconnects", None) is not None:
+        settings["STREAM_RECONNECT_RETRIES"] = args.reconnects
+    if getattr(args, "videos_dir", None) is not None:
+        settings["VIDEOS_DIR"] = args.videos_dir
+    if getattr(args, "vods_dir", None) is not None:
+        settings["VODS_DIR"] = args.vods_dir
+    if getattr(args, "output_template", None) is not None:
+        settings["OUTPUT_TEMPLATE"] = args.output_template
+    if getattr(args, "min_free", None) is not None:
+        settings["MIN_FREE_GB"] = args.min_free
+    engine = Engine(args.dir, settings, log)
+    engine.add_listener(JobPrinter())
+    return engine
+
+def prepare_tools(engine):
+    if not engine.ensure_tools(wait=True) and engine.missing_tools():
+        log(f"Не найдены: {', '.join(engine.missing_tools())}. Скачайте их вручную в {engine.bin_dir}")
+        return False
+    return not engine.missing_tools()
+
+def stop_event():
+    # Ctrl+C и SIGTERM останавливают задачи штатно: ffmpeg успевает закрыть текущий сегмент
+    event = threading.Event()
+    def handler(signum, frame):
+        log("Остановка...")
+        event.set()
+    signal.signal(signal.SIGINT, handler)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, handler)
+    return event
+
+def shutdown(engine, resumable=False):
+    # resumable - задачи останутся в журнале и продолжатся при следующем запуске
+    if resumable:
+        engine.shutdown()
+    else:
+        engine.watcher.set_channels([])
+        engine.stop_all()
+    engine.wait_idle(STREAM_STOP_TIMEOUT + 5)
+
+def exit_code(jobs):
+    return 0 if all(job.state == JOB_DONE for job in jobs) else 1
+
+def read_url_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_url_list(f.read())
+
+def cmd_download(args):
+    engine = make_engine(args)
+    urls = list(args.urls)
+    if args.batch_file:
+        urls += read_url_file(args.batch_file)
+    if not urls:
+        log("Нет ссылок для загрузки")
+        return 2
+    if not prepare_tools(engine):
+        return 1
+    stop = stop_event()
+    engine.download(urls, args.format, args.audio, args.cookies)
+    while engine.has_active():
+        if stop.wait(0.5):
+            shutdown(engine)
+            return 130
+    # Все задачи запуска: плейлист всегда завершается успешно, а ошибки - в загрузках, которые он породил
+    return exit_code(engine.jobs())
+
+def cmd_record(args):
+    bad = [url for url in args.urls if not is_http_url(url)]
+    if bad:
+        log(f"Нужны ссылки http(s): {' '.join(bad)}")
+        return 2
+    engine = make_engine(args)
+    if not prepare_tools(engine):
+        return 1
+    stop = stop_event()
+    jobs = [job for job in map(engine.record, args.urls) if job]
+    while engine.has_active():
+        if stop.wait(0.5):
+            shutdown(engine)
+            break
+    return exit_code(jobs) if not stop.is_set() else 0
+
+def cmd_watch(args):
+    engine = make_engine(args)
+    channels = args.urls or engine.settings["WATCH_CHANNELS"]
+    if not channels:
+        log("Нет каналов для отслеживания: передайте ссылки или задайте WATCH_CHANNELS в config.json")
+        return 2
+    if not prepare_tools(engine):
+        return 1
+    stop = stop_event()
+    engine.set_watch_channels(channels)
+    stop.wait()
+    shutdown(engine, resumable=True)
+    return 0
+
+def cmd_resume(args):
+    engine = make_engine(args)
+    if not prepare_tools(engine):
+        return 1
+    stop = stop_event()
+    jobs = engine.resume_jobs()
+    if not jobs:
+        log("Нет незавершенных задач")
+        return 0
+    while engine.has_active():
+        if stop.wait(0.5):
+            shutdown(engine, resumable=True)
+            return 130
+    return exit_code([job for job in jobs if job.kind != "stream"])
+
+def process_inbox(engine, inbox):
+    # Каждый *.txt во входящей папке - список ссылок; строки "record URL" запускают запись стрима
+    for name in sorted(os.listdir(inbox)):
+        if not name.endswith(".txt"):
+            continue
+        path = os.path.join(inbox, name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            os.replace(path, path + ".done")
+        except OSError as e:
+            log(f"Не удалось прочитать {path}: {e}")
+            continue
+        videos = []
+        for line in lines:
+            words = line.split()
+            if len(words) == 2 and words[0] == "record":
+                engine.record(words[1])
+            else:
+                videos.append(line)
+        if videos:
+            engine.download(videos)
+        log(f"Обработан {name}")
+
+def cmd_daemon(args):
+    engine = make_engine(args)
+    if not prepare_tools(engine):
+        return 1
+    inbox = args.inbox or os.path.join(args.dir, "inbox")
+    os.makedirs(inbox, exist_ok=True)
+    stop = stop_event()
+    engine.resume_jobs()
+    if engine.settings["WATCH_CHANNELS"]:
+        engine.set_watch_channels(engine.settings["WATCH_CHANNELS"])
+    api_port = args.http or engine.settings["API_PORT"]
+    if api_port:
+        # api тянет asyncio - загружается только когда API включен
+        from api import ApiServer
+        if not ApiServer(engine, api_port).start():
+            return 1
+    log(f"Демон запущен, входящие ссылки: {inbox}")
+    while not stop.is_set():
+        try:
+            process_inbox(engine, inbox)
+        except OSError as e:
+            log(f"Ошибка входящей папки: {e}")
+        stop.wait(INBOX_POLL_INTERVAL)
+    shutdown(engine, resumable=True)
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="SimpleDLP", description="SimpleDLP без графического интерфейса")
+    parser.add_argument("--dir", default=SCRIPTDIR, help="папка с config.json, bin/, videos/ и vods/")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    download = commands.add_parser("download", help="скачать видео")
+    download.add_argument("urls", nargs="*")
+    download.add_argument("-f", "--format", default=DEFAULT_QUALITY, help="формат yt-dlp")
+    download.add_argument("--audio", action="store_true", help="только аудио")
+    download.add_argument("--audio-format", choices=list(AUDIO_FORMATS) + ["best"], help="формат аудио")
+    download.add_argument("--audio-bitrate", metavar="RATE", help="битрейт при перекодировании, например 192K; 0 - наилучшее качество")
+    download.add_argument("--cookies", default="", help="файл cookies")
+    download.add_argument("--batch-file", help="файл со списком ссылок")
+    download.add_argument("--workers", type=int_range(1), help="число параллельных загрузок")
+    download.add_argument("--full-playlist", action="store_true",
+                          help="перебирать плейлисты и каналы целиком, а не только до уже скачанных видео")
+    download.add_argument("--remux", choices=REMUX_CONTAINERS, help="перепаковать видео в контейнер")
+    download.add_argument("--postprocess", type=postprocess_list, metavar="STEPS",
+                          help="шаги постобработки через запятую: " + ",".join(OPTIONAL_POSTPROCESSORS))
+    download.add_argument("--profile", choices=list(DOWNLOAD_PROFILES) + ["custom"], help="профиль скорости")
+    download.add_argument("--limit-rate", metavar="RATE", help="общий лимит скорости, например 5M")
+    download.add_argument("-o", "--output-dir", dest="videos_dir", metavar="DIR", help="папка для видео")
+    download.add_argument("--output-template", metavar="TEMPLATE",
+                          help="имя файла: " + ", ".join(OUTPUT_TEMPLATES) + " или свой шаблон yt-dlp")
+    download.add_argument("--min-free", type=int_range(0), metavar="GB", help="ждать, пока на диске меньше GB свободно; 0 - не следить")
+    download.set_defaults(func=cmd_download)
+
+    record = commands.add_parser("record", help="записать стримы до Ctrl+C")
+    record.add_argument("urls", nargs="+")
+    record.add_argument("--segment-minutes", type=int_range(0), help="длина сегмента в минутах; 0 - один файл")
+    record.add_argument("--segment-format", choices=("mp4", "ts"), help="формат сегментов")
+    record.add_argument("--vod", choices=VOD_MODES, help="склеить сегменты в один файл после записи")
+    record.add_argument("-o", "--output-dir", dest="vods_dir", metavar="DIR", help="папка для записей")
+    record.add_argument("--from-start", action="store_true",
+                        help="записывать с начала эфира через yt-dlp --live-from-start, догоняя быстрее реального времени")
+    record.add_argument("--segment-threads", type=int_range(1), metavar="N", help="сегментов стрима, загружаемых параллельно")
+    record.add_argument("--prefetch", type=int_range(1), metavar="N", help="сегментов от края эфира, запрашиваемых сразу (streamlink)")
+    record.add_argument("--stall-timeout", type=int_range(0), metavar="SECONDS",
+                        help="перезапускать запись, если данных нет столько секунд; 0 - не следить")
+    record.add_argument("--reconnects", type=int_range(0), metavar="N", help="перезапусков подряд, прежде чем считать запись упавшей")
+    record.add_argument("--min-free", type=int_range(0), metavar="GB",
+                        help="меньше GB свободно - новые записи ждут, вдвое меньше - запись останавливается")
+    record.set_defaults(func=cmd_record)
+
+    watch = commands.add_parser("watch", help="ждать эфира и записывать (по умолчанию WATCH_CHANNELS)")
+    watch.add_argument("urls", nargs="*")
+    watch.set_defaults(func=cmd_watch)
+
+    resume = commands.add_parser("resume", help="продолжить задачи, прерванные закрытием или сбоем")
+    resume.set_defaults(func=cmd_resume)
+
+    daemon = commands.add_parser("daemon", help="фоновый режим: входящая папка, HTTP API и отслеживание каналов")
+    daemon.add_argument("--inbox", help="папка для *.txt со ссылками (по умолчанию inbox/)")
+    daemon.add_argument("--http", type=int_range(1, 65535), metavar="PORT", help="запустить HTTP API на 127.0.0.1:PORT")
+    daemon.set_defaults(func=cmd_daemon)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.dir = os.path.abspath(args.dir)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2003 @@
+import sys
+import subprocess
+import os
+import threading
+import shutil
+import urllib.parse
+import json
+import itertools
+import collections
+import tempfile
+import hashlib
+import io
+import signal
+import re
+import time
+import heapq
+import random
+
+from postprocess import (OPTIONAL_POSTPROCESSORS, VOD_MODES, VOD_SUFFIX, audio_format_selector,
+                         parse_file_line, postprocess_plan, postprocess_workers, vod_cmd, write_concat_list,
+                         ytdlp_postprocess_args)
+from metrics import FFMPEG_PROGRESS_ARGS, METRICS_INTERVAL, JobMetrics, MetricsCollector, handle_output_line, prometheus_text
+from storage import (GIB, STORAGE_CHECK_INTERVAL, STORAGE_CRITICAL_FACTOR, STORAGE_RESUME_FACTOR, VOD_EXTENSIONS,
+                     free_bytes, output_root, output_template, prune_files)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_STOPPED = "stopped"
+
+WATCH_INTERVAL = 60
+
+YTDLP_URL = "https://github.com/yt-dlp/yt-dlp/releases/latest/download/yt-dlp"
+FFMPEG_URL = "https://johnvansickle.com/ffmpeg/releases/ffmpeg-release-amd64-static.tar.xz"
+WINDOWS_TOOLS_HINT = (
+    "Скачайте yt-dlp.exe и ffmpeg.exe вручную:\n"
+    "yt-dlp.exe: https://github.com/yt-dlp/yt-dlp/releases/latest/download/yt-dlp.exe\n"
+    "ffmpeg.exe: https://www.gyan.dev/ffmpeg/builds/\n"
+    "Положите их в папку 'bin'."
+)
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+_tools_lock = threading.Lock()
+
+def tool_url(url, mirror=""):
+    # Зеркало (http:// или file://) с теми же именами файлов, например для работы без интернета
+    if not mirror:
+        return url
+    return mirror.rstrip("/") + "/" + url.rsplit("/", 1)[-1]
+
+def remove_files(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def download_validator(headers):
+    # Сильный ETag или Last-Modified: по нему сервер отдает докачку только для той же версии файла
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+def download_file(url, path, progress=None):
+    # Докачка в path.part через Range + If-Range, затем атомарная замена.
+    # Ссылки вида .../latest/... со временем ведут на другой файл: без совпадения ETag/Last-Modified
+    # (path.part.meta) сервер отвечает 200, и .part перезаписывается, а не склеивается с новой версией.
+    # urllib.request тянет http.client, email и ssl - грузится только когда действительно нужно качать
+    import urllib.request
+    import urllib.error
+    part_path = path + ".part"
+    meta_path = part_path + ".meta"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    validator = None
+    if offset:
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("url") == url:
+                validator = meta.get("validator")
+        except (OSError, ValueError, AttributeError):
+            pass
+        if not validator:
+            # Неизвестно, от какой версии этот кусок - качаем заново
+            remove_files(part_path, meta_path)
+            offset = 0
+    request = urllib.request.Request(url)
+    if offset:
+        request.add_header("Range", f"bytes={offset}-")
+        request.add_header("If-Range", validator)
+    try:
+        with urllib.request.urlopen(request) as response:
+            if offset and getattr(response, "status", None) == 206:
+                match = re.match(r"bytes (\d+)-", response.headers.get("Content-Range", ""))
+                if not match or int(match.group(1)) != offset:
+                    remove_files(part_path, meta_path)
+                    raise ValueError(f"сервер вернул не тот диапазон: {response.headers.get('Content-Range')}")
+            elif offset:
+                offset = 0
+            if not offset:
+                validator = download_validator(response.headers)
+                if validator:
+                    atomic_write_json(meta_path, {"url": url, "validator": validator})
+                else:
+                    remove_files(meta_path)
+            length = response.headers.get("Content-Length")
+            total = offset + int(length) if length else None
+            with open(part_path, "ab" if offset else "wb") as out_file:
+                done = offset
+                while True:
+                    chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out_file.write(chunk)
+                    done += len(chunk)
+                    if progress:
+                        progress(done, total)
+        os.replace(part_path, path)
+        os.chmod(path, 0o755)
+        remove_files(meta_path)
+        return True
+    except Exception as e:
+        if offset and isinstance(e, urllib.error.HTTPError):
+            # 416 и прочие отказы на запрос с Range повторялись бы при каждом запуске
+            remove_files(part_path, meta_path)
+        print(f"Ошибка скачивания {url}: {e}")
+        return False
+
+def extract_tar_member(archive_path, suffix, destination):
+    # Потоковое чтение "r|xz": архив не индексируется целиком, чтение прекращается на первом совпадении
+    import tarfile
+    with tarfile.open(archive_path, "r|xz") as tar:
+        for member in tar:
+            if member.isfile() and member.name.endswith(suffix):
+                tmp_path = destination + ".tmp"
+                with tar.extractfile(member) as src, open(tmp_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
+                os.chmod(tmp_path, 0o755)
+                os.replace(tmp_path, destination)
+                return True
+    return False
+
+def progress_logger(name, log):
+    last = [-1]
+
+    def report(done, total):
+        if total:
+            percent = done * 100 // total
+            if percent // 10 != last[0]:
+                last[0] = percent // 10
+                log(f"{name}: {percent}% ({format_size(done)} / {format_size(total)})")
+    return report
+
+def install_ytdlp(ytdlp_path, log, mirror=""):
+    log("Скачивание yt-dlp...")
+    if download_file(tool_url(YTDLP_URL, mirror), ytdlp_path, progress_logger("yt-dlp", log)):
+        log("yt-dlp установлен.")
+    else:
+        log("Не удалось скачать yt-dlp.")
+
+def install_ffmpeg(bin_dir, ffmpeg_path, log, mirror=""):
+    archive_path = os.path.join(bin_dir, "ffmpeg.tar.xz")
+    log("Скачивание ffmpeg...")
+    if not download_file(tool_url(FFMPEG_URL, mirror), archive_path, progress_logger("ffmpeg", log)):
+        log("Не удалось скачать ffmpeg.")
+        return
+    try:
+        if extract_tar_member(archive_path, "/ffmpeg", ffmpeg_path):
+            log("ffmpeg установлен.")
+        else:
+            log("В архиве не найден ffmpeg.")
+        os.remove(archive_path)
+    except Exception as e:
+        log(f"Ошибка при распаковке ffmpeg: {e}")
+
+def ensure_bin_tools_linux(bin_dir, ytdlp_path, ffmpeg_path, log=print, force=False, mirror=""):
+    # Обе утилиты качаются параллельно; повторный запуск, пока идет загрузка, ничего не делает
+    if not _tools_lock.acquire(blocking=False):
+        log("Утилиты уже загружаются.")
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    try:
+        os.makedirs(bin_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            if force or not os.path.exists(ytdlp_path):
+                pool.submit(install_ytdlp, ytdlp_path, log, mirror)
+            if force or not os.path.exists(ffmpeg_path):
+                pool.submit(install_ffmpeg, bin_dir, ffmpeg_path, log, mirror)
+    finally:
+        _tools_lock.release()
+
+PROGRESS_MARKER = "[simpledlp-progress]"
+PROGRESS_TEMPLATE = (
+    "download:" + PROGRESS_MARKER +
+    " %(progress.downloaded_bytes)s %(progress.total_bytes)s %(progress.total_bytes_estimate)s"
+    " %(progress.speed)s %(progress.eta)s %(progress.fragment_index)s %(progress.fragment_count)s"
+)
+PROGRESS_UPDATE_INTERVAL = 0.25
+
+Progress = collections.namedtuple("Progress", "downloaded total speed eta fragment fragment_count")
+
+def _progress_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def parse_progress_line(line):
+    if not line.startswith(PROGRESS_MARKER):
+        return None
+    fields = line[len(PROGRESS_MARKER):].split()
+    if len(fields) != 7:
+        return None
+    downloaded, total, estimate, speed, eta, fragment, fragment_count = (_progress_number(v) for v in fields)
+    return Progress(downloaded, total or estimate, speed, eta, fragment, fragment_count)
+
+def progress_fraction(progress):
+    if progress.downloaded is not None and progress.total:
+        return min(progress.downloaded / progress.total, 1.0)
+    if progress.fragment is not None and progress.fragment_count:
+        return min(progress.fragment / progress.fragment_count, 1.0)
+    return None
+
+def format_size(num):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(num) < 1024:
+            return f"{num:.1f} {unit}"
+        num /= 1024
+    return f"{num:.1f} TiB"
+
+def format_progress(progress):
+    parts = []
+    fraction = progress_fraction(progress)
+    if fraction is not None:
+        parts.append(f"{fraction * 100:.1f}%")
+    if progress.downloaded is not None:
+        parts.append(format_size(progress.downloaded))
+    if progress.speed:
+        parts.append(f"{format_size(progress.speed)}/s")
+    if progress.eta is not None:
+        minutes, seconds = divmod(int(progress.eta), 60)
+        parts.append(f"ETA {minutes}:{seconds:02d}")
+    if progress.fragment is not None and progress.fragment_count:
+        parts.append(f"frag {int(progress.fragment)}/{int(progress.fragment_count)}")
+    return " ".join(parts)
+
+def format_metrics(metrics):
+    parts = []
+    if metrics.cpu_percent is not None:
+        parts.append(f"CPU {metrics.cpu_percent:.0f}%")
+    if metrics.rss is not None:
+        parts.append(format_size(metrics.rss))
+    if metrics.ffmpeg_speed is not None:
+        parts.append(f"{metrics.ffmpeg_speed:g}x")
+    if metrics.ffmpeg_fps:
+        parts.append(f"{metrics.ffmpeg_fps:g} fps")
+    if metrics.retries:
+        parts.append(f"повторов: {metrics.retries}")
+    return " · ".join(parts)
+
+def stream_slug(url):
+    # Папка канала из хоста и пути плюс короткий хэш ссылки: https://www.twitch.tv/somechannel ->
+    # twitch_tv_somechannel-1a2b3c. youtube.com/@foo/live и youtube.com/@bar/live не попадут в одну папку
+    parts = urllib.parse.urlsplit(url.strip() if "://" in url else "https://" + url.strip())
+    host = parts.netloc.lower().rsplit("@", 1)[-1].split(":", 1)[0]
+    if host.startswith("www."):
+        host = host[4:]
+    name = re.sub(r'[^0-9A-Za-z_-]+', '_', host + "/" + parts.path).strip("_")[:40].strip("_")
+    digest = hashlib.sha1(normalize_url(url).encode("utf-8")).hexdigest()[:6]
+    return f"{name or 'stream'}-{digest}"
+
+def new_session_dir(channel_dir):
+    # Своя папка на каждую сессию записи: сегменты разных сессий не смешиваются, а сторож и склейка
+    # видят только файлы своей сессии
+    stamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+    for n in itertools.count(1):
+        path = os.path.join(channel_dir, stamp if n == 1 else f"{stamp}_{n}")
+        try:
+            os.makedirs(path)
+            return path
+        except FileExistsError:
+            continue
+
+def stream_output_args(vods_dir, url, segment_minutes, segment_format):
+    # Сегменты с уникальными именами: при сбое теряется только незакрытый кусок, а не вся запись
+    ext = "ts" if segment_format == "ts" else "mp4"
+    pattern = os.path.join(vods_dir, f"{stream_slug(url)}_%Y-%m-%d_%H-%M-%S.{ext}")
+    args = ["-hide_banner", "-loglevel", "warning", "-map", "0:v?", "-map", "0:a?", "-c", "copy", "-f", "segment", "-strftime", "1", "-reset_timestamps", "1"]
+    if segment_minutes > 0:
+        args += ["-segment_time", str(int(segment_minutes * 60))]
+    else:
+        args += ["-segment_time", str(10 ** 9)]
+    if ext == "ts":
+        args += ["-segment_format", "mpegts"]
+    else:
+        # Фрагментированный mp4 остается читаемым даже без финального moov
+        args += ["-segment_format", "mp4", "-segment_format_options", "movflags=+frag_keyframe+empty_moov+default_base_moof"]
+    return args + [pattern]
+
+# "live" - streamlink | ffmpeg с нарезкой на сегменты; "from-start" - yt-dlp --live-from-start одним файлом,
+# фрагменты с начала эфира качаются параллельно, и отставание догоняется быстрее реального времени
+STREAM_CAPTURE_MODES = ("live", "from-start")
+STREAMLINK_MAX_SEGMENT_THREADS = 10
+
+def streamlink_source_cmd(streamlink_path, url, segment_threads=1, prefetch_segments=3):
+    # --hls-live-restart начинает с начала окна DVR; сегменты качаются в segment_threads потоков,
+    # prefetch_segments - сколько сегментов от края эфира запрашивается сразу при подключении
+    threads = min(max(int(segment_threads), 1), STREAMLINK_MAX_SEGMENT_THREADS)
+    return [streamlink_path, "--hls-live-restart", "--stream-segment-threads", str(threads),
+            "--hls-live-edge", str(max(int(prefetch_segments), 1)), "-O", "--", url, "best"]
+
+WATCH_MAX_BACKOFF = 15 * 60
+WATCH_CHECK_THREADS = 4
+WATCH_CHECK_TIMEOUT = 60
+
+def check_stream_live(streamlink_path, url):
+    # True - канал в эфире, False - не в эфире, исключение - не удалось проверить
+    try:
+        import streamlink
+    except ImportError:
+        streamlink = None
+    if streamlink is not None:
+        session = streamlink.Streamlink()
+        # Без таймаута зависший сайт навсегда занял бы поток из пула проверок
+        session.set_option("http-timeout", WATCH_CHECK_TIMEOUT)
+        try:
+            return bool(session.streams(url))
+        except streamlink.StreamlinkError as e:
+            raise RuntimeError(str(e))
+    result = subprocess.run([streamlink_path, "--json", "--", url], capture_output=True, text=True,
+                            encoding="utf-8", errors="replace", timeout=WATCH_CHECK_TIMEOUT)
+    try:
+        data = json.loads(result.stdout)
+    except ValueError:
+        raise RuntimeError(result.stderr.strip() or f"streamlink exit code {result.returncode}")
+    if data.get("streams"):
+        return True
+    error = data.get("error", "")
+    if "No playable streams" in error:
+        return False
+    raise RuntimeError(error or f"streamlink exit code {result.returncode}")
+
+class ChannelWatcher:
+    # Один поток-планировщик и небольшой пул проверок на все каналы
+    def __init__(self, check_live, on_live, is_busy, interval=WATCH_INTERVAL, on_error=None):
+        self.check_live = check_live
+        self.on_live = on_live
+        self.is_busy = is_busy
+        self.on_error = on_error
+        self.interval = interval
+        self._failures = {}
+        self._heap = []
+        # Смена списка каналов отбрасывает проверки, запланированные для старого списка
+        self._generation = 0
+        self._cond = threading.Condition()
+        # Пул создается с первым каналом: без отслеживания каналов на старте не нужен даже concurrent.futures
+        self._executor = None
+        self._thread = None
+
+    def channels(self):
+        with self._cond:
+            return list(self._failures)
+
+    def set_channels(self, urls):
+        with self._cond:
+            self._failures = {url: self._failures.get(url, 0) for url in urls}
+            self._generation += 1
+            now = time.monotonic()
+            self._heap = [(now + random.uniform(0, 5), self._generation, url) for url in urls]
+            heapq.heapify(self._heap)
+            if self._thread is None and urls:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=WATCH_CHECK_THREADS)
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _delay(self, failures):
+        delay = min(self.interval * (2 ** failures), WATCH_MAX_BACKOFF)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _schedule(self, url, delay, generation):
+        with self._cond:
+            if generation != self._generation or url not in self._failures:
+                return
+            heapq.heappush(self._heap, (time.monotonic() + delay, generation, url))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                _, generation, url = heapq.heappop(self._heap)
+            if self.is_busy(url):
+                self._schedule(url, self._delay(0), generation)
+                continue
+            self._executor.submit(self._check, url, generation)
+
+    def _check(self, url, generation):
+        try:
+            live = self.check_live(url)
+        except Exception as e:
+            with self._cond:
+                if url in self._failures:
+                    self._failures[url] += 1
+                failures = self._failures.get(url, 0)
+            if self.on_error:
+                self.on_error(url, e)
+            self._schedule(url, self._delay(failures), generation)
+            return
+        with self._cond:
+            if url in self._failures:
+                self._failures[url] = 0
+        if live:
+            self.on_live(url)
+        self._schedule(url, self._delay(0), generation)
+
+def popen_job(cmd, **kwargs):
+    # Отдельная группа процессов, чтобы остановка задачи не задевала GUI и соседние задачи
+    if sys.platform == "win32":
+        kwargs.setdefault("creationflags", subprocess.CREATE_NEW_PROCESS_GROUP)
+    else:
+        kwargs.setdefault("start_new_session", True)
+    return subprocess.Popen(cmd, **kwargs)
+
+def kill_process_tree(process):
+    if sys.platform == "win32":
+        subprocess.call(['taskkill', '/F', '/T', '/PID', str(process.pid)])
+    else:
+        os.killpg(os.getpgid(process.pid), 9)
+
+PIPE_BUFFER_SIZE = 1024 * 1024
+STREAM_STOP_TIMEOUT = 10
+STREAM_WATCHDOG_INTERVAL = 2
+STREAM_RECONNECT_DELAY = 1
+STREAM_RECONNECT_MAX_DELAY = 60
+STREAM_HEALTHY_SECONDS = 30
+
+def enlarge_pipe(pipe):
+    # Больший буфер канала сглаживает рывки HLS-сегментов между streamlink и ffmpeg (только Linux)
+    if sys.platform.startswith("linux"):
+        import fcntl
+        try:
+            fcntl.fcntl(pipe.fileno(), getattr(fcntl, "F_SETPIPE_SZ", 1031), PIPE_BUFFER_SIZE)
+        except OSError:
+            pass
+
+class StreamPipeline:
+    # streamlink | ffmpeg как два процесса, соединенных каналом ОС, без промежуточной оболочки.
+    # Сторож следит за ростом файлов: если данных нет stall_seconds или streamlink упал с ошибкой,
+    # захват перезапускается в новый сегмент с растущей паузой, не больше retries раз подряд
+    # Без sink_cmd захват - один процесс (yt-dlp --live-from-start), который сам пишет файл
+    def __init__(self, source_cmd, sink_cmd=None, health=None, stall_seconds=0, retries=0, on_reconnect=None):
+        self.source_cmd = source_cmd
+        self.sink_cmd = sink_cmd
+        self.health = health
+        self.stall_seconds = stall_seconds
+        self.retries = retries
+        self.on_reconnect = on_reconnect
+        self.returncode = None
+        self.error = None
+        read_fd, self._write_fd = os.pipe()
+        try:
+            self._spawn()
+        except Exception:
+            os.close(read_fd)
+            os.close(self._write_fd)
+            raise
+        # Сообщения обоих процессов приходят в один поток строк; канал закрывается, когда захват окончен совсем
+        self.stdout = io.open(read_fd, "r", encoding="utf-8", errors="replace")
+        self._stopping = threading.Event()
+        self._done = threading.Event()
+        threading.Thread(target=self._supervise, daemon=True).start()
+
+    @property
+    def processes(self):
+        if self.sink is self.source:
+            return (self.source,)
+        return (self.source, self.sink)
+
+    def _spawn(self):
+        if self.sink_cmd is None:
+            self.source = self.sink = popen_job(self.source_cmd, stdout=self._write_fd, stderr=self._write_fd)
+            self.spawned_at = time.time()
+            return
+        self.source = popen_job(self.source_cmd, stdout=subprocess.PIPE, stderr=self._write_fd)
+        enlarge_pipe(self.source.stdout)
+        try:
+            self.sink = popen_job(self.sink_cmd, stdin=self.source.stdout, stdout=self._write_fd, stderr=self._write_fd)
+        except Exception:
+            kill_process_tree(self.source)
+            raise
+        # Канал теперь читает только ffmpeg
+        self.source.stdout.close()
+        self.spawned_at = time.time()
+
+    def _watch(self):
+        # None - захват закончился штатно или остановлен, иначе причина для перезапуска
+        while True:
+            try:
+                self.sink.wait(timeout=STREAM_WATCHDOG_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if self._stopping.is_set() or not self.stall_seconds or self.health is None:
+                continue
+            _, last_data = self.health()
+            idle = time.time() - max(last_data or 0, self.spawned_at)
+            if idle >= self.stall_seconds:
+                return f"нет данных {int(idle)} с"
+        try:
+            self.source.wait(timeout=STREAM_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            kill_process_tree(self.source)
+            self.source.wait()
+        self.returncode = self.sink.returncode or self.source.returncode
+        if self._stopping.is_set() or self.returncode == 0:
+            return None
+        return f"код выхода {self.returncode}"
+
+    def _recovered(self):
+        # Новый файл сегмента появляется сразу при запуске, поэтому восстановлением считаем
+        # только запись, продолжавшуюся хотя бы STREAM_HEALTHY_SECONDS
+        if self.health is None:
+            return False
+        _, last_data = self.health()
+        return last_data is not None and last_data - self.spawned_at >= STREAM_HEALTHY_SECONDS
+
+    def _supervise(self):
+        attempt = 0
+        try:
+            while True:
+                reason = self._watch()
+                if reason is None:
+                    break
+                # Запись после прошлого перезапуска шла нормально - сбой новый, а не продолжение старого
+                if self._recovered():
+                    attempt = 0
+                if attempt >= self.retries:
+                    self.error = reason
+                    self._stop_current()
+                    self.returncode = self.returncode or 1
+                    break
+                delay = min(STREAM_RECONNECT_DELAY * 2 ** attempt, STREAM_RECONNECT_MAX_DELAY)
+                attempt += 1
+                if self.on_reconnect:
+                    self.on_reconnect(reason, attempt, delay)
+                self._stop_current()
+                if self._stopping.wait(delay):
+                    break
+                try:
+                    self._spawn()
+                except OSError as e:
+                    self.error = str(e)
+                    self.returncode = -1
+                    break
+                # stop() мог прийти, пока процессы запускались заново
+                if self._stopping.is_set():
+                    self._stop_current()
+                    break
+        finally:
+            os.close(self._write_fd)
+            self._done.set()
+
+    def poll(self):
+        return self.returncode if self._done.is_set() else None
+
+    def wait(self):
+        self._done.wait()
+        return self.returncode
+
+    def stop(self):
+        # Останавливаем streamlink: ffmpeg получает EOF и сам закрывает файл
+        self._stopping.set()
+        if self.sink is not self.source and self.source.poll() is None:
+            self.source.terminate()
+        threading.Thread(target=self._finish_stop, args=(self.sink,), daemon=True).start()
+
+    def _stop_current(self):
+        # Перед перезапуском текущий сегмент закрывается так же штатно, как при остановке
+        if self.sink is not self.source and self.source.poll() is None:
+            self.source.terminate()
+        self._finish_stop(self.sink)
+        if self.source.poll() is None:
+            kill_process_tree(self.source)
+
+    def _finish_stop(self, sink):
+        # Одиночному yt-dlp EOF ждать неоткуда - сразу прерывание, как Ctrl+C, чтобы он дописал файл
+        if sink is not self.source:
+            try:
+                sink.wait(timeout=STREAM_STOP_TIMEOUT)
+                return
+            except subprocess.TimeoutExpired:
+                pass
+        try:
+            if sys.platform == "win32":
+                sink.terminate()
+            else:
+                sink.send_signal(signal.SIGINT)
+            sink.wait(timeout=STREAM_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            kill_process_tree(sink)
+        except OSError:
+            pass
+
+def output_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, kind, url, cmd):
+        self.id = next(Job._ids)
+        self.kind = kind
+        self.url = url
+        self.cmd = cmd
+        self.state = JOB_QUEUED
+        self.process = None
+        self.returncode = None
+        self.error = None
+        self.stop_requested = False
+        self.temp_files = []
+        self.progress = None
+        self.started_at = None
+        # Параметры, по которым задачу можно создать заново после перезапуска
+        self.spec = None
+        self.metrics = JobMetrics()
+
+    def is_active(self):
+        return self.state in (JOB_QUEUED, JOB_RUNNING)
+
+    def start(self):
+        return popen_job(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                         text=True, encoding="utf-8", errors="replace", bufsize=1)
+
+    def stop_process(self, process):
+        kill_process_tree(process)
+
+    def finished(self):
+        pass
+
+    def disk_usage(self):
+        # (байт записано, когда последний раз росли файлы) для метрик
+        if self.progress is not None and self.progress.downloaded is not None:
+            return int(self.progress.downloaded), None
+        return None, None
+
+class PostProcessJob(Job):
+    def __init__(self, plan, ffmpeg_path):
+        self.source = plan.source
+        self.target = plan.target()
+        self.output = self.target
+        if os.path.normcase(self.target) == os.path.normcase(self.source):
+            self.output = f"{plan.base}.pp.{plan.ext}"
+        super().__init__("post", os.path.basename(self.target), plan.command(ffmpeg_path, self.output))
+        self.steps = plan.steps
+        self.side_files = plan.side_files
+
+    def finished(self):
+        # Исходник заменяется только после успешной обработки, недописанный результат удаляется сразу
+        if self.state != JOB_DONE:
+            if os.path.exists(self.output):
+                os.remove(self.output)
+            return
+        if self.output != self.target:
+            os.replace(self.output, self.target)
+        else:
+            os.remove(self.source)
+        for path in self.side_files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def disk_usage(self):
+        return output_size(self.output), None
+
+class VodJob(Job):
+    def __init__(self, url, cmd, output):
+        super().__init__("vod", url, cmd)
+        self.output = output
+
+    def disk_usage(self):
+        return output_size(self.output), None
+
+    def finished(self):
+        if self.state != JOB_DONE and os.path.exists(self.output):
+            os.remove(self.output)
+
+class PlaylistJob(Job):
+    def __init__(self, url, cmd, sync_stop):
+        super().__init__("playlist", url, cmd)
+        self.sync_stop = sync_stop
+        self.pending = []
+        self.found = 0
+        self.queued = 0
+        self.known_streak = 0
+        self.synced = False
+
+    def finished(self):
+        # Перебор, прерванный на уже скачанных видео, - штатное завершение синхронизации
+        if self.synced and not self.stop_requested:
+            self.state = JOB_DONE
+            self.error = None
+
+class StreamSession(Job):
+    def __init__(self, url, cmd, output_dir, stall_seconds=0, retries=0, log=print):
+        super().__init__("stream", url, cmd)
+        self.output_dir = output_dir
+        self.vod_queued = False
+        self.stall_seconds = stall_seconds
+        self.retries = retries
+        self.log = log
+        self.pipeline = None
+
+    def segments(self):
+        # Сегменты, записанные в этой сессии, по порядку имен (в имени - время начала)
+        if self.started_at is None:
+            return []
+        paths = []
+        with os.scandir(self.output_dir) as entries:
+            for entry in entries:
+                stem = os.path.splitext(entry.name)[0]
+                # .part и служебные файлы yt-dlp в склейку не попадают
+                if (entry.is_file() and entry.name.lower().endswith(VOD_EXTENSIONS) and not stem.endswith(VOD_SUFFIX)
+                        and entry.stat().st_mtime >= self.started_at):
+                    paths.append(entry.path)
+        return sorted(paths)
+
+    def start(self):
+        source_cmd, sink_cmd = self.cmd
+        self.pipeline = StreamPipeline(source_cmd, sink_cmd, self.health, self.stall_seconds, self.retries,
+                                       self._reconnecting)
+        return self.pipeline
+
+    def _reconnecting(self, reason, attempt, delay):
+        self.metrics.retries += 1
+        self.log(f"[#{self.id}] Перезапуск записи ({reason}), попытка {attempt}/{self.retries} через {delay} с")
+
+    def stop_process(self, process):
+        process.stop()
+
+    def finished(self):
+        if self.pipeline is not None and self.pipeline.error and self.state == JOB_FAILED:
+            self.error = self.error or self.pipeline.error
+
+    def disk_usage(self):
+        return self.health()
+
+    def health(self):
+        # Сколько записано в этой сессии и когда файлы последний раз росли
+        total = 0
+        last_data = None
+        if self.started_at is None:
+            return total, last_data
+        try:
+            with os.scandir(self.output_dir) as entries:
+                for entry in entries:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    if st.st_mtime >= self.started_at:
+                        total += st.st_size
+                        last_data = st.st_mtime if last_data is None else max(last_data, st.st_mtime)
+        except OSError:
+            pass
+        return total, last_data
+
+class JobQueue:
+    def __init__(self, workers, on_update, on_output=None, name=""):
+        self.name = name
+        self.jobs = []
+        self.workers = 0
+        self.on_update = on_update
+        self.on_output = on_output
+        self._pending = collections.deque()
+        self._cond = threading.Condition()
+        self._threads = 0
+        # Задачи, чьи завершающие обработчики еще выполняются (они могут поставить новые задачи)
+        self._finishing = 0
+        # Приостановленная очередь не берет новые задачи, уже запущенные продолжают работу
+        self.paused = False
+        self.resize(workers)
+
+    def resize(self, workers):
+        with self._cond:
+            self.workers = max(1, int(workers))
+            while self._threads < self.workers:
+                self._threads += 1
+                threading.Thread(target=self._worker, daemon=True).start()
+            # Лишние потоки завершатся сами, когда освободятся
+            self._cond.notify_all()
+
+    def pause(self):
+        with self._cond:
+            self.paused = True
+
+    def resume(self):
+        with self._cond:
+            self.paused = False
+            self._cond.notify_all()
+
+    def submit(self, job):
+        with self._cond:
+            self.jobs.append(job)
+            self._pending.append(job)
+            self._cond.notify()
+        self.on_update(job)
+        return job
+
+    def stop(self, job):
+        with self._cond:
+            job.stop_requested = True
+            process = job.process
+            if job.state == JOB_QUEUED:
+                job.state = JOB_STOPPED
+                if job in self._pending:
+                    self._pending.remove(job)
+        if process and process.poll() is None:
+            job.stop_process(process)
+        self.on_update(job)
+
+    def stop_all(self):
+        for job in list(self.jobs):
+            if job.is_active():
+                self.stop(job)
+
+    def has_active(self):
+        with self._cond:
+            return self._finishing > 0 or any(job.is_active() for job in self.jobs)
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                if self._threads > self.workers:
+                    self._threads -= 1
+                    return None
+                if self._pending and not self.paused:
+                    job = self._pending.popleft()
+                    job.state = JOB_RUNNING
+                    job.started_at = time.time()
+                    self._finishing += 1
+                    return job
+                self._cond.wait()
+
+    def _read_output(self, job, process):
+        # Построчное чтение вместо communicate(): вывод многочасовой загрузки не копится в памяти
+        last_update = 0
+        for line in process.stdout:
+            line = line.rstrip()
+            if not line:
+                continue
+            progress = parse_progress_line(line)
+            if progress is None:
+                if self.on_output:
+                    self.on_output(job, line)
+                continue
+            job.progress = progress
+            now = time.monotonic()
+            if now - last_update >= PROGRESS_UPDATE_INTERVAL:
+                last_update = now
+                self.on_update(job)
+        process.stdout.close()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            self.on_update(job)
+            try:
+                process = job.start()
+                with self._cond:
+                    job.process = process
+                    stop_now = job.stop_requested
+                if stop_now:
+                    job.stop_process(process)
+                self._read_output(job, process)
+                job.returncode = process.wait()
+            except Exception as e:
+                job.error = str(e)
+                job.returncode = -1
+            for path in job.temp_files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            with self._cond:
+                job.process = None
+                if job.stop_requested:
+                    job.state = JOB_STOPPED
+                elif job.returncode == 0:
+                    job.state = JOB_DONE
+                else:
+                    job.state = JOB_FAILED
+            try:
+                job.finished()
+            except OSError as e:
+                job.error = job.error or str(e)
+            try:
+                self.on_update(job)
+            finally:
+                with self._cond:
+                    self._finishing -= 1
+
+def parse_url_list(text):
+    # Строки и пробелы разделяют ссылки, '#' и ';' - комментарии как в --batch-file yt-dlp
+    urls = []
+    seen = set()
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith(("#", ";")):
+            continue
+        for url in line.split():
+            if url not in seen:
+                seen.add(url)
+                urls.append(url)
+    return urls
+
+def chunk_urls(urls, parts):
+    parts = max(1, min(parts, len(urls)))
+    size, extra = divmod(len(urls), parts)
+    chunks = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(urls[start:end])
+        start = end
+    return chunks
+
+def write_batch_file(urls):
+    fd, path = tempfile.mkstemp(prefix="simpledlp-batch-", suffix=".txt")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write("\n".join(urls) + "\n")
+    return path
+
+# Ссылки, для которых ID можно получить без запроса к сайту: (шаблон, ключ экстрактора yt-dlp, префикс ID)
+ARCHIVE_URL_PATTERNS = [
+    (re.compile(r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|live/|embed/)|youtu\.be/)([0-9A-Za-z_-]{11})'), "youtube", ""),
+    (re.compile(r'vimeo\.com/(?:video/)?(\d+)'), "vimeo", ""),
+    (re.compile(r'twitch\.tv/(?:[^/]+/)?videos/(\d+)'), "twitchvod", "v"),
+    (re.compile(r'dailymotion\.com/video/([0-9A-Za-z]+)'), "dailymotion", ""),
+]
+
+def archive_key(url):
+    for pattern, extractor, prefix in ARCHIVE_URL_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return f"{extractor} {prefix}{match.group(1)}"
+    return None
+
+class DownloadArchive:
+    # Тот же формат, что и у --download-archive: строки "<экстрактор> <id>"
+    def __init__(self, path):
+        self.path = path
+        self._keys = set()
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.path, "r", encoding="utf-8", errors="ignore") as f:
+            self._keys = {line.strip() for line in f if line.strip()}
+        self._mtime = mtime
+
+    def __contains__(self, key):
+        with self._lock:
+            self._reload()
+            return key in self._keys
+
+    def filter(self, urls):
+        fresh, skipped = [], []
+        for url in urls:
+            key = archive_key(url)
+            if key is not None and key in self:
+                skipped.append(url)
+            else:
+                fresh.append(url)
+        return fresh, skipped
+
+# Плейлисты и каналы перебираются лениво (--flat-playlist --lazy-playlist): записи идут в очередь
+# по мере обнаружения, а при синхронизации перебор обрывается на уже скачанных видео
+PLAYLIST_URL_PATTERNS = [
+    re.compile(r'youtube\.com/(?:playlist\?|@[^/?#]+|c/|channel/|user/)'),
+    re.compile(r'[?&]list=[0-9A-Za-z_-]+'),
+    re.compile(r'twitch\.tv/[^/?#]+/(?:videos|clips)(?:[/?#]|$)'),
+    re.compile(r'vimeo\.com/(?:channels|showcase|album)/'),
+]
+PLAYLIST_ENTRY_MARKER = "[simpledlp-entry]"
+PLAYLIST_ENTRY_TEMPLATE = PLAYLIST_ENTRY_MARKER + " %(ie_key,extractor_key)s %(id)s %(webpage_url,url)s"
+PLAYLIST_WORKERS = 2
+PLAYLIST_FLUSH_SIZE = 20
+PLAYLIST_SYNC_STOP = 3
+
+def is_playlist_url(url):
+    return any(pattern.search(url) for pattern in PLAYLIST_URL_PATTERNS)
+
+def parse_playlist_entry(line):
+    # (ключ архива или None, ссылка) для строки, напечатанной yt-dlp по шаблону PLAYLIST_ENTRY_TEMPLATE
+    if not line.startswith(PLAYLIST_ENTRY_MARKER):
+        return None
+    fields = line[len(PLAYLIST_ENTRY_MARKER):].split(None, 2)
+    if len(fields) != 3 or fields[2] == "NA":
+        return None
+    ie_key, entry_id, url = fields
+    key = archive_key(url)
+    if key is None and ie_key != "NA" and entry_id != "NA":
+        key = f"{ie_key.lower()} {entry_id}"
+    return key, url
+
+INFO_CACHE_TTL = 60 * 60
+INFO_CACHE_MAX_ENTRIES = 200
+INFO_FETCH_TIMEOUT = 120
+TRACKING_PARAMS = {"si", "feature", "pp", "fbclid", "gclid", "ref", "ref_src"}
+
+def normalize_url(url):
+    # Одна запись кэша на видео, как бы ни выглядела ссылка
+    key = archive_key(url)
+    if key is not None:
+        return key
+    parts = urllib.parse.urlsplit(url.strip())
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+             if k not in TRACKING_PARAMS and not k.startswith("utm_")]
+    netloc = parts.netloc.lower()
+    if netloc.startswith("www."):
+        netloc = netloc[4:]
+    return urllib.parse.urlunsplit((parts.scheme.lower(), netloc, parts.path.rstrip("/"), urllib.parse.urlencode(sorted(query)), ""))
+
+def is_http_url(url):
+    parts = urllib.parse.urlsplit(url)
+    return parts.scheme.lower() in ("http", "https") and bool(parts.netloc)
+
+class InfoCache:
+    # Результаты yt-dlp -J на диске: TTL по mtime, вытеснение самых давно использованных по atime
+    def __init__(self, directory, ttl=INFO_CACHE_TTL, max_entries=INFO_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._locks = collections.defaultdict(threading.Lock)
+        self._locks_guard = threading.Lock()
+
+    def path_for(self, url):
+        digest = hashlib.sha1(normalize_url(url).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ".info.json")
+
+    def get(self, url):
+        path = self.path_for(url)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        if time.time() - mtime > self.ttl:
+            return None
+        os.utime(path, (time.time(), mtime))
+        return path
+
+    def fetch(self, url, ytdlp_cmd):
+        # Один запуск экстрактора на ссылку, даже если ее запросили одновременно из нескольких мест
+        with self._locks_guard:
+            lock = self._locks[normalize_url(url)]
+        with lock:
+            path = self.get(url)
+            if path:
+                return path
+            result = subprocess.run(ytdlp_cmd + ["-J", "--no-playlist", "--", url], capture_output=True, text=True,
+                                    encoding="utf-8", errors="replace", timeout=INFO_FETCH_TIMEOUT)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"yt-dlp exit code {result.returncode}")
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.path_for(url)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(result.stdout)
+            os.replace(tmp_path, path)
+            self.evict()
+            return path
+
+    def load(self, url, ytdlp_cmd):
+        path = self.get(url) or self.fetch(url, ytdlp_cmd)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def evict(self):
+        now = time.time()
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(".info.json"):
+                        st = entry.stat()
+                        if now - st.st_mtime > self.ttl:
+                            os.remove(entry.path)
+                        else:
+                            entries.append((st.st_atime, entry.path))
+        except OSError:
+            return
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def format_table(info):
+    rows = [("ID", "EXT", "RESOLUTION", "FPS", "VCODEC", "ACODEC", "SIZE", "NOTE")]
+    for f in info.get("formats") or []:
+        size = f.get("filesize") or f.get("filesize_approx")
+        fps = f.get("fps")
+        rows.append((
+            str(f.get("format_id", "")),
+            str(f.get("ext", "")),
+            str(f.get("resolution") or ("audio only" if f.get("vcodec") == "none" else "")),
+            str(int(fps)) if fps else "",
+            str(f.get("vcodec") or ""),
+            str(f.get("acodec") or ""),
+            format_size(size) if size else "",
+            str(f.get("format_note") or ""),
+        ))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows)
+
+# Профили скорости: число одновременных фрагментов HLS/DASH, aria2c с несколькими соединениями
+# на файл и размер HTTP-чанка. Профиль "custom" задается в config.json (CUSTOM_PROFILE)
+DOWNLOAD_PROFILES = {
+    "safe": {"fragments": 1, "aria2c": False, "connections": 1, "split": 1, "chunk_size": ""},
+    "balanced": {"fragments": 4, "aria2c": False, "connections": 1, "split": 1, "chunk_size": "10M"},
+    "fast": {"fragments": 8, "aria2c": False, "connections": 1, "split": 1, "chunk_size": "10M"},
+    "aria2c": {"fragments": 8, "aria2c": True, "connections": 16, "split": 16, "chunk_size": ""},
+}
+RATE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+def parse_rate(text):
+    # "5M" -> 5242880 байт/с, пусто или 0 - без ограничения
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([KMG]?)(?:i?B?)?\s*", str(text or "0"), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"неверное ограничение скорости: {text}")
+    return int(float(match.group(1)) * RATE_UNITS[match.group(2).upper()])
+
+def download_profile(settings):
+    name = settings["DOWNLOAD_PROFILE"]
+    if name == "custom":
+        return dict(DOWNLOAD_PROFILES["balanced"], **settings["CUSTOM_PROFILE"])
+    return DOWNLOAD_PROFILES.get(name, DOWNLOAD_PROFILES["balanced"])
+
+def performance_args(profile, rate_limit, processes, aria2c_path=None):
+    args = []
+    if profile["fragments"] > 1:
+        args += ['--concurrent-fragments', str(profile["fragments"])]
+    if profile["aria2c"] and aria2c_path:
+        args += ['--downloader', aria2c_path,
+                 '--downloader-args', f"aria2c:-x {profile['connections']} -s {profile['split']} -k 1M"]
+    elif profile["chunk_size"]:
+        args += ['--http-chunk-size', profile["chunk_size"]]
+    # --limit-rate действует на один процесс, поэтому общий лимит делим между потоками загрузки
+    limit = parse_rate(rate_limit)
+    if limit:
+        args += ['--limit-rate', str(max(limit // max(processes, 1), 1024))]
+    return args
+
+DEFAULT_SETTINGS = {
+    "TOOLS_MIRROR": "",
+    "MAX_WORKERS": 3,
+    "MAX_STREAMS": 4,
+    "WATCH_CHANNELS": [],
+    "WATCH_INTERVAL": WATCH_INTERVAL,
+    "STREAM_SEGMENT_MINUTES": 30,
+    "STREAM_SEGMENT_FORMAT": "mp4",
+    # Запись без новых данных столько секунд перезапускается в новый сегмент; 0 - не следить
+    "STREAM_STALL_SECONDS": 20,
+    # Перезапусков подряд без новых данных, после которых запись считается завершившейся с ошибкой
+    "STREAM_RECONNECT_RETRIES": 5,
+    # "live" или "from-start" (см. STREAM_CAPTURE_MODES)
+    "STREAM_CAPTURE_MODE": "live",
+    # Параллельная загрузка сегментов: streamlink --stream-segment-threads (до 10), yt-dlp --concurrent-fragments
+    "STREAM_SEGMENT_THREADS": 4,
+    # streamlink --hls-live-edge: сколько последних сегментов берется сразу при подключении
+    "STREAM_PREFETCH_SEGMENTS": 3,
+    # 0 - локальный HTTP API выключен
+    "API_PORT": 0,
+    # Файл cookies для задач из HTTP API: путь из запроса не принимается - yt-dlp перезаписывает этот файл
+    "API_COOKIES": "",
+    "DOWNLOAD_PROFILE": "balanced",
+    "CUSTOM_PROFILE": {},
+    # Общий лимит скорости всех загрузок видео, например "5M"; "0" - без ограничения
+    "RATE_LIMIT": "0",
+    "AUDIO_FORMAT": "mp3",
+    # "0" - наилучшее качество кодировщика
+    "AUDIO_BITRATE": "192K",
+    # 0 - по числу ядер процессора
+    "POSTPROCESS_WORKERS": 0,
+    # "" - оставить контейнер yt-dlp (слияние в mp4), "mp4" или "mkv" - перепаковать
+    "REMUX_CONTAINER": "",
+    # Дополнительные шаги постобработки: "metadata", "thumbnail", "loudnorm"
+    "POSTPROCESSORS": [],
+    # Склейка сегментов записи после окончания стрима: "off", "remux" или "h264"
+    "VOD_TRANSCODE": "off",
+    # Перебор плейлиста останавливается после стольких уже скачанных записей подряд; 0 - перебирать целиком
+    "PLAYLIST_SYNC_STOP": PLAYLIST_SYNC_STOP,
+    # Папки для видео, аудио и записей стримов; "" - videos/ и vods/ рядом с программой
+    "VIDEOS_DIR": "",
+    "AUDIO_DIR": "",
+    "VODS_DIR": "",
+    # Пресет имени файла ("title", "title-id", "channel", "date", "playlist") или свой шаблон yt-dlp
+    "OUTPUT_TEMPLATE": "title",
+    # Меньше стольких ГБ свободно - новые задачи ждут, вдвое меньше - записи стримов останавливаются; 0 - не следить
+    "MIN_FREE_GB": 5,
+    # Хранение записей стримов: старше N дней и сверх N ГБ в сумме удаляются, начиная со старых; 0 - без ограничения
+    "VOD_MAX_AGE_DAYS": 0,
+    "VOD_MAX_TOTAL_GB": 0,
+    # Метрики задач: как часто снимать и дописывать ли их в logs/metrics.jsonl
+    "METRICS_INTERVAL": METRICS_INTERVAL,
+    "METRICS_JSONL": False,
+}
+DEFAULT_QUALITY = "bestvideo+bestaudio"
+
+def load_config(path):
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Ошибка загрузки настроек: {e}")
+    return {}
+
+def atomic_write_json(path, data):
+    # Временный файл в той же папке и os.replace: при сбое остается либо старая, либо новая версия целиком
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def save_config(path, data):
+    try:
+        atomic_write_json(path, data)
+    except Exception as e:
+        print(f"Ошибка сохранения настроек: {e}")
+
+# Допустимые границы числовых настроек (None - без верхней); остальные числа - не меньше 0
+SETTING_LIMITS = {
+    "MAX_WORKERS": (1, None),
+    "MAX_STREAMS": (1, None),
+    "WATCH_INTERVAL": (1, None),
+    "STREAM_SEGMENT_THREADS": (1, None),
+    "STREAM_PREFETCH_SEGMENTS": (1, None),
+    "API_PORT": (0, 65535),
+    "METRICS_INTERVAL": (1, None),
+}
+# Поля CUSTOM_PROFILE: тип и наименьшее значение
+PROFILE_LIMITS = {"fragments": 1, "connections": 1, "split": 1}
+
+def setting_value(key, value, default):
+    # Значение нужного типа или исключение ValueError с понятным текстом
+    if isinstance(default, bool):
+        if not isinstance(value, bool):
+            raise ValueError(f"{key}: ожидается true или false, а не {value!r}")
+        return value
+    if isinstance(default, int):
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"{key}: ожидается число, а не {value!r}")
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError(f"{key}: ожидается целое число, а не {value!r}")
+        minimum, maximum = SETTING_LIMITS.get(key, (0, None))
+        if value < minimum or (maximum is not None and value > maximum):
+            raise ValueError(f"{key}: {value} вне допустимых границ")
+        return value
+    if isinstance(default, str):
+        # Число вместо строки ("RATE_LIMIT": 5000000) принимается как раньше
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        if not isinstance(value, str):
+            raise ValueError(f"{key}: ожидается строка, а не {value!r}")
+        return value
+    if isinstance(default, list):
+        if not isinstance(value, list):
+            raise ValueError(f"{key}: ожидается список, а не {value!r}")
+        return list(value)
+    if isinstance(default, dict):
+        if not isinstance(value, dict):
+            raise ValueError(f"{key}: ожидается объект, а не {value!r}")
+        return dict(value)
+    return value
+
+def custom_profile(data):
+    # Только известные поля нужного типа; неверное поле заменяется значением профиля "balanced"
+    base = DOWNLOAD_PROFILES["balanced"]
+    profile = {}
+    for key, value in data.items():
+        if key not in base:
+            print(f"Ошибка в настройках: неизвестное поле CUSTOM_PROFILE: {key}")
+            continue
+        try:
+            value = setting_value(f"CUSTOM_PROFILE.{key}", value, base[key])
+            if key in PROFILE_LIMITS and value < PROFILE_LIMITS[key]:
+                raise ValueError(f"CUSTOM_PROFILE.{key}: {value} меньше {PROFILE_LIMITS[key]}")
+            if key == "chunk_size" and not re.fullmatch(r"(\d+[KMG]?)?", value, re.IGNORECASE):
+                raise ValueError(f"CUSTOM_PROFILE.chunk_size: неверный размер {value!r}")
+        except ValueError as e:
+            print(f"Ошибка в настройках: {e}")
+            continue
+        profile[key] = value
+    return profile
+
+def engine_settings(data):
+    settings = {}
+    for key, default in DEFAULT_SETTINGS.items():
+        value = data.get(key, default)
+        try:
+            value = setting_value(key, value, default)
+        except ValueError as e:
+            print(f"Ошибка в настройках: {e}, используется {default!r}")
+            value = setting_value(key, default, default)
+        settings[key] = value
+    settings["CUSTOM_PROFILE"] = custom_profile(settings["CUSTOM_PROFILE"])
+    settings["POSTPROCESSORS"] = [name for name in settings["POSTPROCESSORS"] if name in OPTIONAL_POSTPROCESSORS]
+    try:
+        parse_rate(settings["RATE_LIMIT"])
+    except ValueError as e:
+        print(f"Ошибка в настройках: {e}")
+        settings["RATE_LIMIT"] = DEFAULT_SETTINGS["RATE_LIMIT"]
+    return settings
+
+def tools_mirror(settings):
+    # Переменная окружения действует только на этот запуск и в config.json не попадает
+    return os.environ.get("SIMPLEDLP_TOOLS_MIRROR") or settings["TOOLS_MIRROR"]
+
+def tool_paths(base_dir):
+    bin_dir = os.path.join(base_dir, "bin")
+    if sys.platform == "win32":
+        return bin_dir, os.path.join(bin_dir, "yt-dlp.exe"), os.path.join(bin_dir, "ffmpeg.exe")
+    return bin_dir, os.path.join(bin_dir, "yt-dlp"), os.path.join(bin_dir, "ffmpeg")
+
+TOOL_VERSION_TIMEOUT = 15
+
+def file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def probe_version(cmd):
+    # Первая строка "--version" без копирайта ffmpeg; None - утилита не запустилась
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=TOOL_VERSION_TIMEOUT)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    lines = (result.stdout or result.stderr).strip().splitlines()
+    return lines[0].split(" Copyright")[0] if lines else None
+
+class ToolCache:
+    # Пути и версии утилит в cache/tools.json. Пока mtime и размер файла прежние, следующий запуск
+    # обходится одним stat вместо поиска по PATH и запуска утилиты с --version
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def lookup(self, name, path, version_args=("--version",)):
+        # (путь, версия); (None, None) - утилиты нет
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(name)
+            if entry and entry.get("configured") == path and file_stamp(entry["path"]) == entry["stamp"]:
+                return entry["path"], entry["version"]
+            resolved = path if os.path.dirname(path) else shutil.which(path)
+            stamp = file_stamp(resolved) if resolved else None
+            if stamp is None:
+                return None, None
+            version = probe_version([resolved] + list(version_args))
+            entries[name] = {"configured": path, "path": resolved, "stamp": stamp, "version": version}
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                atomic_write_json(self.path, entries)
+            except OSError:
+                pass
+            return resolved, version
+
+JOB_STORE_COMPACT_LINES = 500
+
+class JobStore:
+    # Незавершенные задачи: каждая смена состояния дописывается строкой в jobs.jsonl,
+    # время от времени журнал сворачивается в снимок jobs.json (атомарно) и обнуляется
+    def __init__(self, directory):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, "jobs.json")
+        self.journal_path = os.path.join(directory, "jobs.jsonl")
+        self.records = {}
+        self.closed = False
+        self._journal = None
+        self._lines = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        records = {}
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                records = {int(key): value for key, value in json.load(f).items()}
+        except (OSError, ValueError) as e:
+            if os.path.exists(self.snapshot_path):
+                print(f"Ошибка чтения {self.snapshot_path}: {e}")
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Последняя строка могла оборваться при сбое
+                        continue
+                    if record["state"] in (JOB_QUEUED, JOB_RUNNING):
+                        records[record["id"]] = record
+                    else:
+                        records.pop(record["id"], None)
+        except OSError:
+            pass
+        with self._lock:
+            # Не возобновленные записи переживают сворачивание журнала, пока их не заберет resume_jobs
+            for job_id, record in records.items():
+                self.records.setdefault(job_id, record)
+        return records
+
+    def forget(self, job_ids):
+        with self._lock:
+            for job_id in job_ids:
+                self.records.pop(job_id, None)
+
+    def update(self, job):
+        if job.spec is None:
+            return
+        with self._lock:
+            if self.closed:
+                return
+            previous = self.records.get(job.id)
+            if previous is not None and previous["state"] == job.state:
+                return
+            if previous is None and not job.is_active():
+                return
+            record = {"id": job.id, "kind": job.kind, "url": job.url, "state": job.state, "spec": job.spec}
+            if job.is_active():
+                self.records[job.id] = record
+            else:
+                self.records.pop(job.id, None)
+            try:
+                self._append(record)
+            except OSError as e:
+                print(f"Ошибка записи журнала задач: {e}")
+
+    def _append(self, record):
+        if self._journal is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._lines += 1
+        if self._lines >= JOB_STORE_COMPACT_LINES:
+            self._compact()
+
+    def _compact(self):
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write_json(self.snapshot_path, self.records)
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, "w", encoding="utf-8")
+        self._lines = 0
+
+    def compact(self):
+        with self._lock:
+            try:
+                self._compact()
+            except OSError as e:
+                print(f"Ошибка записи журнала задач: {e}")
+
+    def close(self):
+        # После закрытия остановка задач при выходе не попадает в журнал - они возобновятся при запуске
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            try:
+                self._compact()
+                self._journal.close()
+            except OSError as e:
+                print(f"Ошибка записи журнала задач: {e}")
+            self._journal = None
+
+class Engine:
+    # Загрузки, записи стримов и отслеживание каналов без GUI: общее ядро для gui.py и cli.py
+    def __init__(self, base_dir, settings=None, log=print):
+        self.base_dir = base_dir
+        self.settings = engine_settings(settings or {})
+        self.log = log
+        self.bin_dir, self.ytdlp_path, self.ffmpeg_path = tool_paths(base_dir)
+        self.streamlink_path = "streamlink"
+        self.apply_storage_settings()
+        self.archive_path = os.path.join(base_dir, "archive.txt")
+        self.archive = DownloadArchive(self.archive_path)
+        self.info_cache = InfoCache(os.path.join(base_dir, "cache", "info"))
+        self.tool_cache = ToolCache(os.path.join(base_dir, "cache", "tools.json"))
+        self.store = JobStore(os.path.join(base_dir, "state"))
+        self._stored_jobs = self.store.load()
+        if self._stored_jobs:
+            # Номера продолжаются после записей журнала, даже если эта сессия их не возобновляет:
+            # иначе новая задача с тем же номером затерла бы запись прерванной
+            Job._ids = itertools.count(max(max(self._stored_jobs) + 1, next(Job._ids)))
+        self._listeners = [self.store.update]
+        self._aria2c_warned = False
+        self._resumed = False
+        self.video_queue = JobQueue(self.settings["MAX_WORKERS"], self._job_updated, self._job_output, "video")
+        # Записи стримов идут часами, поэтому у них свой лимит и они не занимают потоки загрузки видео
+        self.stream_queue = JobQueue(self.settings["MAX_STREAMS"], self._job_updated, self._job_output, "stream")
+        # Постобработка в своем пуле по числу ядер: потоки загрузки сразу берут следующую ссылку
+        self.postprocess_queue = JobQueue(postprocess_workers(self.settings["POSTPROCESS_WORKERS"]),
+                                          self._job_updated, self._job_output, "postprocess")
+        self.playlist_queue = JobQueue(PLAYLIST_WORKERS, self._job_updated, self._job_output, "playlist")
+        self.watcher = ChannelWatcher(self._check_live, self._on_channel_live, self.is_recording,
+                                      self.settings["WATCH_INTERVAL"], self._on_watch_error)
+        # Повторный вход: продолжение записи из check_storage снова проверяет место
+        self._storage_lock = threading.RLock()
+        # Удаление старых записей идет вне _storage_lock: постановка задач из окна не ждет обхода диска
+        self._prune_lock = threading.Lock()
+        # Папки, где сейчас мало места, и записи, остановленные из-за этого
+        self._low_space = set()
+        self._storage_stopped = []
+        self._storage_stop = threading.Event()
+        threading.Thread(target=self._storage_monitor, daemon=True).start()
+        metrics_path = os.path.join(base_dir, "logs", "metrics.jsonl") if self.settings["METRICS_JSONL"] else None
+        self.metrics = MetricsCollector(self.jobs, self.log, self.settings["METRICS_INTERVAL"], metrics_path)
+        self.metrics.start()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _job_updated(self, job):
+        for callback in list(self._listeners):
+            callback(job)
+        if job.kind == "stream" and not job.is_active() and not job.vod_queued:
+            job.vod_queued = True
+            self.make_vod(job)
+        if job.kind == "playlist" and not job.is_active():
+            if job.stop_requested:
+                job.pending = []
+            self._flush_playlist(job)
+
+    def _job_output(self, job, line):
+        if handle_output_line(job.metrics, line):
+            return
+        if job.kind == "playlist" and self._playlist_entry(job, line):
+            return
+        downloaded = parse_file_line(line)
+        if downloaded is not None:
+            self.postprocess(*downloaded, audio_only=bool(job.spec and job.spec.get("audio_only")))
+            return
+        self.log(f"[#{job.id}] {line}")
+
+    def postprocess(self, source, acodec, audio_only=False):
+        plan = postprocess_plan(source, acodec, self.settings, audio_only)
+        if plan is None:
+            return None
+        job = self.postprocess_queue.submit(PostProcessJob(plan, self.ffmpeg_path))
+        self.log(f"Постобработка #{job.id} ({', '.join(plan.steps)}) добавлена в очередь: {job.url}")
+        return job
+
+    def make_vod(self, session):
+        mode = self.settings["VOD_TRANSCODE"]
+        # При выходе из программы склейку не начинаем: запись возобновится при следующем запуске
+        if mode not in VOD_MODES or mode == "off" or self.store.closed:
+            return None
+        try:
+            segments = session.segments()
+        except OSError:
+            segments = []
+        if not segments:
+            return None
+        fd, list_path = tempfile.mkstemp(prefix="simpledlp-vod-", suffix=".txt")
+        os.close(fd)
+        write_concat_list(segments, list_path)
+        output = os.path.splitext(segments[0])[0] + VOD_SUFFIX + ".mp4"
+        job = VodJob(session.url, vod_cmd(self.ffmpeg_path, list_path, output, mode), output)
+        job.temp_files.append(list_path)
+        self.postprocess_queue.submit(job)
+        self.log(f"Склейка записи #{job.id} ({len(segments)} сегм., {mode}) добавлена в очередь: {output}")
+        return job
+
+    def missing_tools(self):
+        return [os.path.basename(path) for path in (self.ytdlp_path, self.ffmpeg_path) if not os.path.exists(path)]
+
+    def ensure_tools(self, force=False, wait=False, then=None):
+        # False - на этой платформе утилиты ставятся вручную; then вызывается, когда утилиты на месте
+        def run():
+            ensure_bin_tools_linux(self.bin_dir, self.ytdlp_path, self.ffmpeg_path, self.log, force,
+                                   tools_mirror(self.settings))
+            if then and not self.missing_tools():
+                then()
+        if sys.platform == "win32" or not (force or self.missing_tools()):
+            if then and not self.missing_tools():
+                then()
+        elif wait:
+            run()
+        else:
+            threading.Thread(target=run, daemon=True).start()
+        return sys.platform != "win32"
+
+    def tool_versions(self):
+        # {утилита: версия или None}; заново опрашивается только утилита, файл которой изменился
+        return collections.OrderedDict([
+            ("yt-dlp", self.tool_cache.lookup("yt-dlp", self.ytdlp_path)[1]),
+            ("ffmpeg", self.tool_cache.lookup("ffmpeg", self.ffmpeg_path, ("-version",))[1]),
+            ("streamlink", self.tool_cache.lookup("streamlink", self.streamlink_path)[1]),
+        ])
+
+    def queues(self):
+        # По порядку стадий: завершение задачи ставит новые только в очереди, идущие дальше по списку,
+        # поэтому has_active, проверяя их по очереди, не пропустит задачу "в пути"
+        return (self.playlist_queue, self.video_queue, self.stream_queue, self.postprocess_queue)
+
+    def jobs(self):
+        return sorted((job for queue in self.queues() for job in queue.jobs), key=lambda job: job.id)
+
+    def find_job(self, job_id):
+        for job in self.jobs():
+            if job.id == job_id:
+                return job
+        return None
+
+    def queue_for(self, job):
+        if job.kind == "stream":
+            return self.stream_queue
+        if job.kind in ("post", "vod"):
+            return self.postprocess_queue
+        if job.kind == "playlist":
+            return self.playlist_queue
+        return self.video_queue
+
+    def has_active(self):
+        return any(queue.has_active() for queue in self.queues())
+
+    def prometheus_metrics(self):
+        return prometheus_text(self.queues(), self.jobs())
+
+    def stop(self, job):
+        self.queue_for(job).stop(job)
+
+    def stop_all(self):
+        for queue in self.queues():
+            queue.stop_all()
+
+    def shutdown(self):
+        # Выход из программы: задачи останавливаются, но в журнале остаются незавершенными
+        self._storage_stop.set()
+        self.metrics.stop()
+        self.store.close()
+        self.watcher.set_channels([])
+        self.stop_all()
+
+    def resume_jobs(self):
+        if self._resumed:
+            return []
+        self._resumed = True
+        records, self._stored_jobs = self._stored_jobs, {}
+        if not records:
+            return []
+        self.store.forget(records)
+        jobs = []
+        videos = collections.OrderedDict()
+        for job_id in sorted(records):
+            record = records[job_id]
+            spec = record["spec"]
+            if record["kind"] == "stream":
+                # Запись продолжается в новые сегменты рядом со старыми
+                self.log(f"Возобновление записи: {spec['url']}")
+                job = self.record(spec["url"])
+                if job:
+                    jobs.append(job)
+            else:
+                key = (spec["quality"], spec["audio_only"], spec["cookies"])
+                videos.setdefault(key, []).extend(spec["urls"])
+        for (quality, audio_only, cookies), urls in videos.items():
+            self.log(f"Возобновление загрузок: {len(urls)}")
+            jobs += self.download(urls, quality, audio_only, cookies)
+        # Снимок содержит только новые задачи, старые записи журнала больше не нужны
+        self.store.compact()
+        return jobs
+
+    def wait_idle(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.has_active():
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.2)
+        return True
+
+    def apply_storage_settings(self):
+        self.videos_dir = output_root(self.base_dir, self.settings["VIDEOS_DIR"], "videos")
+        self.audio_dir = output_root(self.base_dir, self.settings["AUDIO_DIR"] or self.videos_dir, "videos")
+        self.vods_dir = output_root(self.base_dir, self.settings["VODS_DIR"], "vods")
+
+    def _storage_monitor(self):
+        while not self._storage_stop.wait(STORAGE_CHECK_INTERVAL):
+            try:
+                self.check_storage()
+            except OSError as e:
+                self.log(f"Ошибка проверки места на диске: {e}")
+
+    def prune_vods(self):
+        max_age = self.settings["VOD_MAX_AGE_DAYS"]
+        max_total = self.settings["VOD_MAX_TOTAL_GB"] * GIB
+        if not (max_age or max_total) or not os.path.isdir(self.vods_dir):
+            return []
+        if not self._prune_lock.acquire(blocking=False):
+            # Удаление уже идет в другом потоке
+            return []
+        try:
+            removed = prune_files(self.vods_dir, max_age, max_total)
+        finally:
+            self._prune_lock.release()
+        if removed:
+            freed = sum(size for _, size in removed)
+            self.log(f"Удалено старых записей: {len(removed)} ({format_size(freed)}) в {self.vods_dir}")
+        return removed
+
+    def _space_is_low(self, root, watermark):
+        # Порог возврата выше порога остановки, чтобы очередь не дергалась на границе
+        free = free_bytes(root)
+        if root in self._low_space:
+            if free >= watermark * STORAGE_RESUME_FACTOR:
+                self._low_space.discard(root)
+                self.log(f"Место на диске освободилось ({format_size(free)}): {root}")
+        elif free < watermark:
+            self._low_space.add(root)
+            self.log(f"Мало места на диске ({format_size(free)}), новые задачи ждут: {root}")
+        return root in self._low_space, free
+
+    def check_storage(self, prune=True):
+        # Удаление старых записей по правилам хранения, затем пауза или продолжение очередей по свободному месту.
+        # True - места для загрузок хватает
+        if prune:
+            self.prune_vods()
+        with self._storage_lock:
+            watermark = self.settings["MIN_FREE_GB"] * GIB
+            if not watermark:
+                self._low_space.clear()
+                videos_low = audio_low = vods_low = False
+                vods_free = None
+            else:
+                videos_low, _ = self._space_is_low(self.videos_dir, watermark)
+                audio_low, _ = self._space_is_low(self.audio_dir, watermark)
+                vods_low, vods_free = self._space_is_low(self.vods_dir, watermark)
+            for queue, low in ((self.video_queue, videos_low or audio_low),
+                               (self.postprocess_queue, videos_low or audio_low or vods_low),
+                               (self.stream_queue, vods_low)):
+                if low:
+                    queue.pause()
+                elif queue.paused:
+                    queue.resume()
+            if vods_free is not None and vods_free < watermark * STORAGE_CRITICAL_FACTOR:
+                # Сегмент закрывается штатно, пока ffmpeg не упал посреди записи; запись продолжится, когда место появится
+                for job in list(self.stream_queue.jobs):
+                    if job.state == JOB_RUNNING and not job.stop_requested:
+                        self.log(f"Место почти закончилось, запись #{job.id} остановлена: {job.url}")
+                        self._storage_stopped.append(job.url)
+                        self.stream_queue.stop(job)
+            elif not vods_low and self._storage_stopped and not self.store.closed:
+                urls, self._storage_stopped = self._storage_stopped, []
+                for url in urls:
+                    self.log(f"Продолжение записи после освобождения места: {url}")
+                    self.record(url)
+            return not (videos_low or audio_low)
+
+    def set_workers(self, workers):
+        self.settings["MAX_WORKERS"] = int(workers)
+        self.video_queue.resize(self.settings["MAX_WORKERS"])
+
+    def set_streams(self, streams):
+        self.settings["MAX_STREAMS"] = int(streams)
+        self.stream_queue.resize(self.settings["MAX_STREAMS"])
+
+    def ytdlp_base_cmd(self, cookies=""):
+        cmd = [self.ytdlp_path]
+        if cookies:
+            cmd += ['--cookies', cookies]
+        return cmd
+
+    def video_cmd(self, sources, quality=DEFAULT_QUALITY, audio_only=False, cookies=""):
+        output_dir = self.audio_dir if audio_only else self.videos_dir
+        os.makedirs(output_dir, exist_ok=True)
+        if audio_only:
+            # --merge-output-format не делает mp3: дорожка скачивается как есть и уходит в постобработку
+            format_args = ['-f', audio_format_selector(self.settings["AUDIO_FORMAT"])]
+        else:
+            format_args = ['-f', quality, '--merge-output-format', self.settings["REMUX_CONTAINER"] or 'mp4']
+        format_args += ytdlp_postprocess_args(self.settings)
+        return self.ytdlp_base_cmd(cookies) + [
+            '--ffmpeg-location', os.path.dirname(self.ffmpeg_path),
+        ] + format_args + [
+            '-o', os.path.join(output_dir, output_template(self.settings["OUTPUT_TEMPLATE"])),
+            '--download-archive', self.archive_path,
+            # Недокачанные .part файлы продолжаются, а не начинаются заново
+            '--continue',
+            '--newline',
+            '--progress-template', PROGRESS_TEMPLATE,
+        ] + self.performance_args() + sources
+
+    def performance_args(self):
+        profile = download_profile(self.settings)
+        aria2c_path = None
+        if profile["aria2c"]:
+            aria2c_path = shutil.which("aria2c")
+            if aria2c_path is None and not self._aria2c_warned:
+                self._aria2c_warned = True
+                self.log("aria2c не найден, используется встроенный загрузчик yt-dlp")
+        return performance_args(profile, self.settings["RATE_LIMIT"], self.settings["MAX_WORKERS"], aria2c_path)
+
+    def skip_archived(self, urls):
+        urls, skipped = self.archive.filter(urls)
+        for url in skipped:
+            self.log(f"Уже скачано, пропуск: {url}")
+        return urls
+
+    def cached_info_copy(self, url):
+        # Копия, чтобы вытеснение из кэша не сломало задачу, ожидающую в очереди
+        info_path = self.info_cache.get(url)
+        if info_path is None:
+            return None
+        fd, path = tempfile.mkstemp(prefix="simpledlp-info-", suffix=".info.json")
+        os.close(fd)
+        shutil.copyfile(info_path, path)
+        return path
+
+    def fetch_info(self, url, cookies=""):
+        return self.info_cache.load(url, self.ytdlp_base_cmd(cookies))
+
+    def download(self, urls, quality=DEFAULT_QUALITY, audio_only=False, cookies=""):
+        urls = parse_url_list("\n".join(urls))
+        # Проверка места до постановки в очередь: при нехватке задачи ждут, а не падают посреди записи файла
+        self.check_storage(prune=False)
+        jobs = [self.expand_playlist(url, quality, audio_only, cookies) for url in urls if is_playlist_url(url)]
+        urls = self.skip_archived([url for url in urls if not is_playlist_url(url)])
+        if not urls:
+            return jobs
+        if len(urls) == 1:
+            return jobs + [self._download_one(urls[0], quality, audio_only, cookies)]
+        # Один процесс yt-dlp на каждый поток вместо процесса на каждую ссылку
+        for chunk in chunk_urls(urls, self.settings["MAX_WORKERS"]):
+            if len(chunk) == 1:
+                jobs.append(self._download_one(chunk[0], quality, audio_only, cookies))
+                continue
+            batch_path = write_batch_file(chunk)
+            job = Job("batch", f"{chunk[0]} (+{len(chunk) - 1})",
+                      self.video_cmd(['--batch-file', batch_path], quality, audio_only, cookies))
+            job.temp_files.append(batch_path)
+            job.spec = {"urls": chunk, "quality": quality, "audio_only": audio_only, "cookies": cookies}
+            self.video_queue.submit(job)
+            self.log(f"Пакет #{job.id} добавлен в очередь: {len(chunk)} ссылок")
+            jobs.append(job)
+        return jobs
+
+    def _download_one(self, url, quality, audio_only, cookies):
+        info_path = self.cached_info_copy(url)
+        if info_path:
+            # Метаданные уже получены кнопкой "Показать форматы" - экстрактор второй раз не запускаем
+            cmd = self.video_cmd(['--load-info-json', info_path], quality, audio_only, cookies)
+        else:
+            # '--': ссылка вида "--exec=..." не должна стать опцией yt-dlp
+            cmd = self.video_cmd(['--', url], quality, audio_only, cookies)
+        self.log(f"Команда: {subprocess.list2cmdline(cmd)}")
+        job = Job("video", url, cmd)
+        job.spec = {"urls": [url], "quality": quality, "audio_only": audio_only, "cookies": cookies}
+        if info_path:
+            job.temp_files.append(info_path)
+        self.video_queue.submit(job)
+        self.log(f"Загрузка видео #{job.id} добавлена в очередь: {url}")
+        return job
+
+    def expand_playlist(self, url, quality=DEFAULT_QUALITY, audio_only=False, cookies=""):
+        cmd = self.ytdlp_base_cmd(cookies) + ['--flat-playlist', '--lazy-playlist',
+                                              '--print', PLAYLIST_ENTRY_TEMPLATE, '--', url]
+        job = PlaylistJob(url, cmd, self.settings["PLAYLIST_SYNC_STOP"])
+        job.spec = {"urls": [url], "quality": quality, "audio_only": audio_only, "cookies": cookies}
+        self.playlist_queue.submit(job)
+        self.log(f"Перебор плейлиста #{job.id} добавлен в очередь: {url}")
+        return job
+
+    def _playlist_entry(self, job, line):
+        entry = parse_playlist_entry(line)
+        if entry is None:
+            return False
+        key, url = entry
+        job.found += 1
+        if key is not None and key in self.archive:
+            job.known_streak += 1
+            if job.sync_stop and job.known_streak >= job.sync_stop and not job.synced:
+                job.synced = True
+                self.log(f"[#{job.id}] Дальше уже скачанные видео, перебор остановлен на записи {job.found}")
+                # Следующие страницы плейлиста даже не запрашиваются
+                kill_process_tree(job.process)
+            return True
+        job.known_streak = 0
+        job.pending.append(url)
+        # Первое новое видео - сразу, чтобы загрузка началась, остальные - пачками
+        if job.queued == 0 or len(job.pending) >= PLAYLIST_FLUSH_SIZE:
+            self._flush_playlist(job)
+        return True
+
+    def _flush_playlist(self, job):
+        urls, job.pending = job.pending, []
+        if not urls:
+            return
+        job.queued += len(urls)
+        spec = job.spec
+        self.download(urls, spec["quality"], spec["audio_only"], spec["cookies"])
+
+    def is_recording(self, url):
+        return any(job.url == url and job.is_active() for job in self.stream_queue.jobs)
+
+    def record(self, url):
+        if not is_http_url(url):
+            self.log(f"Запись стрима: нужна ссылка http(s): {url}")
+            return None
+        if self.is_recording(url):
+            self.log(f"Стрим уже записывается: {url}")
+            return None
+        session_dir = new_session_dir(os.path.join(self.vods_dir, stream_slug(url)))
+        self.check_storage(prune=False)
+        if self.settings["STREAM_CAPTURE_MODE"] == "from-start":
+            source_cmd = self.live_from_start_cmd(url, session_dir)
+            sink_cmd = None
+        else:
+            source_cmd = streamlink_source_cmd(self.streamlink_path, url, self.settings["STREAM_SEGMENT_THREADS"],
+                                               self.settings["STREAM_PREFETCH_SEGMENTS"])
+            sink_cmd = [self.ffmpeg_path] + FFMPEG_PROGRESS_ARGS + ["-i", "-"] + stream_output_args(
+                session_dir, url, self.settings["STREAM_SEGMENT_MINUTES"], self.settings["STREAM_SEGMENT_FORMAT"])
+        job = StreamSession(url, (source_cmd, sink_cmd), session_dir, self.settings["STREAM_STALL_SECONDS"],
+                            self.settings["STREAM_RECONNECT_RETRIES"], self.log)
+        job.spec = {"url": url}
+        self.stream_queue.submit(job)
+        self.log(f"Запись стрима #{job.id} добавлена в очередь: {url} -> {session_dir}")
+        return job
+
+    def live_from_start_cmd(self, url, session_dir):
+        # Имя с временем запуска записи: перезапуск сторожем продолжает тот же файл (--continue),
+        # а не качает эфир с начала еще раз
+        name = f"{stream_slug(url)}_{time.strftime('%Y-%m-%d_%H-%M-%S')}.%(ext)s"
+        return self.ytdlp_base_cmd() + [
+            '--live-from-start',
+            '--concurrent-fragments', str(max(int(self.settings["STREAM_SEGMENT_THREADS"]), 1)),
+            '--ffmpeg-location', os.path.dirname(self.ffmpeg_path),
+            '-f', 'bestvideo+bestaudio/best',
+            '--merge-output-format', 'mkv' if self.settings["STREAM_SEGMENT_FORMAT"] == "ts" else 'mp4',
+            '-o', os.path.join(session_dir, name),
+            '--continue',
+            '--newline',
+            '--progress-template', PROGRESS_TEMPLATE,
+            '--', url,
+        ]
+
+    def set_watch_channels(self, urls):
+        self.settings["WATCH_CHANNELS"] = list(urls)
+        self.watcher.set_channels(self.settings["WATCH_CHANNELS"])
+        self.log(f"Отслеживается каналов: {len(urls)}")
+
+    def _check_live(self, url):
+        return check_stream_live(self.streamlink_path, url)
+
+    def _on_channel_live(self, url):
+        if not os.path.exists(self.ffmpeg_path):
+            self.log(f"Не найден {os.path.basename(self.ffmpeg_path)}, запись невозможна")
+            return
+        self.log(f"Канал в эфире, начинаю запись: {url}")
+        self.record(url)
+
+    def _on_watch_error(self, url, error):
+        self.log(f"Не удалось проверить канал {url}: {error}")
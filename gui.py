@@ -3,9 +3,17 @@ import subprocess
 import os
 import threading
 import shutil
-import urllib.request
-import json
-from datetime import datetime
+import time
+import queue
+import collections
+import logging
+import logging.handlers
+
+from engine import (Engine, load_config, save_config, parse_url_list, progress_fraction, format_progress,
+                    format_size, format_table, format_metrics, DEFAULT_QUALITY, DOWNLOAD_PROFILES, PLAYLIST_SYNC_STOP,
+                    STREAM_CAPTURE_MODES, WINDOWS_TOOLS_HINT, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_STOPPED)
+from postprocess import AUDIO_FORMATS, REMUX_CONTAINERS, OPTIONAL_POSTPROCESSORS, VOD_MODES
+from storage import OUTPUT_TEMPLATES
 
 THEME = "blue"
 APPEARANCE_MODE = "System"
@@ -22,93 +30,245 @@ def check_and_install_packages():
         subprocess.check_call(command)
         os.execv(sys.executable, ['python'] + sys.argv)
 
-def download_file(url, path):
-    try:
-        with urllib.request.urlopen(url) as response, open(path, "wb") as out_file:
-            shutil.copyfileobj(response, out_file)
-        os.chmod(path, 0o755)
-        return True
-    except Exception as e:
-        print(f"Ошибка скачивания {url}: {e}")
-        return False
-
-def ensure_bin_tools_linux(bin_dir, ytdlp_path, ffmpeg_path):
-    YTDLP_URL = "https://github.com/yt-dlp/yt-dlp/releases/latest/download/yt-dlp"
-    FFMPEG_URL = "https://johnvansickle.com/ffmpeg/releases/ffmpeg-release-amd64-static.tar.xz"
-    if not os.path.exists(ytdlp_path):
-        os.makedirs(bin_dir, exist_ok=True)
-        download_file(YTDLP_URL, ytdlp_path)
-    if not os.path.exists(ffmpeg_path):
-        os.makedirs(bin_dir, exist_ok=True)
-        archive_path = os.path.join(bin_dir, "ffmpeg.tar.xz")
-        if download_file(FFMPEG_URL, archive_path):
-            import tarfile
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+LOG_VIEW_LINES = 2000
+LOG_FLUSH_INTERVAL = 100
+STREAM_HEALTH_INTERVAL = 2000
+UI_DISPATCH_INTERVAL = 50
+UI_DISPATCH_BATCH = 200
+TOAST_MS = 5000
+
+class LogSink:
+    # Потоки пишут в очередь и в файл, окно забирает строки пачками по таймеру
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s: %(message)s", "%Y-%m-%d %H:%M:%S"))
+        self._logger = logging.getLogger("simpledlp")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self._logger.addHandler(handler)
+
+    def write(self, text):
+        self._queue.put(text)
+        self._logger.info(text)
+
+    def drain(self, limit=LOG_VIEW_LINES):
+        # Очередь выбирается целиком, чтобы окно не отставало от задач: в окно идут последние limit строк,
+        # остальные только считаются - они уже в файле. Возвращает (строки, сколько пропущено)
+        lines = collections.deque(maxlen=limit)
+        count = 0
+        for _ in range(self._queue.qsize()):
             try:
-                with tarfile.open(archive_path, "r:xz") as tar:
-                    for member in tar.getmembers():
-                        if member.isfile() and member.name.endswith("/ffmpeg"):
-                            tar.extract(member, bin_dir)
-                            extracted_path = os.path.join(bin_dir, os.path.basename(member.name))
-                            shutil.move(extracted_path, ffmpeg_path)
-                            os.chmod(ffmpeg_path, 0o755)
-                            break
-                os.remove(archive_path)
-            except Exception as e:
-                print(f"Ошибка при распаковке ffmpeg: {e}")
-
-def ensure_tools(bin_dir, ytdlp_path, ffmpeg_path):
-    if sys.platform == "win32":
-        import tkinter as tk
-        from tkinter import messagebox
-        root = tk.Tk()
-        root.withdraw()
-        messagebox.showinfo(
-            "Manual Download Required",
-            (
-                "Скачайте yt-dlp.exe и ffmpeg.exe вручную:\n"
-                "yt-dlp.exe: https://github.com/yt-dlp/yt-dlp/releases/latest/download/yt-dlp.exe\n"
-                "ffmpeg.exe: https://www.gyan.dev/ffmpeg/builds/\n"
-                "Положите их в папку 'bin'."
-            )
-        )
-    else:
-        ensure_bin_tools_linux(bin_dir, ytdlp_path, ffmpeg_path)
+                lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            count += 1
+        return list(lines), count - len(lines)
+
+    def files(self):
+        # От старых к новым: simpledlp.log.3 ... simpledlp.log.1, simpledlp.log
+        paths = [f"{self.path}.{i}" for i in range(LOG_BACKUPS, 0, -1)] + [self.path]
+        return [path for path in paths if os.path.exists(path)]
+
+    def export(self, destination):
+        for handler in self._logger.handlers:
+            handler.flush()
+        with open(destination, "wb") as out_file:
+            for path in self.files():
+                with open(path, "rb") as f:
+                    shutil.copyfileobj(f, out_file)
+
+class UiDispatcher:
+    # Tk не потокобезопасен: фоновые потоки только кладут вызовы в очередь, окно выполняет их по таймеру.
+    # Вызовы с одним ключом, еще не выполненные, схлопываются - частые обновления одной задачи не копятся
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._keys = set()
+        self._lock = threading.Lock()
+
+    def post(self, func, *args, key=None):
+        if key is not None:
+            with self._lock:
+                if key in self._keys:
+                    return
+                self._keys.add(key)
+        self._queue.put((key, func, args))
+
+    def drain(self, limit=UI_DISPATCH_BATCH):
+        calls = []
+        while len(calls) < limit:
+            try:
+                key, func, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if key is not None:
+                with self._lock:
+                    self._keys.discard(key)
+            calls.append((func, args))
+        return calls
+
+# Переводы интерфейса: собираются один раз при импорте, а не при каждом создании окна
+TRANSLATIONS = {
+    "RU": {
+        "appearance": "Внешний вид:",
+        "language": "Язык:",
+        "stream_url": "Ссылка на стрим:",
+        "video_url": "Ссылка на видео:",
+        "cookies_file": "Файл cookies:",
+        "browse": "Выбрать...",
+        "format": "Формат:",
+        "show_formats": "Показать форматы",
+        "audio_only": "Только аудио:",
+        "record_stream": "Записать стрим",
+        "download_video": "Скачать видео",
+        "open_folder": "Открыть папку",
+        "update_tools": "Обновить утилиты",
+        "stop": "Остановить",
+        "save_log": "Сохранить лог",
+        "workers": "Потоки:",
+        "streams": "Стримы:",
+        "formats_title": "Форматы",
+        "formats_use": "Использовать формат",
+        "watch": "Следить...",
+        "watch_title": "Отслеживание каналов",
+        "watch_hint": "Каналы по одному на строку. Запись начнется сама, когда канал выйдет в эфир.",
+        "watch_save": "Сохранить",
+        "segment_minutes": "Сегмент стрима (мин, 0 - один файл):",
+        "segment_format": "Контейнер:",
+        "vod": "Склейка:",
+        "capture_mode": "Захват:",
+        "segment_threads": "Потоков:",
+        "postprocess": "Постобработка:",
+        "pp_metadata": "Метаданные",
+        "pp_thumbnail": "Обложка",
+        "pp_loudnorm": "Громкость (EBU R128)",
+        "download_profile": "Профиль скорости:",
+        "rate_limit": "Лимит скорости (0 - нет):",
+        "playlist_sync": "Плейлисты: только новые",
+        "storage": "Хранилище...",
+        "storage_title": "Папки и место на диске",
+        "storage_videos": "Видео (пусто - videos/):",
+        "storage_audio": "Аудио (пусто - как видео):",
+        "storage_vods": "Записи стримов (пусто - vods/):",
+        "storage_template": "Имя файла:",
+        "storage_min_free": "Мин. свободно, ГБ (0 - не следить):",
+        "storage_max_age": "Хранить записи, дней (0 - всегда):",
+        "storage_max_total": "Записи не больше, ГБ (0 - без лимита):",
+        "storage_save": "Сохранить",
+        "batch": "Список...",
+        "batch_title": "Пакетная загрузка",
+        "batch_hint": "По одной ссылке на строку. Повторы будут пропущены.",
+        "batch_load": "Загрузить файл...",
+        "batch_start": "Скачать все",
+        "queue": "Очередь задач",
+        "stop_job": "Стоп",
+        "queue_done": "Все задачи завершены",
+        "missing_tools": "Не найдены yt-dlp или ffmpeg, подробности в логе",
+        "manual_tools": "Скачайте yt-dlp и ffmpeg вручную, ссылки в логе",
+        "state_queued": "в очереди",
+        "state_running": "выполняется",
+        "state_done": "готово",
+        "state_failed": "ошибка",
+        "state_stopped": "остановлено",
+        "title": "SIMPLEDLP",
+        "contacts": "YouTube: @qualby   |   Discord: qualbyyyy   |   Telegram: @qualbyy",
+    },
+    "EN": {
+        "appearance": "Appearance:",
+        "language": "Language:",
+        "stream_url": "Stream URL:",
+        "video_url": "Video URL:",
+        "cookies_file": "Cookies File:",
+        "browse": "Browse...",
+        "format": "Format:",
+        "show_formats": "Show formats",
+        "audio_only": "Audio only:",
+        "record_stream": "Record stream",
+        "download_video": "Download video",
+        "open_folder": "Open folder",
+        "update_tools": "Update tools",
+        "stop": "Stop",
+        "save_log": "Save log",
+        "workers": "Workers:",
+        "streams": "Streams:",
+        "formats_title": "Formats",
+        "formats_use": "Use format",
+        "watch": "Watch...",
+        "watch_title": "Channel watcher",
+        "watch_hint": "One channel per line. Recording starts automatically when a channel goes live.",
+        "watch_save": "Save",
+        "segment_minutes": "Stream segment (min, 0 - single file):",
+        "segment_format": "Container:",
+        "vod": "Join VOD:",
+        "capture_mode": "Capture:",
+        "segment_threads": "Threads:",
+        "postprocess": "Post-processing:",
+        "pp_metadata": "Metadata",
+        "pp_thumbnail": "Thumbnail",
+        "pp_loudnorm": "Loudness (EBU R128)",
+        "download_profile": "Speed profile:",
+        "rate_limit": "Speed limit (0 - none):",
+        "playlist_sync": "Playlists: new only",
+        "storage": "Storage...",
+        "storage_title": "Folders and disk space",
+        "storage_videos": "Videos (empty - videos/):",
+        "storage_audio": "Audio (empty - same as videos):",
+        "storage_vods": "Stream recordings (empty - vods/):",
+        "storage_template": "File name:",
+        "storage_min_free": "Min. free, GB (0 - off):",
+        "storage_max_age": "Keep recordings, days (0 - forever):",
+        "storage_max_total": "Recordings up to, GB (0 - no limit):",
+        "storage_save": "Save",
+        "batch": "List...",
+        "batch_title": "Batch download",
+        "batch_hint": "One URL per line. Duplicates are skipped.",
+        "batch_load": "Load file...",
+        "batch_start": "Download all",
+        "queue": "Job queue",
+        "stop_job": "Stop",
+        "queue_done": "All jobs finished",
+        "missing_tools": "yt-dlp or ffmpeg not found, see the log",
+        "manual_tools": "Download yt-dlp and ffmpeg manually, links are in the log",
+        "state_queued": "queued",
+        "state_running": "running",
+        "state_done": "done",
+        "state_failed": "failed",
+        "state_stopped": "stopped",
+        "title": "SIMPLEDLP",
+        "contacts": "YouTube: @qualby   |   Discord: qualbyyyy   |   Telegram: @qualbyy",
+    }
+}
 
 CONFIG_PATH = None
 
 def load_settings():
     global LANG, THEME, APPEARANCE_MODE
-    if os.path.exists(CONFIG_PATH):
-        try:
-            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            LANG = data.get("LANG", LANG)
-            THEME = data.get("THEME", THEME)
-            APPEARANCE_MODE = data.get("APPEARANCE_MODE", APPEARANCE_MODE)
-            return data
-        except Exception as e:
-            print(f"Ошибка загрузки настроек: {e}")
-    return {}
-
-def save_settings(quality_var, audio_var):
-    data = {
+    data = load_config(CONFIG_PATH)
+    LANG = data.get("LANG", LANG)
+    THEME = data.get("THEME", THEME)
+    APPEARANCE_MODE = data.get("APPEARANCE_MODE", APPEARANCE_MODE)
+    return data
+
+def save_settings(engine_settings, quality_var, audio_var):
+    data = dict(engine_settings)
+    data.update({
         "LANG": LANG,
         "THEME": THEME,
         "APPEARANCE_MODE": APPEARANCE_MODE,
         "QUALITY": quality_var.get(),
         "AUDIO_ONLY": audio_var.get()
-    }
-    try:
-        with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4)
-    except Exception as e:
-        print(f"Ошибка сохранения настроек: {e}")
+    })
+    save_config(CONFIG_PATH, data)
 
 def main():
     global THEME, LANG, APPEARANCE_MODE, CONFIG_PATH
     check_and_install_packages()
     import customtkinter
-    from tkinter import messagebox, filedialog
+    from tkinter import filedialog
 
     SCRIPTDIR = os.path.dirname(os.path.abspath(__file__))
     CONFIG_PATH = os.path.join(SCRIPTDIR, "config.json")
@@ -118,133 +278,269 @@ def main():
     customtkinter.set_appearance_mode(settings.get("APPEARANCE_MODE", APPEARANCE_MODE))
     customtkinter.set_default_color_theme(settings.get("THEME", THEME))
 
-    BIN_DIR = os.path.join(SCRIPTDIR, "bin")
-    if sys.platform == "win32":
-        YTDLPPATH = os.path.join(BIN_DIR, "yt-dlp.exe")
-        FFMPEGPATH = os.path.join(BIN_DIR, "ffmpeg.exe")
-    else:
-        YTDLPPATH = os.path.join(BIN_DIR, "yt-dlp")
-        FFMPEGPATH = os.path.join(BIN_DIR, "ffmpeg")
-    STREAMLINKPATH = "streamlink"
+    log_sink = LogSink(os.path.join(SCRIPTDIR, "logs", "simpledlp.log"))
+    engine = Engine(SCRIPTDIR, settings, log_sink.write)
+    ui = UiDispatcher()
+    job_rows = {}
+    queue_busy = False
 
-    ensure_tools(BIN_DIR, YTDLPPATH, FFMPEGPATH)
-
-    current_process = None
-    download_log = []
+    def notify(key, text=None):
+        # Уведомления не модальные: окно и фоновые потоки не ждут, пока кто-то нажмет OK
+        t = app.translations.get(LANG, app.translations["EN"])
+        append_text(text or t[key])
+        app.show_toast(t[key])
 
     def ensure_dependencies():
-        missing_files = []
-        if not os.path.exists(YTDLPPATH): missing_files.append(os.path.basename(YTDLPPATH))
-        if not os.path.exists(FFMPEGPATH): missing_files.append(os.path.basename(FFMPEGPATH))
+        missing_files = engine.missing_tools()
         if missing_files:
-            messagebox.showerror("Dependency Error", f"Не найдены файлы: {', '.join(missing_files)}\n\nПоместите их в папку 'bin'.")
+            notify("missing_tools", f"Не найдены файлы: {', '.join(missing_files)}. Поместите их в папку 'bin'.")
             return False
         return True
 
+    def start_tools_bootstrap(force=False, then=None):
+        # Окно уже показано, загрузка утилит идет в фоне и пишет прогресс в лог
+        if not engine.ensure_tools(force, then=then) and (force or engine.missing_tools()):
+            notify("manual_tools", WINDOWS_TOOLS_HINT)
+
     def append_text(text):
-        output_text.configure(state="normal")
-        output_text.insert("end", text + "\n")
-        output_text.see("end")
-        output_text.configure(state="disabled")
-        download_log.append(f"{datetime.now().strftime('%H:%M:%S')}: {text}")
+        log_sink.write(text)
+
+    def start_background():
+        # Незавершенные задачи прошлого запуска возобновляются, как только утилиты на месте
+        start_tools_bootstrap(False, on_tools_ready)
+        if engine.settings["WATCH_CHANNELS"]:
+            engine.set_watch_channels(engine.settings["WATCH_CHANNELS"])
+        if engine.settings["API_PORT"]:
+            # asyncio нужен только локальному API
+            from api import ApiServer
+            ApiServer(engine, engine.settings["API_PORT"]).start()
+
+    def on_tools_ready():
+        threading.Thread(target=resume_and_report_tools, daemon=True).start()
+
+    def resume_and_report_tools():
+        engine.resume_jobs()
+        versions = engine.tool_versions()
+        append_text("Утилиты: " + ", ".join(f"{name} {version or '-'}" for name, version in versions.items()))
+
+    def dispatch_ui():
+        for func, args in ui.drain():
+            try:
+                func(*args)
+            except Exception as e:
+                append_text(f"Ошибка интерфейса: {e}")
+        app.after(UI_DISPATCH_INTERVAL, dispatch_ui)
+
+    def flush_log():
+        lines, skipped = log_sink.drain()
+        if skipped:
+            lines.insert(0, f"... пропущено строк: {skipped}, полный лог - в {log_sink.path}")
+        if lines:
+            output_text.configure(state="normal")
+            output_text.insert("end", "\n".join(lines) + "\n")
+            # В окне держим только последние LOG_VIEW_LINES строк, полный лог - в файле
+            line_count = int(output_text.index("end-1c").split(".")[0])
+            if line_count > LOG_VIEW_LINES:
+                output_text.delete("1.0", f"{line_count - LOG_VIEW_LINES}.0")
+            output_text.see("end")
+            output_text.configure(state="disabled")
+        app.after(LOG_FLUSH_INTERVAL, flush_log)
 
     def save_log():
         fname = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")])
         if fname:
-            with open(fname, "w", encoding="utf-8") as f:
-                f.write("\n".join(download_log))
-            append_text("Лог сохранен.")
-
-    def start_stream():
-        threading.Thread(target=_start_stream_task, daemon=True).start()
+            try:
+                log_sink.export(fname)
+                append_text("Лог сохранен.")
+            except Exception as e:
+                append_text(f"Ошибка сохранения лога: {e}")
+
+    def on_job_update(job):
+        # Вызывается из потоков очередей
+        ui.post(refresh_job_row, job, key=("job", job.id))
+
+    engine.add_listener(on_job_update)
+
+    def refresh_job_row(job):
+        nonlocal queue_busy
+        t = app.translations.get(LANG, app.translations["EN"])
+        row = job_rows.get(job.id)
+        if row is None:
+            row = app.add_job_row(job)
+            job_rows[job.id] = row
+        row["state"].configure(text=t["state_" + job.state])
+        if job.progress is not None:
+            fraction = progress_fraction(job.progress)
+            if fraction is not None:
+                row["progress"].set(fraction)
+            row["info"].configure(text=format_progress(job.progress))
+        if job.state == JOB_DONE:
+            row["progress"].set(1)
+        if not job.is_active():
+            row["stop"].configure(state="disabled")
+            if job.state == JOB_DONE:
+                append_text(f"Задача #{job.id} завершена: {job.url}")
+            elif job.state == JOB_FAILED:
+                append_text(f"Задача #{job.id} завершилась с ошибкой ({job.error or job.returncode}): {job.url}")
+            elif job.state == JOB_STOPPED:
+                append_text(f"Задача #{job.id} остановлена: {job.url}")
+        busy = engine.has_active()
+        stop_button.configure(state="normal" if busy else "disabled")
+        if queue_busy and not busy:
+            notify("queue_done")
+        queue_busy = busy
 
     def _start_stream_task():
-        nonlocal current_process
         if not ensure_dependencies():
             append_text("Отсутствуют зависимости для стрима")
             return
-        stream_url = stream_url_entry.get().strip()
-        if not stream_url:
+        stream_urls = parse_url_list(stream_url_entry.get())
+        if not stream_urls:
             append_text("Введите ссылку на стрим")
             return
-        append_text(f"Запуск записи стрима: {stream_url}")
-        stop_button.configure(state="normal")
-        vods_dir = os.path.join(SCRIPTDIR, "vods")
-        os.makedirs(vods_dir, exist_ok=True)
-        cmd = f'"{STREAMLINKPATH}" --hls-live-restart "{stream_url}" best -O | "{FFMPEGPATH}" -i - -c copy "{os.path.join(vods_dir, "stream.mp4")}"'
-        current_process = subprocess.Popen(cmd, shell=True)
-        append_text("Stream capture started.")
-        current_process.wait()
-        append_text("Stream capture finished.")
-        stop_button.configure(state="disabled")
-        messagebox.showinfo("Stream finished", "Stream recording finished.")
+        for stream_url in stream_urls:
+            engine.record(stream_url)
+
+    def open_watch_dialog():
+        app.show_watch_dialog()
+
+    def open_storage_dialog():
+        app.show_storage_dialog()
+
+    def apply_storage(values):
+        # Проверка места и удаление старых записей обходят папки - не в потоке интерфейса
+        engine.settings.update(values)
+        engine.apply_storage_settings()
+        append_text(f"Видео: {engine.videos_dir}, аудио: {engine.audio_dir}, записи: {engine.vods_dir}")
+        threading.Thread(target=engine.check_storage, daemon=True).start()
+
+    def refresh_job_metrics():
+        # Метрики снимает движок в фоне, здесь только вывод: записи стримов - объем и свежесть данных,
+        # у всех выполняющихся задач - CPU, память, скорость ffmpeg и повторы
+        now = time.time()
+        for job in engine.jobs():
+            row = job_rows.get(job.id)
+            if row is None or job.state != JOB_RUNNING:
+                continue
+            metrics = job.metrics
+            row["metrics"].configure(text=format_metrics(metrics))
+            if job.kind != "stream" or metrics.sampled_at is None:
+                continue
+            written = format_size(metrics.bytes_on_disk or 0)
+            if metrics.throughput:
+                written += f", {format_size(metrics.throughput)}/s"
+            if metrics.last_data is None:
+                row["info"].configure(text=f"{written}, нет данных")
+            else:
+                row["info"].configure(text=f"{written}, данные {int(now - metrics.last_data)} с назад")
+        app.after(STREAM_HEALTH_INTERVAL, refresh_job_metrics)
+
+    def show_formats(url):
+        if not url:
+            append_text("Введите ссылку на видео")
+            return
+        if not ensure_dependencies():
+            return
+        cookies_path = cookies_path_entry.get().strip()
+        append_text(f"Получение списка форматов: {url}")
 
-    def start_video_download_thread():
-        threading.Thread(target=_start_video_download_task, daemon=True).start()
+        def worker():
+            try:
+                info = engine.fetch_info(url, cookies_path)
+            except Exception as e:
+                append_text(f"Не удалось получить форматы: {e}")
+                return
+            ui.post(app.show_format_table, info)
+        threading.Thread(target=worker, daemon=True).start()
 
     def _start_video_download_task():
-        nonlocal current_process
         if not ensure_dependencies():
             append_text("Отсутствуют зависимости для видео")
             return
-        videos_dir = os.path.join(SCRIPTDIR, "videos")
-        os.makedirs(videos_dir, exist_ok=True)
-        video_url = video_url_entry.get().strip()
-        if not video_url:
+        urls = parse_url_list(video_url_entry.get())
+        if not urls:
             append_text("Введите ссылку на видео")
             return
-        cookies_path = cookies_path_entry.get().strip()
-        append_text(f"Начало загрузки видео: {video_url}")
-        stop_button.configure(state="normal")
-
-        format_code = quality_var.get()
-        if audio_var.get():
-            format_code = "bestaudio"
-            output_format = "mp3"
-        else:
-            output_format = "mp4"
-
-        out_template = f'"{os.path.join(videos_dir, "%(title)s.%(ext)s")}"'
-
-        cmd_parts = [
-            f'"{YTDLPPATH}"',
-            '--ffmpeg-location',
-            f'"{os.path.dirname(FFMPEGPATH)}"',
-            '-f',
-            format_code,
-            '--merge-output-format',
-            output_format,
-            '-o',
-            out_template,
-            f'"{video_url}"'
-        ]
-        if cookies_path:
-            cmd_parts.insert(1, f'--cookies "{cookies_path}"')
-        cmd = " ".join(cmd_parts)
-        append_text(f"Команда: {cmd}")
-
-        current_process = subprocess.Popen(cmd, shell=True)
-        current_process.wait()
-        append_text("Загрузка видео завершена.")
-        stop_button.configure(state="disabled")
-        messagebox.showinfo("Загрузка завершена", "Видео успешно загружено.")
-        current_process = None
+        start_batch(urls)
 
-    def stop_download():
-        nonlocal current_process
-        if current_process and current_process.poll() is None:
+    def start_batch(urls):
+        if not ensure_dependencies():
+            append_text("Отсутствуют зависимости для видео")
+            return
+        if not urls:
+            append_text("Список ссылок пуст")
+            return
+        engine.download(urls, quality_var.get(), audio_var.get(), cookies_path_entry.get().strip())
+
+    def open_batch_dialog():
+        app.show_batch_dialog()
+
+    def stop_jobs(jobs):
+        for job in jobs:
             try:
-                if sys.platform == "win32":
-                    subprocess.call(['taskkill', '/F', '/T', '/PID', str(current_process.pid)])
-                else:
-                    os.killpg(os.getpgid(current_process.pid), 9)
-                append_text("Загрузка остановлена.")
+                engine.stop(job)
             except Exception as e:
                 append_text(f"Ошибка при остановке: {e}")
-        else:
+
+    def stop_job(job):
+        # Остановка ждет процессы (на Windows - taskkill), поэтому идет не в потоке интерфейса
+        row = job_rows.get(job.id)
+        if row is not None:
+            row["stop"].configure(state="disabled")
+        threading.Thread(target=stop_jobs, args=([job],), daemon=True).start()
+
+    def stop_download():
+        jobs = [job for job in engine.jobs() if job.is_active()]
+        if not jobs:
             append_text("Нет активного процесса загрузки.")
         stop_button.configure(state="disabled")
-        current_process = None
+        threading.Thread(target=stop_jobs, args=(jobs,), daemon=True).start()
+
+    def change_segment_minutes(choice):
+        engine.settings["STREAM_SEGMENT_MINUTES"] = int(choice)
+
+    def change_segment_format(choice):
+        engine.settings["STREAM_SEGMENT_FORMAT"] = choice
+
+    def change_audio_format(choice):
+        engine.settings["AUDIO_FORMAT"] = choice
+
+    def change_audio_bitrate(choice):
+        engine.settings["AUDIO_BITRATE"] = choice
+
+    def change_remux_container(choice):
+        engine.settings["REMUX_CONTAINER"] = "" if choice == "auto" else choice
+
+    def toggle_postprocessor(name, enabled):
+        steps = [step for step in engine.settings["POSTPROCESSORS"] if step != name]
+        if enabled:
+            steps.append(name)
+        engine.settings["POSTPROCESSORS"] = [step for step in OPTIONAL_POSTPROCESSORS if step in steps]
+
+    def change_capture_mode(choice):
+        engine.settings["STREAM_CAPTURE_MODE"] = choice
+
+    def change_segment_threads(choice):
+        engine.settings["STREAM_SEGMENT_THREADS"] = int(choice)
+
+    def change_vod_transcode(choice):
+        engine.settings["VOD_TRANSCODE"] = choice
+
+    def change_playlist_sync(enabled):
+        # Плейлисты и каналы: только новые видео (перебор до уже скачанных) или целиком
+        engine.settings["PLAYLIST_SYNC_STOP"] = PLAYLIST_SYNC_STOP if enabled else 0
+
+    def change_download_profile(choice):
+        engine.settings["DOWNLOAD_PROFILE"] = choice
+
+    def change_rate_limit(choice):
+        engine.settings["RATE_LIMIT"] = choice
+
+    def change_streams(choice):
+        engine.set_streams(choice)
+
+    def change_workers(choice):
+        engine.set_workers(choice)
 
     def browse_cookies():
         path = filedialog.askopenfilename(title="Выберите cookies.txt", filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
@@ -253,8 +549,8 @@ def main():
             cookies_path_entry.insert(0, path)
 
     def open_videos_folder():
-        videos_dir = os.path.join(SCRIPTDIR, "videos")
-        open_downloads_folder(videos_dir)
+        os.makedirs(engine.videos_dir, exist_ok=True)
+        open_downloads_folder(engine.videos_dir)
 
     def open_downloads_folder(folder):
         if sys.platform.startswith("linux"):
@@ -266,51 +562,12 @@ def main():
         def __init__(self):
             super().__init__()
             self.title("SimpleDLP")
-            self.geometry("820x700")
+            self.geometry("820x780")
             self.grid_columnconfigure(0, weight=1)
             self.grid_rowconfigure(5, weight=1)
+            self.job_widgets = []
 
-            # Переводы
-            self.translations = {
-                "RU": {
-                    "appearance": "Внешний вид:",
-                    "language": "Язык:",
-                    "stream_url": "Ссылка на стрим:",
-                    "video_url": "Ссылка на видео:",
-                    "cookies_file": "Файл cookies:",
-                    "browse": "Выбрать...",
-                    "format": "Формат:",
-                    "show_formats": "Показать форматы",
-                    "audio_only": "Только аудио (mp3)",
-                    "record_stream": "Записать стрим",
-                    "download_video": "Скачать видео",
-                    "open_folder": "Открыть папку",
-                    "update_tools": "Обновить утилиты",
-                    "stop": "Остановить",
-                    "save_log": "Сохранить лог",
-                    "title": "SIMPLEDLP",
-                    "contacts": "YouTube: @qualby   |   Discord: qualbyyyy   |   Telegram: @qualbyy",
-                },
-                "EN": {
-                    "appearance": "Appearance:",
-                    "language": "Language:",
-                    "stream_url": "Stream URL:",
-                    "video_url": "Video URL:",
-                    "cookies_file": "Cookies File:",
-                    "browse": "Browse...",
-                    "format": "Format:",
-                    "show_formats": "Show formats",
-                    "audio_only": "Audio only (mp3)",
-                    "record_stream": "Record stream",
-                    "download_video": "Download video",
-                    "open_folder": "Open folder",
-                    "update_tools": "Update tools",
-                    "stop": "Stop",
-                    "save_log": "Save log",
-                    "title": "SIMPLEDLP",
-                    "contacts": "YouTube: @qualby   |   Discord: qualbyyyy   |   Telegram: @qualbyy",
-                }
-            }
+            self.translations = TRANSLATIONS
 
             # Все виджеты используемые для локализации - как атрибуты self
             self.title_label = customtkinter.CTkLabel(self, font=customtkinter.CTkFont(size=32, weight="bold"))
@@ -318,7 +575,7 @@ def main():
 
             switches_frame = customtkinter.CTkFrame(self)
             switches_frame.grid(row=1, column=0, padx=20, pady=(0, 10), sticky="ew")
-            switches_frame.grid_columnconfigure((0, 1, 2, 3), weight=1)
+            switches_frame.grid_columnconfigure((0, 1, 2, 3, 4, 5, 6, 7), weight=1)
 
             self.appearance_label = customtkinter.CTkLabel(switches_frame)
             self.appearance_label.grid(row=0, column=0, padx=5)
@@ -331,6 +588,18 @@ def main():
             lang_menu.set(LANG)
             lang_menu.grid(row=0, column=3, padx=5)
 
+            self.workers_label = customtkinter.CTkLabel(switches_frame)
+            self.workers_label.grid(row=0, column=4, padx=5)
+            workers_menu = customtkinter.CTkOptionMenu(switches_frame, values=[str(n) for n in range(1, 9)], command=change_workers)
+            workers_menu.set(str(engine.settings["MAX_WORKERS"]))
+            workers_menu.grid(row=0, column=5, padx=5)
+
+            self.streams_label = customtkinter.CTkLabel(switches_frame)
+            self.streams_label.grid(row=0, column=6, padx=5)
+            streams_menu = customtkinter.CTkOptionMenu(switches_frame, values=[str(n) for n in range(1, 9)], command=change_streams)
+            streams_menu.set(str(engine.settings["MAX_STREAMS"]))
+            streams_menu.grid(row=0, column=7, padx=5)
+
             input_frame = customtkinter.CTkFrame(self)
             input_frame.grid(row=2, column=0, padx=20, pady=10, sticky="ew")
             input_frame.grid_columnconfigure(1, weight=1)
@@ -340,12 +609,16 @@ def main():
             nonlocal stream_url_entry
             stream_url_entry = customtkinter.CTkEntry(input_frame, placeholder_text="https://...")
             stream_url_entry.grid(row=0, column=1, padx=10, pady=10, sticky="ew")
+            self.watch_button = customtkinter.CTkButton(input_frame, command=open_watch_dialog)
+            self.watch_button.grid(row=0, column=2, padx=10, pady=10)
 
             self.video_label = customtkinter.CTkLabel(input_frame)
             self.video_label.grid(row=1, column=0, padx=10, pady=10, sticky="w")
             nonlocal video_url_entry
             video_url_entry = customtkinter.CTkEntry(input_frame, placeholder_text="https://...")
             video_url_entry.grid(row=1, column=1, padx=10, pady=10, sticky="ew")
+            self.batch_button = customtkinter.CTkButton(input_frame, command=open_batch_dialog)
+            self.batch_button.grid(row=1, column=2, padx=10, pady=10)
 
             self.cookies_label = customtkinter.CTkLabel(input_frame)
             self.cookies_label.grid(row=2, column=0, padx=10, pady=10, sticky="w")
@@ -358,7 +631,7 @@ def main():
             self.format_label = customtkinter.CTkLabel(input_frame)
             self.format_label.grid(row=3, column=0, padx=10, pady=10, sticky="w")
             nonlocal quality_var
-            quality_var = customtkinter.StringVar(value=settings.get("QUALITY", "bestvideo+bestaudio"))
+            quality_var = customtkinter.StringVar(value=settings.get("QUALITY", DEFAULT_QUALITY))
             quality_menu = customtkinter.CTkOptionMenu(input_frame, values=["bestvideo+bestaudio", "best", "worst", "bestaudio"], variable=quality_var)
             quality_menu.grid(row=3, column=1, padx=10, pady=10, sticky="ew")
             self.show_formats_button = customtkinter.CTkButton(input_frame, command=lambda: self.show_formats(video_url_entry.get().strip()))
@@ -366,23 +639,110 @@ def main():
 
             nonlocal audio_var
             audio_var = customtkinter.BooleanVar(value=settings.get("AUDIO_ONLY", False))
-            self.audio_checkbox = customtkinter.CTkCheckBox(input_frame, variable=audio_var)
-            self.audio_checkbox.grid(row=4, column=1, padx=10, pady=(0, 10), sticky="w")
+            audio_frame = customtkinter.CTkFrame(input_frame, fg_color="transparent")
+            audio_frame.grid(row=4, column=1, padx=10, pady=(0, 10), sticky="w")
+            self.audio_checkbox = customtkinter.CTkCheckBox(audio_frame, variable=audio_var)
+            self.audio_checkbox.grid(row=0, column=0, padx=(0, 10))
+            audio_format_menu = customtkinter.CTkOptionMenu(audio_frame, width=80, values=list(AUDIO_FORMATS) + ["best"],
+                                                            command=change_audio_format)
+            audio_format_menu.set(engine.settings["AUDIO_FORMAT"])
+            audio_format_menu.grid(row=0, column=1, padx=5)
+            audio_bitrates = ["0", "128K", "192K", "256K", "320K"]
+            if engine.settings["AUDIO_BITRATE"] not in audio_bitrates:
+                audio_bitrates.append(engine.settings["AUDIO_BITRATE"])
+            audio_bitrate_menu = customtkinter.CTkOptionMenu(audio_frame, width=80, values=audio_bitrates,
+                                                             command=change_audio_bitrate)
+            audio_bitrate_menu.set(engine.settings["AUDIO_BITRATE"])
+            audio_bitrate_menu.grid(row=0, column=2, padx=5)
+
+            download_options_frame = customtkinter.CTkFrame(input_frame, fg_color="transparent")
+            download_options_frame.grid(row=5, column=0, columnspan=3, padx=10, pady=(0, 10), sticky="ew")
+            self.download_profile_label = customtkinter.CTkLabel(download_options_frame)
+            self.download_profile_label.grid(row=0, column=0, padx=(0, 5))
+            profiles = list(DOWNLOAD_PROFILES) + (["custom"] if engine.settings["CUSTOM_PROFILE"] else [])
+            download_profile_menu = customtkinter.CTkOptionMenu(download_options_frame, width=110, values=profiles,
+                                                                command=change_download_profile)
+            download_profile_menu.set(engine.settings["DOWNLOAD_PROFILE"])
+            download_profile_menu.grid(row=0, column=1, padx=5)
+            self.rate_limit_label = customtkinter.CTkLabel(download_options_frame)
+            self.rate_limit_label.grid(row=0, column=2, padx=(15, 5))
+            rate_limits = ["0", "1M", "5M", "10M", "50M"]
+            if engine.settings["RATE_LIMIT"] not in rate_limits:
+                rate_limits.append(engine.settings["RATE_LIMIT"])
+            rate_limit_menu = customtkinter.CTkOptionMenu(download_options_frame, width=80, values=rate_limits,
+                                                          command=change_rate_limit)
+            rate_limit_menu.set(engine.settings["RATE_LIMIT"])
+            rate_limit_menu.grid(row=0, column=3, padx=5)
+            playlist_sync_var = customtkinter.BooleanVar(value=engine.settings["PLAYLIST_SYNC_STOP"] > 0)
+            self.playlist_sync_checkbox = customtkinter.CTkCheckBox(download_options_frame, variable=playlist_sync_var,
+                                                                    command=lambda: change_playlist_sync(playlist_sync_var.get()))
+            self.playlist_sync_checkbox.grid(row=0, column=4, padx=(15, 5))
+            self.storage_button = customtkinter.CTkButton(download_options_frame, width=110, command=open_storage_dialog)
+            self.storage_button.grid(row=0, column=5, padx=(15, 5))
+
+            stream_options_frame = customtkinter.CTkFrame(input_frame, fg_color="transparent")
+            stream_options_frame.grid(row=6, column=0, columnspan=3, padx=10, pady=(0, 10), sticky="ew")
+            self.segment_minutes_label = customtkinter.CTkLabel(stream_options_frame)
+            self.segment_minutes_label.grid(row=0, column=0, padx=(0, 5))
+            segment_minutes_menu = customtkinter.CTkOptionMenu(stream_options_frame, width=80, values=["0", "10", "30", "60", "120"],
+                                                               command=change_segment_minutes)
+            segment_minutes_menu.set(str(engine.settings["STREAM_SEGMENT_MINUTES"]))
+            segment_minutes_menu.grid(row=0, column=1, padx=5)
+            self.segment_format_label = customtkinter.CTkLabel(stream_options_frame)
+            self.segment_format_label.grid(row=0, column=2, padx=(15, 5))
+            segment_format_menu = customtkinter.CTkOptionMenu(stream_options_frame, width=80, values=["mp4", "ts"],
+                                                              command=change_segment_format)
+            segment_format_menu.set(engine.settings["STREAM_SEGMENT_FORMAT"])
+            segment_format_menu.grid(row=0, column=3, padx=5)
+            self.vod_label = customtkinter.CTkLabel(stream_options_frame)
+            self.vod_label.grid(row=0, column=4, padx=(15, 5))
+            vod_menu = customtkinter.CTkOptionMenu(stream_options_frame, width=80, values=list(VOD_MODES),
+                                                   command=change_vod_transcode)
+            vod_menu.set(engine.settings["VOD_TRANSCODE"])
+            vod_menu.grid(row=0, column=5, padx=5)
+            self.capture_mode_label = customtkinter.CTkLabel(stream_options_frame)
+            self.capture_mode_label.grid(row=0, column=6, padx=(15, 5))
+            capture_mode_menu = customtkinter.CTkOptionMenu(stream_options_frame, width=100, values=list(STREAM_CAPTURE_MODES),
+                                                            command=change_capture_mode)
+            capture_mode_menu.set(engine.settings["STREAM_CAPTURE_MODE"])
+            capture_mode_menu.grid(row=0, column=7, padx=5)
+            self.segment_threads_label = customtkinter.CTkLabel(stream_options_frame)
+            self.segment_threads_label.grid(row=0, column=8, padx=(15, 5))
+            segment_threads_menu = customtkinter.CTkOptionMenu(stream_options_frame, width=60, values=["1", "2", "4", "8", "10"],
+                                                               command=change_segment_threads)
+            segment_threads_menu.set(str(engine.settings["STREAM_SEGMENT_THREADS"]))
+            segment_threads_menu.grid(row=0, column=9, padx=5)
+
+            postprocess_frame = customtkinter.CTkFrame(input_frame, fg_color="transparent")
+            postprocess_frame.grid(row=7, column=0, columnspan=3, padx=10, pady=(0, 10), sticky="ew")
+            self.postprocess_label = customtkinter.CTkLabel(postprocess_frame)
+            self.postprocess_label.grid(row=0, column=0, padx=(0, 5))
+            remux_menu = customtkinter.CTkOptionMenu(postprocess_frame, width=80, values=["auto"] + list(REMUX_CONTAINERS),
+                                                     command=change_remux_container)
+            remux_menu.set(engine.settings["REMUX_CONTAINER"] or "auto")
+            remux_menu.grid(row=0, column=1, padx=5)
+            self.postprocess_checkboxes = {}
+            for column, name in enumerate(OPTIONAL_POSTPROCESSORS, start=2):
+                step_var = customtkinter.BooleanVar(value=name in engine.settings["POSTPROCESSORS"])
+                checkbox = customtkinter.CTkCheckBox(postprocess_frame, variable=step_var,
+                                                     command=lambda name=name, var=step_var: toggle_postprocessor(name, var.get()))
+                checkbox.grid(row=0, column=column, padx=5)
+                self.postprocess_checkboxes[name] = checkbox
 
             button_frame = customtkinter.CTkFrame(self)
             button_frame.grid(row=3, column=0, padx=20, pady=(0, 6), sticky="ew")
             button_frame.grid_columnconfigure((0, 1, 2, 3), weight=1)
 
-            self.record_stream_button = customtkinter.CTkButton(button_frame, command=start_stream)
+            self.record_stream_button = customtkinter.CTkButton(button_frame, command=_start_stream_task)
             self.record_stream_button.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
 
-            self.download_video_button = customtkinter.CTkButton(button_frame, command=start_video_download_thread)
+            self.download_video_button = customtkinter.CTkButton(button_frame, command=_start_video_download_task)
             self.download_video_button.grid(row=0, column=1, padx=10, pady=10, sticky="ew")
 
             self.open_folder_button = customtkinter.CTkButton(button_frame, command=open_videos_folder)
             self.open_folder_button.grid(row=0, column=2, padx=10, pady=10, sticky="ew")
 
-            self.update_tools_button = customtkinter.CTkButton(button_frame, command=lambda: update_bin_tools(BIN_DIR, YTDLPPATH, FFMPEGPATH, append_text))
+            self.update_tools_button = customtkinter.CTkButton(button_frame, command=lambda: start_tools_bootstrap(force=True))
             self.update_tools_button.grid(row=0, column=3, padx=10, pady=10, sticky="ew")
 
             nonlocal stop_button
@@ -393,18 +753,179 @@ def main():
             self.save_log_button = customtkinter.CTkButton(button_frame, command=save_log)
             self.save_log_button.grid(row=2, column=0, columnspan=4, padx=10, pady=6, sticky="ew")
 
+            self.queue_frame = customtkinter.CTkScrollableFrame(self, height=140)
+            self.queue_frame.grid(row=4, column=0, padx=20, pady=(0, 10), sticky="nsew")
+            self.queue_frame.grid_columnconfigure(0, weight=1)
+
             nonlocal output_text
             output_text = customtkinter.CTkTextbox(self, state="disabled")
-            output_text.grid(row=4, column=0, padx=20, pady=(0, 10), sticky="nsew")
+            output_text.grid(row=5, column=0, padx=20, pady=(0, 10), sticky="nsew")
 
             self.contacts_label = customtkinter.CTkLabel(self, font=customtkinter.CTkFont(size=13), text_color="#888")
-            self.contacts_label.grid(row=5, column=0, pady=(6, 10), sticky="s")
+            self.contacts_label.grid(row=6, column=0, pady=(6, 10), sticky="s")
+
+            self.toast_label = customtkinter.CTkLabel(self, text="", corner_radius=8, fg_color="#323232",
+                                                      text_color="#FFFFFF", padx=14, pady=8)
+            self.toast_after = None
 
             # Применить язык после создания всех виджетов
             self.change_language(LANG)
 
         def show_formats(self, url):
-            show_formats(url, YTDLPPATH, append_text)
+            show_formats(url)
+
+        def show_toast(self, text):
+            # Всплывает в правом нижнем углу поверх окна и скрывается сама
+            if self.toast_after is not None:
+                self.after_cancel(self.toast_after)
+            self.toast_label.configure(text=text)
+            self.toast_label.place(relx=1.0, rely=1.0, x=-24, y=-24, anchor="se")
+            self.toast_label.lift()
+            self.toast_after = self.after(TOAST_MS, self.hide_toast)
+
+        def hide_toast(self):
+            self.toast_after = None
+            self.toast_label.place_forget()
+
+        def show_format_table(self, info):
+            t = self.translations.get(LANG, self.translations["EN"])
+            dialog = customtkinter.CTkToplevel(self)
+            dialog.title(f'{t["formats_title"]}: {info.get("title", "")}')
+            dialog.geometry("900x480")
+            dialog.grid_columnconfigure(0, weight=1)
+            dialog.grid_rowconfigure(0, weight=1)
+            table = customtkinter.CTkTextbox(dialog, font=customtkinter.CTkFont(family="Courier", size=12), wrap="none")
+            table.grid(row=0, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
+            table.insert("end", format_table(info))
+            table.configure(state="disabled")
+            format_entry = customtkinter.CTkEntry(dialog, placeholder_text="137+140")
+            format_entry.grid(row=1, column=0, padx=10, pady=(0, 10), sticky="ew")
+
+            def use_format():
+                code = format_entry.get().strip()
+                if code:
+                    quality_var.set(code)
+                dialog.destroy()
+
+            customtkinter.CTkButton(dialog, text=t["formats_use"], command=use_format).grid(row=1, column=1, padx=10, pady=(0, 10))
+
+        def show_batch_dialog(self):
+            t = self.translations.get(LANG, self.translations["EN"])
+            dialog = customtkinter.CTkToplevel(self)
+            dialog.title(t["batch_title"])
+            dialog.geometry("640x420")
+            dialog.grid_columnconfigure((0, 1), weight=1)
+            dialog.grid_rowconfigure(1, weight=1)
+            customtkinter.CTkLabel(dialog, text=t["batch_hint"]).grid(row=0, column=0, columnspan=2, padx=10, pady=(10, 5), sticky="w")
+            urls_text = customtkinter.CTkTextbox(dialog)
+            urls_text.grid(row=1, column=0, columnspan=2, padx=10, pady=5, sticky="nsew")
+            urls_text.insert("end", video_url_entry.get().strip())
+
+            def load_file():
+                path = filedialog.askopenfilename(parent=dialog, filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+                if path:
+                    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                        urls_text.insert("end", "\n" + f.read())
+
+            def start():
+                urls = parse_url_list(urls_text.get("1.0", "end"))
+                dialog.destroy()
+                start_batch(urls)
+
+            customtkinter.CTkButton(dialog, text=t["batch_load"], command=load_file).grid(row=2, column=0, padx=10, pady=10, sticky="ew")
+            customtkinter.CTkButton(dialog, text=t["batch_start"], command=start).grid(row=2, column=1, padx=10, pady=10, sticky="ew")
+            dialog.grab_set()
+
+        def show_watch_dialog(self):
+            t = self.translations.get(LANG, self.translations["EN"])
+            dialog = customtkinter.CTkToplevel(self)
+            dialog.title(t["watch_title"])
+            dialog.geometry("640x420")
+            dialog.grid_columnconfigure(0, weight=1)
+            dialog.grid_rowconfigure(1, weight=1)
+            customtkinter.CTkLabel(dialog, text=t["watch_hint"]).grid(row=0, column=0, padx=10, pady=(10, 5), sticky="w")
+            channels_text = customtkinter.CTkTextbox(dialog)
+            channels_text.grid(row=1, column=0, padx=10, pady=5, sticky="nsew")
+            channels_text.insert("end", "\n".join(engine.watcher.channels()))
+
+            def save():
+                urls = parse_url_list(channels_text.get("1.0", "end"))
+                dialog.destroy()
+                engine.set_watch_channels(urls)
+
+            customtkinter.CTkButton(dialog, text=t["watch_save"], command=save).grid(row=2, column=0, padx=10, pady=10, sticky="ew")
+            dialog.grab_set()
+
+        def show_storage_dialog(self):
+            t = self.translations.get(LANG, self.translations["EN"])
+            dialog = customtkinter.CTkToplevel(self)
+            dialog.title(t["storage_title"])
+            dialog.geometry("720x360")
+            dialog.grid_columnconfigure(1, weight=1)
+            fields = {}
+            for row, (key, label) in enumerate((("VIDEOS_DIR", "storage_videos"), ("AUDIO_DIR", "storage_audio"),
+                                                ("VODS_DIR", "storage_vods"))):
+                customtkinter.CTkLabel(dialog, text=t[label]).grid(row=row, column=0, padx=10, pady=5, sticky="w")
+                entry = customtkinter.CTkEntry(dialog)
+                entry.insert(0, engine.settings[key])
+                entry.grid(row=row, column=1, padx=10, pady=5, sticky="ew")
+                fields[key] = entry
+
+                def browse(entry=entry):
+                    path = filedialog.askdirectory(parent=dialog)
+                    if path:
+                        entry.delete(0, "end")
+                        entry.insert(0, path)
+                customtkinter.CTkButton(dialog, text=t["browse"], width=90, command=browse).grid(row=row, column=2, padx=10, pady=5)
+            customtkinter.CTkLabel(dialog, text=t["storage_template"]).grid(row=3, column=0, padx=10, pady=5, sticky="w")
+            template_box = customtkinter.CTkComboBox(dialog, values=list(OUTPUT_TEMPLATES))
+            template_box.set(engine.settings["OUTPUT_TEMPLATE"])
+            template_box.grid(row=3, column=1, columnspan=2, padx=10, pady=5, sticky="ew")
+            for row, (key, label) in enumerate((("MIN_FREE_GB", "storage_min_free"), ("VOD_MAX_AGE_DAYS", "storage_max_age"),
+                                                ("VOD_MAX_TOTAL_GB", "storage_max_total")), start=4):
+                customtkinter.CTkLabel(dialog, text=t[label]).grid(row=row, column=0, padx=10, pady=5, sticky="w")
+                entry = customtkinter.CTkEntry(dialog, width=90)
+                entry.insert(0, str(engine.settings[key]))
+                entry.grid(row=row, column=1, padx=10, pady=5, sticky="w")
+                fields[key] = entry
+
+            def save():
+                values = {"OUTPUT_TEMPLATE": template_box.get().strip() or "title"}
+                try:
+                    for key, entry in fields.items():
+                        value = entry.get().strip()
+                        values[key] = value if key.endswith("_DIR") else max(0, int(value or 0))
+                except ValueError:
+                    append_text("Размер и срок хранения - целые числа")
+                    return
+                dialog.destroy()
+                apply_storage(values)
+
+            customtkinter.CTkButton(dialog, text=t["storage_save"], command=save).grid(row=7, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
+            dialog.grab_set()
+
+        def add_job_row(self, job):
+            t = self.translations.get(LANG, self.translations["EN"])
+            row_index = len(self.job_widgets)
+            name_label = customtkinter.CTkLabel(self.queue_frame, text=f"#{job.id} [{job.kind}] {job.url}", anchor="w")
+            name_label.grid(row=row_index * 2, column=0, padx=5, pady=(2, 0), sticky="ew")
+            metrics_label = customtkinter.CTkLabel(self.queue_frame, width=260, anchor="w", text="", text_color="#888")
+            metrics_label.grid(row=row_index * 2, column=1, padx=5, pady=(2, 0), sticky="w")
+            progress_bar = customtkinter.CTkProgressBar(self.queue_frame)
+            progress_bar.set(0)
+            progress_bar.grid(row=row_index * 2 + 1, column=0, padx=5, pady=(0, 4), sticky="ew")
+            info_label = customtkinter.CTkLabel(self.queue_frame, width=260, anchor="w", text="")
+            info_label.grid(row=row_index * 2 + 1, column=1, padx=5, pady=(0, 4), sticky="w")
+            state_label = customtkinter.CTkLabel(self.queue_frame, width=100)
+            state_label.grid(row=row_index * 2, column=2, rowspan=2, padx=5, pady=2)
+            stop_job_button = customtkinter.CTkButton(self.queue_frame, width=70, text=t["stop_job"],
+                                                      fg_color="#D32F2F", hover_color="#B71C1C",
+                                                      command=lambda: stop_job(job))
+            stop_job_button.grid(row=row_index * 2, column=3, rowspan=2, padx=5, pady=2)
+            row = {"job": job, "name": name_label, "metrics": metrics_label, "progress": progress_bar, "info": info_label,
+                   "state": state_label, "stop": stop_job_button}
+            self.job_widgets.append(row)
+            return row
 
         def change_language(self, choice):
             global LANG
@@ -413,19 +934,39 @@ def main():
             self.title_label.configure(text=t["title"])
             self.appearance_label.configure(text=t["appearance"])
             self.language_label.configure(text=t["language"])
+            self.workers_label.configure(text=t["workers"])
+            self.streams_label.configure(text=t["streams"])
+            self.queue_frame.configure(label_text=t["queue"])
             self.stream_label.configure(text=t["stream_url"])
             self.video_label.configure(text=t["video_url"])
             self.cookies_label.configure(text=t["cookies_file"])
             self.browse_button.configure(text=t["browse"])
+            self.batch_button.configure(text=t["batch"])
+            self.watch_button.configure(text=t["watch"])
             self.format_label.configure(text=t["format"])
             self.show_formats_button.configure(text=t["show_formats"])
             self.audio_checkbox.configure(text=t["audio_only"])
+            self.download_profile_label.configure(text=t["download_profile"])
+            self.rate_limit_label.configure(text=t["rate_limit"])
+            self.playlist_sync_checkbox.configure(text=t["playlist_sync"])
+            self.storage_button.configure(text=t["storage"])
+            self.segment_minutes_label.configure(text=t["segment_minutes"])
+            self.segment_format_label.configure(text=t["segment_format"])
+            self.vod_label.configure(text=t["vod"])
+            self.capture_mode_label.configure(text=t["capture_mode"])
+            self.segment_threads_label.configure(text=t["segment_threads"])
+            self.postprocess_label.configure(text=t["postprocess"])
+            for name, checkbox in self.postprocess_checkboxes.items():
+                checkbox.configure(text=t["pp_" + name])
             self.record_stream_button.configure(text=t["record_stream"])
             self.download_video_button.configure(text=t["download_video"])
             self.open_folder_button.configure(text=t["open_folder"])
             self.update_tools_button.configure(text=t["update_tools"])
             stop_button.configure(text=t["stop"])
             self.save_log_button.configure(text=t["save_log"])
+            for row in self.job_widgets:
+                row["state"].configure(text=t["state_" + row["job"].state])
+                row["stop"].configure(text=t["stop_job"])
             self.contacts_label.configure(text=t["contacts"])
 
         def change_appearance_mode(self, choice):
@@ -439,9 +980,18 @@ def main():
     app = App()
     # Сохраняем настройки при закрытии
     def on_closing():
-        save_settings(quality_var, audio_var)
+        save_settings(engine.settings, quality_var, audio_var)
+        try:
+            engine.shutdown()
+        except Exception as e:
+            print(f"Ошибка при остановке задач: {e}")
         app.destroy()
     app.protocol("WM_DELETE_WINDOW", on_closing)
+    app.after(LOG_FLUSH_INTERVAL, flush_log)
+    app.after(UI_DISPATCH_INTERVAL, dispatch_ui)
+    app.after(STREAM_HEALTH_INTERVAL, refresh_job_metrics)
+    # after_idle срабатывает после первой отрисовки: окно появляется сразу, остальное запускается следом
+    app.after_idle(app.after, 0, start_background)
     app.mainloop()
 
 if __name__ == "__main__":
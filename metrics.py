@@ -0,0 +1,249 @@
+import json
+import os
+import re
+import threading
+import time
+
+# Метрики задач: CPU и память дочерних процессов, байты на диске, скорость, прогресс ffmpeg и повторы.
+# Снимаются раз в METRICS_INTERVAL секунд одним проходом по процессам для всех задач сразу
+METRICS_INTERVAL = 5
+METRICS_MAX_BYTES = 5 * 1024 * 1024
+# psutil импортируется при первой выборке, а не при запуске программы
+psutil = None
+_psutil_loaded = False
+
+# ffmpeg печатает прогресс строками key=value в stdout, обычные сообщения идут в stderr как раньше
+FFMPEG_PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+FFMPEG_PROGRESS_KEYS = ("frame", "fps", "bitrate", "total_size", "out_time_us", "out_time_ms", "out_time",
+                        "dup_frames", "drop_frames", "speed", "progress")
+FFMPEG_PROGRESS_RE = re.compile(r"^(?:stream_\d+_\d+_q|" + "|".join(FFMPEG_PROGRESS_KEYS) + r")=")
+# yt-dlp: "Got error: ... Retrying (1/10)...", "Retrying fragment 5 (2/10)"; streamlink: "...; retrying"
+RETRY_RE = re.compile(r"\bretrying\b", re.IGNORECASE)
+
+class JobMetrics:
+    def __init__(self):
+        self.cpu_percent = None
+        self.rss = None
+        self.bytes_on_disk = None
+        self.throughput = None
+        self.ffmpeg_fps = None
+        self.ffmpeg_speed = None
+        self.retries = 0
+        # Для записей стримов: когда файлы последний раз росли (time.time())
+        self.last_data = None
+        self.sampled_at = None
+        self._cpu_time = None
+        self._bytes = None
+
+    def as_dict(self):
+        return {
+            "cpu_percent": self.cpu_percent,
+            "rss_bytes": self.rss,
+            "bytes_on_disk": self.bytes_on_disk,
+            "throughput_bytes_per_second": self.throughput,
+            "ffmpeg_fps": self.ffmpeg_fps,
+            "ffmpeg_speed": self.ffmpeg_speed,
+            "retries": self.retries,
+            "last_data": self.last_data,
+        }
+
+def _number(value):
+    try:
+        return float(value.rstrip("x"))
+    except ValueError:
+        return None
+
+def handle_output_line(metrics, line):
+    # True - строка прогресса ffmpeg, в лог ее не выводим
+    if FFMPEG_PROGRESS_RE.match(line):
+        key, _, value = line.partition("=")
+        if key == "fps":
+            metrics.ffmpeg_fps = _number(value)
+        elif key == "speed":
+            metrics.ffmpeg_speed = _number(value)
+        return True
+    if RETRY_RE.search(line):
+        metrics.retries += 1
+    return False
+
+def root_pids(process):
+    # У записи стрима два процесса (streamlink и ffmpeg), у остальных задач - один
+    return [p.pid for p in getattr(process, "processes", (process,)) if p is not None]
+
+def _proc_table():
+    # pid -> (ppid, секунды CPU, RSS) по /proc; None - /proc недоступен
+    if not os.path.isdir("/proc/self"):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    page = os.sysconf("SC_PAGE_SIZE")
+    table = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{name}/statm") as f:
+                rss = int(f.read().split()[1]) * page
+        except (OSError, IndexError, ValueError):
+            continue
+        table[int(name)] = (int(fields[1]), (int(fields[11]) + int(fields[12])) / ticks, rss)
+    return table
+
+def _usage_psutil(pids):
+    cpu = 0.0
+    rss = 0
+    for pid in pids:
+        try:
+            process = psutil.Process(pid)
+            for p in [process] + process.children(recursive=True):
+                times = p.cpu_times()
+                cpu += times.user + times.system
+                rss += p.memory_info().rss
+        except psutil.Error:
+            continue
+    return cpu, rss
+
+def load_psutil():
+    global psutil, _psutil_loaded
+    if not _psutil_loaded:
+        try:
+            import psutil as module
+        except ImportError:
+            module = None
+        psutil = module
+        _psutil_loaded = True
+    return psutil
+
+def process_usage(pids_by_key):
+    # {ключ: [pid]} -> {ключ: (секунды CPU, RSS)} с учетом всех потомков; пусто - платформа без /proc и psutil
+    if load_psutil() is not None:
+        return {key: _usage_psutil(pids) for key, pids in pids_by_key.items()}
+    table = _proc_table()
+    if table is None:
+        return {}
+    children = {}
+    for pid, (ppid, _, _) in table.items():
+        children.setdefault(ppid, []).append(pid)
+    usage = {}
+    for key, pids in pids_by_key.items():
+        cpu = 0.0
+        rss = 0
+        pending = [pid for pid in pids if pid in table]
+        while pending:
+            pid = pending.pop()
+            _, pid_cpu, pid_rss = table[pid]
+            cpu += pid_cpu
+            rss += pid_rss
+            pending += children.get(pid, [])
+        usage[key] = (cpu, rss)
+    return usage
+
+def update_metrics(job, usage, now):
+    m = job.metrics
+    if usage is not None:
+        cpu, m.rss = usage
+        if m._cpu_time is not None and now > m.sampled_at:
+            m.cpu_percent = round(max(cpu - m._cpu_time, 0) / (now - m.sampled_at) * 100, 1)
+        m._cpu_time = cpu
+    size, m.last_data = job.disk_usage()
+    m.bytes_on_disk = size
+    if job.progress is not None and job.progress.speed is not None:
+        m.throughput = job.progress.speed
+    elif size is not None and m._bytes is not None and now > m.sampled_at:
+        m.throughput = max(size - m._bytes, 0) / (now - m.sampled_at)
+    m._bytes = size
+    m.sampled_at = now
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+PROMETHEUS_JOB_GAUGES = (
+    ("simpledlp_job_cpu_percent", "CPU of the job's processes, percent of one core", "cpu_percent"),
+    ("simpledlp_job_rss_bytes", "Resident memory of the job's processes", "rss"),
+    ("simpledlp_job_bytes_on_disk", "Bytes written by the job", "bytes_on_disk"),
+    ("simpledlp_job_throughput_bytes_per_second", "Download or write rate", "throughput"),
+    ("simpledlp_job_ffmpeg_fps", "ffmpeg frames per second", "ffmpeg_fps"),
+    ("simpledlp_job_ffmpeg_speed", "ffmpeg speed relative to realtime", "ffmpeg_speed"),
+    ("simpledlp_job_retries", "Retries reported by yt-dlp or streamlink", "retries"),
+)
+
+def prometheus_text(queues, jobs, now=None):
+    # Текстовый формат Prometheus 0.0.4: очереди целиком и метрики выполняющихся задач
+    now = time.time() if now is None else now
+    lines = ["# HELP simpledlp_jobs Jobs by kind and state", "# TYPE simpledlp_jobs gauge"]
+    counts = {}
+    for job in jobs:
+        counts[(job.kind, job.state)] = counts.get((job.kind, job.state), 0) + 1
+    for (kind, state), count in sorted(counts.items()):
+        lines.append(f'simpledlp_jobs{{kind="{kind}",state="{state}"}} {count}')
+    lines += ["# HELP simpledlp_queue_workers Worker threads per queue", "# TYPE simpledlp_queue_workers gauge"]
+    lines += [f'simpledlp_queue_workers{{queue="{queue.name}"}} {queue.workers}' for queue in queues]
+    lines += ["# HELP simpledlp_queue_paused 1 if the queue waits for disk space", "# TYPE simpledlp_queue_paused gauge"]
+    lines += [f'simpledlp_queue_paused{{queue="{queue.name}"}} {int(queue.paused)}' for queue in queues]
+    running = [job for job in jobs if job.state == "running"]
+    labels = {job.id: f'id="{job.id}",kind="{job.kind}",url="{_escape(job.url)}"' for job in running}
+    for name, help_text, attr in PROMETHEUS_JOB_GAUGES:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for job in running:
+            value = getattr(job.metrics, attr)
+            if value is not None:
+                lines.append(f"{name}{{{labels[job.id]}}} {value}")
+    # Для оповещений о зависших записях: сколько секунд файлы не растут
+    lines += ["# HELP simpledlp_job_seconds_since_data Seconds since a recording last wrote data",
+              "# TYPE simpledlp_job_seconds_since_data gauge"]
+    for job in running:
+        if job.metrics.last_data is not None:
+            lines.append(f"simpledlp_job_seconds_since_data{{{labels[job.id]}}} {round(now - job.metrics.last_data, 1)}")
+    return "\n".join(lines) + "\n"
+
+def metrics_record(job, now):
+    return dict(job.metrics.as_dict(), time=round(now, 3), id=job.id, kind=job.kind, url=job.url, state=job.state)
+
+class MetricsCollector:
+    # Фоновый поток: снимает метрики выполняющихся задач и, если задан путь, дописывает их в JSON lines
+    def __init__(self, jobs, log, interval=METRICS_INTERVAL, jsonl_path=None):
+        self.jobs = jobs
+        self.log = log
+        self.interval = interval
+        self.jsonl_path = jsonl_path
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                # Поток метрик не должен умирать из-за одной неудачной выборки
+                self.log(f"Ошибка сбора метрик: {e}")
+
+    def sample(self):
+        # job.process меняется из потоков очереди (перезапуск, завершение) - читаем его один раз
+        processes = [(job, job.process) for job in self.jobs() if job.state == "running"]
+        processes = [(job, process) for job, process in processes if process is not None]
+        if not processes:
+            return []
+        running = [job for job, _ in processes]
+        usage = process_usage({job.id: root_pids(process) for job, process in processes})
+        now = time.monotonic()
+        for job in running:
+            update_metrics(job, usage.get(job.id), now)
+        if self.jsonl_path:
+            self._write([metrics_record(job, time.time()) for job in running])
+        return running
+
+    def _write(self, records):
+        os.makedirs(os.path.dirname(self.jsonl_path), exist_ok=True)
+        if os.path.exists(self.jsonl_path) and os.path.getsize(self.jsonl_path) > METRICS_MAX_BYTES:
+            os.replace(self.jsonl_path, self.jsonl_path + ".1")
+        with open(self.jsonl_path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
@@ -0,0 +1,214 @@
+import os
+import json
+import collections
+
+from metrics import FFMPEG_PROGRESS_ARGS
+
+# Постобработка идет после загрузки в отдельном пуле по числу ядер: yt-dlp только качает
+# (и сливает дорожки), а ffmpeg-шаги для готового файла собираются в один проход.
+# Каждый шаг - функция, дополняющая PostProcessPlan; новые шаги добавляются в POSTPROCESSORS
+FILE_MARKER = "[simpledlp-file]"
+FILE_PRINT_TEMPLATE = "after_move:" + FILE_MARKER + " %(acodec)s %(filepath)s"
+
+AUDIO_FORMATS = {
+    # формат: (расширение, кодировщик ffmpeg, префиксы acodec, которые можно копировать, предпочтение для -f)
+    "mp3": ("mp3", "libmp3lame", ("mp3",), "bestaudio[acodec=mp3]/bestaudio"),
+    "m4a": ("m4a", "aac", ("mp4a", "aac"), "bestaudio[acodec^=mp4a]/bestaudio"),
+    "opus": ("opus", "libopus", ("opus",), "bestaudio[acodec=opus]/bestaudio"),
+    "flac": ("flac", "flac", ("flac",), "bestaudio"),
+}
+AUDIO_ENCODERS = {"mp3": "libmp3lame", "m4a": "aac", "mp4": "aac", "mkv": "aac", "opus": "libopus",
+                  "webm": "libopus", "ogg": "libopus", "flac": "flac"}
+REMUX_CONTAINERS = ("mp4", "mkv")
+# Контейнеры, в которые ffmpeg умеет встраивать обложку как attached_pic
+COVER_CONTAINERS = ("mp4", "m4a", "mp3", "flac", "mov")
+LOUDNORM_FILTER = "loudnorm=I=-16:TP=-1.5:LRA=11"
+VOD_MODES = ("off", "remux", "h264")
+VOD_SUFFIX = "_vod"
+
+def audio_format_selector(audio_format):
+    if audio_format in AUDIO_FORMATS:
+        return AUDIO_FORMATS[audio_format][3]
+    return "bestaudio"
+
+def parse_file_line(line):
+    # "[simpledlp-file] <acodec> <путь>" печатает yt-dlp после перемещения готового файла
+    if not line.startswith(FILE_MARKER):
+        return None
+    acodec, _, path = line[len(FILE_MARKER):].strip().partition(" ")
+    return path, acodec
+
+def postprocess_workers(setting):
+    return int(setting) or os.cpu_count() or 1
+
+class PostProcessPlan:
+    def __init__(self, source, acodec, settings):
+        self.source = source
+        self.acodec = (acodec or "").lower()
+        self.settings = settings
+        self.base = os.path.splitext(source)[0]
+        self.ext = os.path.splitext(source)[1][1:].lower()
+        self.inputs = [source]
+        self.maps = ["-map", "0:v?", "-map", "0:a?"]
+        self.video_codec = ["copy"]
+        self.audio_codec = ["copy"]
+        self.audio_filters = []
+        self.extra = []
+        # Файлы рядом с результатом (info.json, обложка), удаляются после успешной обработки
+        self.side_files = []
+        self.steps = []
+
+    def audio_encoder(self):
+        return AUDIO_ENCODERS.get(self.ext, "aac")
+
+    def encode_audio(self):
+        encoder = self.audio_encoder()
+        self.audio_codec = [encoder]
+        bitrate = self.settings["AUDIO_BITRATE"]
+        if bitrate and bitrate != "0" and encoder != "flac":
+            self.audio_codec += ["-b:a", bitrate.lower()]
+        elif encoder == "libmp3lame":
+            self.audio_codec += ["-q:a", "0"]
+
+    def target(self):
+        return self.base + "." + self.ext
+
+    def command(self, ffmpeg_path, output):
+        cmd = [ffmpeg_path, "-hide_banner", "-loglevel", "error", "-y"] + FFMPEG_PROGRESS_ARGS
+        for path in self.inputs:
+            cmd += ["-i", path]
+        cmd += self.maps + ["-map_metadata", "0"]
+        if self.video_codec is not None:
+            cmd += ["-c:v"] + self.video_codec
+        cmd += ["-c:a"] + self.audio_codec
+        if self.audio_filters:
+            cmd += ["-af", ",".join(self.audio_filters)]
+        return cmd + self.extra + [output]
+
+def pp_audio(plan):
+    # Только аудио: дорожка копируется, если кодек уже нужный, иначе кодируется с AUDIO_BITRATE
+    audio_format = plan.settings["AUDIO_FORMAT"]
+    plan.maps = ["-map", "0:a"]
+    plan.video_codec = None
+    if audio_format not in AUDIO_FORMATS:
+        return
+    ext, _, copy_codecs, _ = AUDIO_FORMATS[audio_format]
+    if ext != plan.ext:
+        plan.ext = ext
+        plan.steps.append("audio")
+    if not plan.acodec.startswith(copy_codecs):
+        plan.encode_audio()
+        if "audio" not in plan.steps:
+            plan.steps.append("audio")
+
+def pp_remux(plan):
+    container = plan.settings["REMUX_CONTAINER"]
+    if container in REMUX_CONTAINERS and container != plan.ext:
+        plan.ext = container
+        if container == "mp4" and plan.acodec.startswith("opus"):
+            # opus в mp4 поддерживается плохо - перекодируем звук, видео по-прежнему копируется
+            plan.encode_audio()
+        plan.steps.append("remux")
+
+def pp_metadata(plan):
+    info_path = plan.base + ".info.json"
+    if not os.path.exists(info_path):
+        return
+    try:
+        with open(info_path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return
+    fields = {
+        "title": info.get("title"),
+        "artist": info.get("artist") or info.get("uploader"),
+        "album": info.get("album"),
+        "date": info.get("upload_date"),
+        "comment": info.get("webpage_url"),
+        "description": (info.get("description") or "")[:1000],
+    }
+    tags = []
+    for key, value in fields.items():
+        if value:
+            tags += ["-metadata", f"{key}={value}"]
+    if not tags:
+        return
+    # info.json удаляется после обработки только если его данные попали в файл
+    plan.extra += tags
+    plan.side_files.append(info_path)
+    plan.steps.append("metadata")
+
+def pp_thumbnail(plan):
+    cover = plan.base + ".jpg"
+    if not os.path.exists(cover):
+        return
+    index = len(plan.inputs)
+    if plan.ext in COVER_CONTAINERS:
+        plan.inputs.append(cover)
+        plan.maps += ["-map", str(index)]
+        cover_stream = 0 if plan.video_codec is None else 1
+        if plan.video_codec is None:
+            # У аудиофайла обложка - единственный видеопоток, копируем как есть
+            plan.video_codec = ["copy"]
+        plan.extra += [f"-disposition:v:{cover_stream}", "attached_pic"]
+        if plan.ext == "mp3":
+            plan.extra += ["-id3v2_version", "3"]
+    elif plan.ext == "mkv":
+        plan.extra += ["-attach", cover, "-metadata:s:t", "mimetype=image/jpeg"]
+    else:
+        # В webm/opus/ogg обложку не вложить - она остается рядом с файлом
+        return
+    plan.side_files.append(cover)
+    plan.steps.append("thumbnail")
+
+def pp_loudnorm(plan):
+    # EBU R128 в один проход: громкость выравнивается, звук перекодируется, видео копируется
+    plan.audio_filters.append(LOUDNORM_FILTER)
+    plan.encode_audio()
+    plan.steps.append("loudnorm")
+
+POSTPROCESSORS = collections.OrderedDict([
+    ("audio", pp_audio),
+    ("remux", pp_remux),
+    ("metadata", pp_metadata),
+    ("thumbnail", pp_thumbnail),
+    ("loudnorm", pp_loudnorm),
+])
+OPTIONAL_POSTPROCESSORS = ("metadata", "thumbnail", "loudnorm")
+
+def postprocess_plan(source, acodec, settings, audio_only):
+    # None - файл уже в нужном виде
+    enabled = set(settings["POSTPROCESSORS"])
+    enabled.add("audio" if audio_only else "remux")
+    plan = PostProcessPlan(source, acodec, settings)
+    for name, step in POSTPROCESSORS.items():
+        if name in enabled:
+            step(plan)
+    if not plan.steps:
+        return None
+    return plan
+
+def ytdlp_postprocess_args(settings):
+    # yt-dlp лишь сохраняет рядом с файлом то, что нужно шагам постобработки
+    args = ['--print', FILE_PRINT_TEMPLATE, '--progress']
+    if "metadata" in settings["POSTPROCESSORS"]:
+        args += ['--write-info-json']
+    if "thumbnail" in settings["POSTPROCESSORS"]:
+        args += ['--write-thumbnail', '--convert-thumbnails', 'jpg']
+    return args
+
+def vod_cmd(ffmpeg_path, list_path, output, mode):
+    # Склейка сегментов записи в один файл: без перекодирования или в H.264
+    cmd = [ffmpeg_path, "-hide_banner", "-loglevel", "error", "-y"] + FFMPEG_PROGRESS_ARGS + [
+        "-f", "concat", "-safe", "0", "-i", list_path, "-map", "0:v?", "-map", "0:a?"]
+    if mode == "h264":
+        cmd += ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-c:a", "aac", "-b:a", "160k"]
+    else:
+        cmd += ["-c", "copy"]
+    return cmd + ["-movflags", "+faststart", output]
+
+def write_concat_list(paths, list_path):
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in paths:
+            escaped = path.replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
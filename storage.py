@@ -0,0 +1,106 @@
+import os
+import re
+import shutil
+import time
+
+# Куда складываются загрузки и записи, сколько места должно оставаться свободным
+# и какие старые сегменты записей можно удалять
+OUTPUT_TEMPLATES = {
+    "title": "%(title)s.%(ext)s",
+    "title-id": "%(title)s [%(id)s].%(ext)s",
+    "channel": "%(uploader,channel|Unknown)s/%(title)s.%(ext)s",
+    "date": "%(upload_date>%Y-%m-%d|)s %(title)s.%(ext)s",
+    "playlist": "%(playlist_title,uploader|Unknown)s/%(playlist_index|0)03d - %(title)s.%(ext)s",
+}
+STORAGE_CHECK_INTERVAL = 30
+# Очередь снова запускается, когда свободно на 20% больше порога - без дребезга на границе
+STORAGE_RESUME_FACTOR = 1.2
+# Меньше половины порога - записи стримов останавливаются штатно, пока ffmpeg не упал посреди записи
+STORAGE_CRITICAL_FACTOR = 0.5
+VOD_EXTENSIONS = (".mp4", ".ts", ".mkv")
+# Сегмент, в который недавно писали, считается текущим и не удаляется
+VOD_ACTIVE_SECONDS = 120
+# Раскладка записей: <канал>/<время начала сессии>/<канал>_<время сегмента>[_vod].<ext>.
+# Удаляются только такие файлы - свои видео пользователя в папке записей не трогаются
+SESSION_DIR_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}(_\d+)?")
+SEGMENT_NAME_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}(_vod)?(\.mp4|\.ts|\.mkv)", re.IGNORECASE)
+GIB = 1024 ** 3
+
+def output_template(preset):
+    # Имя пресета или собственный шаблон yt-dlp
+    if preset in OUTPUT_TEMPLATES:
+        return OUTPUT_TEMPLATES[preset]
+    if preset and "%(" in preset:
+        return preset
+    return OUTPUT_TEMPLATES["title"]
+
+def output_root(base_dir, configured, default_name):
+    # Пустая настройка - папка рядом с программой, как раньше
+    if configured:
+        return os.path.abspath(os.path.expanduser(configured))
+    return os.path.join(base_dir, default_name)
+
+def free_bytes(path):
+    # Папки может еще не быть - смотрим ближайшую существующую
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return shutil.disk_usage(path).free
+
+def subdirs(path):
+    try:
+        with os.scandir(path) as it:
+            return [entry for entry in it if entry.is_dir(follow_symlinks=False)]
+    except OSError:
+        return []
+
+def recording_files(root):
+    files = []
+    for channel in subdirs(root):
+        prefix = channel.name + "_"
+        for session in subdirs(channel.path):
+            if not SESSION_DIR_PATTERN.fullmatch(session.name):
+                continue
+            try:
+                with os.scandir(session.path) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                if not (entry.name.startswith(prefix)
+                        and SEGMENT_NAME_PATTERN.fullmatch(entry.name[len(prefix):])):
+                    continue
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, entry.path))
+    files.sort()
+    return files
+
+def prune_files(root, max_age_days=0, max_total_bytes=0, now=None):
+    # Удаляет самые старые сегменты и склейки записей: старше max_age_days и сверх max_total_bytes.
+    # Файлы, в которые недавно писали, не трогаются. Возвращает [(путь, размер)]
+    now = time.time() if now is None else now
+    files = recording_files(root)
+    total = sum(size for _, size, _ in files)
+    removed = []
+    for mtime, size, path in files:
+        if now - mtime < VOD_ACTIVE_SECONDS:
+            continue
+        too_old = max_age_days and now - mtime > max_age_days * 86400
+        too_big = max_total_bytes and total > max_total_bytes
+        if not (too_old or too_big):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed.append((path, size))
+    return removed